@@ -18,7 +18,7 @@ const AlertasPage = () => {
         const data = await apiFetch('/alerts/'); 
         
         // MUDANÇA 2: Corrigido para data.results (como no Dashboard)
-        setAlertas(data || []); 
+        setAlertas((data && data.results) || []); 
         
       } catch (err) {
         console.error("Erro ao buscar alertas:", err);
@@ -35,11 +35,11 @@ const AlertasPage = () => {
   if (error) return <div style={{ color: 'red' }}>{error}</div>;
 
   // MUDANÇA 3: As novas colunas da tabela (do seu design)
-  const headers = ['Descrição', 'Usuário', 'Data', 'Horário'];
+  const headers = ['Descrição', 'Usuário', 'Data', 'Horário', 'Ocorrências'];
   
   // MUDANÇA 4: As chaves do JSON do seu 'AlertaSerializer'
   // (Nós criámo-las no backend exatamente assim)
-  const dataKeys = ['descricao', 'usuario_email', 'data', 'horario'];
+  const dataKeys = ['descricao', 'usuario_email', 'data', 'horario', 'ocorrencias'];
 
   return (
     <div style={{ width: '100%' }}>
@@ -1,11 +1,13 @@
 import React, { useState, useEffect } from 'react';
-import { apiFetch } from '../utils/apiService.js';
+import { apiFetch, abrirStream } from '../utils/apiService.js';
 import styles from './DashboardPage.module.css';
 import StatCard from '../components/StatCard.jsx';
 import LineChart from '../components/LineChart.jsx';
 import ConnectionStatusTable from '../components/ConnectionStatusTable.jsx';
 import LatestAlertsList from '../components/LatestAlertsList.jsx';
 
+const INTERVALO_POLLING_MS = 30000;
+
 const DashboardPage = () => {
   // 2. Os seus 'states' (estão perfeitos, não mexa)
   const [stats, setStats] = useState(null);
@@ -22,12 +24,12 @@ const DashboardPage = () => {
 
         const [statsData, allAlertsData] = await Promise.all([
           apiFetch('/dashboard/stats/'),
-          apiFetch('/alerts/') 
+          apiFetch('/alerts/?tamanho=8') 
         ]);
         
         setStats(statsData);
 
-        const tresPrimeiros = (allAlertsData || []).slice(0, 8);
+        const tresPrimeiros = ((allAlertsData && allAlertsData.results) || []).slice(0, 8);
         
         setAlerts(tresPrimeiros); 
 
@@ -42,6 +44,40 @@ const DashboardPage = () => {
     fetchDashboardData();
   }, []);
 
+  // Novos alertas chegam por push (SSE), sem precisar consultar /alerts/ de novo.
+  // Se o backend não oferece push (rodando via WSGI), a lista é atualizada por polling.
+  useEffect(() => {
+    let stream = null;
+    let polling = null;
+    let desmontado = false;
+
+    abrirStream(['alertas'], (canal, alerta) => {
+      setAlerts((anteriores) => [alerta, ...(anteriores || [])].slice(0, 8));
+    }).then((aberto) => {
+      if (desmontado) {
+        if (aberto) aberto.close();
+        return;
+      }
+      stream = aberto;
+      if (!aberto) {
+        polling = setInterval(async () => {
+          try {
+            const dados = await apiFetch('/alerts/?tamanho=8');
+            setAlerts(((dados && dados.results) || []).slice(0, 8));
+          } catch (err) {
+            console.error("Erro ao atualizar alertas:", err);
+          }
+        }, INTERVALO_POLLING_MS);
+      }
+    });
+
+    return () => {
+      desmontado = true;
+      if (stream) stream.close();
+      clearInterval(polling);
+    };
+  }, []);
+
   
   // 4. A sua lógica de 'loading' e 'error' (perfeita)
   if (loading) {
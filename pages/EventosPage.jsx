@@ -14,9 +14,9 @@ const EventosPage = () => {
         // O seu endpoint de API que já está pronto!
         const data = await apiFetch('/events/'); 
         
-        // A API devolve os dados em 'results'.
+        // A API devolve uma página em 'results' (paginação por cursor).
         // O seu serializer já formata os dados perfeitamente.
-        setEventos(data || []); 
+        setEventos((data && data.results) || []); 
         
       } catch (err) {
         console.error("Erro ao buscar eventos:", err);
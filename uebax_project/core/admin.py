@@ -1,6 +1,7 @@
 from django.contrib import admin
-from .models import Usuario, Evento, Alerta
+from .models import Usuario, Evento, Alerta, PerfilComportamental
 
 admin.site.register(Usuario)
 admin.site.register(Evento)
-admin.site.register(Alerta)
\ No newline at end of file
+admin.site.register(Alerta)
+admin.site.register(PerfilComportamental)
@@ -0,0 +1,202 @@
+import threading
+from collections import OrderedDict, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.db.models import F, Q, Value
+from django.db.models.functions import Greatest
+from django.dispatch import receiver
+
+from .models import Alerta
+
+# Agregação de Alertas (deduplicação / supressão)
+# Um alerta é identificado por (usuário, tipo_alerta, janela). Enquanto a
+# janela de supressão aberta pela primeira ocorrência não termina, novas
+# ocorrências não criam linhas: só incrementam "ocorrencias" e avançam
+# "ultima_ocorrencia", num UPDATE com expressões F (atômico no banco).
+# Passada a janela, a próxima ocorrência abre um alerta novo.
+#
+# Para não ler o banco antes de cada escrita, o alerta aberto de cada chave
+# fica num cache LRU em memória. O banco só é consultado quando a chave
+# não está no cache (processo recém-iniciado ou chave despejada).
+# Com vários processos, cada um tem o seu cache: no pior caso dois
+# processos abrem alertas separados para a mesma janela.
+
+CONFIG_PADRAO = {
+    'JANELA_SUPRESSAO_MINUTOS': 60,   # 0 desliga a agregação
+    'TAMANHO_CACHE': 10000,           # chaves (usuário, tipo) em memória
+}
+
+
+def configuracao():
+    return {**CONFIG_PADRAO, **getattr(settings, 'UEBAX_ALERTAS', {})}
+
+
+class CacheDeRecentes:
+
+    # LRU {(usuario_id, tipo_alerta): (id do alerta aberto, primeira ocorrência)}.
+
+    def __init__(self, tamanho):
+        self.tamanho = tamanho
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obter(self, chave):
+        with self._lock:
+            valor = self._itens.get(chave)
+            if valor is not None:
+                self._itens.move_to_end(chave)
+            return valor
+
+    def guardar(self, chave, alerta_id, inicio):
+        with self._lock:
+            self._itens[chave] = (alerta_id, inicio)
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.tamanho:
+                self._itens.popitem(last=False)
+
+    def descartar(self, chave):
+        with self._lock:
+            self._itens.pop(chave, None)
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def obter_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = CacheDeRecentes(configuracao()['TAMANHO_CACHE'])
+        return _cache
+
+
+def reiniciar_cache():
+    global _cache
+    with _cache_lock:
+        _cache = None
+
+
+def _aberto_no_banco(chave, momento, janela):
+    # Alerta mais recente da chave que ainda cobre "momento" (ou None).
+    usuario_id, tipo_alerta = chave
+    consulta = Alerta.objects.filter(usuario_id=usuario_id, tipo_alerta=tipo_alerta, timestamp__lte=momento)
+    if janela is not None:
+        consulta = consulta.filter(timestamp__gt=momento - janela)
+    return consulta.order_by('-timestamp').values_list('id', 'timestamp').first()
+
+
+def gravar(alertas, janela_minutos=None, sem_expirar=False):
+    # Grava alertas (ainda não salvos) agregando-os aos alertas abertos.
+    # janela_minutos=None usa JANELA_SUPRESSAO_MINUTOS; sem_expirar=True
+    # mantém um único alerta por chave, para sempre. Retorna só os alertas
+    # criados (as ocorrências agregadas não geram linhas novas).
+    if janela_minutos is None:
+        janela_minutos = configuracao()['JANELA_SUPRESSAO_MINUTOS']
+    janela = None if sem_expirar else timedelta(minutes=janela_minutos)
+    if janela is not None and not janela:
+        for alerta in alertas:
+            alerta.ultima_ocorrencia = alerta.timestamp
+        return Alerta.objects.bulk_create(alertas)
+
+    por_chave = defaultdict(list)
+    for alerta in alertas:
+        por_chave[(alerta.usuario_id, alerta.tipo_alerta)].append(alerta)
+
+    cache = obter_cache()
+    novos = []
+    incrementos = {}  # id existente -> [chave, ocorrências, primeira, última]
+
+    for chave, grupo in por_chave.items():
+        grupo.sort(key=lambda alerta: alerta.timestamp)
+        aberto = cache.obter(chave)
+        if aberto is None:
+            aberto = _aberto_no_banco(chave, grupo[0].timestamp, janela)
+            if aberto is not None:
+                cache.guardar(chave, *aberto)
+
+        for alerta in grupo:
+            if aberto is not None and (janela is None or alerta.timestamp < aberto[1] + janela):
+                alvo = aberto[0]
+                if isinstance(alvo, Alerta):
+                    alvo.ocorrencias += 1
+                    alvo.ultima_ocorrencia = max(alvo.ultima_ocorrencia, alerta.timestamp)
+                else:
+                    incremento = incrementos.setdefault(alvo, [chave, 0, alerta.timestamp, alerta.timestamp])
+                    incremento[1] += 1
+                    incremento[3] = alerta.timestamp
+            else:
+                alerta.ocorrencias = 1
+                alerta.ultima_ocorrencia = alerta.timestamp
+                novos.append(alerta)
+                aberto = (alerta, alerta.timestamp)
+
+    with transaction.atomic():
+        for alerta_id, (chave, quantidade, primeira, ultima) in incrementos.items():
+            atualizados = Alerta.objects.filter(pk=alerta_id).update(
+                ocorrencias=F('ocorrencias') + quantidade,
+                ultima_ocorrencia=Greatest(F('ultima_ocorrencia'), Value(ultima)),
+            )
+            if not atualizados:
+                # O alerta do cache foi apagado: começa um novo.
+                cache.descartar(chave)
+                alerta = Alerta(
+                    usuario_id=chave[0], tipo_alerta=chave[1], timestamp=primeira,
+                    ocorrencias=quantidade, ultima_ocorrencia=ultima,
+                    descricao_detalhada=por_chave[chave][0].descricao_detalhada,
+                )
+                novos.append(alerta)
+        criados = Alerta.objects.bulk_create(novos)
+
+    for alerta in criados:
+        chave = (alerta.usuario_id, alerta.tipo_alerta)
+        atual = cache.obter(chave)
+        if alerta.pk is not None and (atual is None or atual[1] <= alerta.timestamp):
+            cache.guardar(chave, alerta.pk, alerta.timestamp)
+    return criados
+
+
+def nao_cobertos(alertas):
+    # Descarta os alertas (ainda não salvos) cujo momento já está dentro de
+    # um alerta gravado da mesma chave, entre timestamp e ultima_ocorrencia.
+    # Usado pelo backtest para que regravar um intervalo não conte de novo
+    # as ocorrências que o motor (ou uma execução anterior) já registrou.
+    # A folga de 1 ms cobre os instantes que o backtest trunca em milissegundos.
+    if not alertas:
+        return []
+    folga = timedelta(milliseconds=1)
+    inicio = min(alerta.timestamp for alerta in alertas) - folga
+    fim = max(alerta.timestamp for alerta in alertas) + folga
+    consulta = Alerta.objects.filter(
+        usuario_id__in={alerta.usuario_id for alerta in alertas},
+        tipo_alerta__in={alerta.tipo_alerta for alerta in alertas},
+        timestamp__lte=fim,
+    ).filter(
+        Q(ultima_ocorrencia__gte=inicio) | Q(ultima_ocorrencia__isnull=True, timestamp__gte=inicio)
+    )
+    intervalos = defaultdict(list)
+    for usuario_id, tipo_alerta, primeira, ultima in consulta.values_list(
+        'usuario_id', 'tipo_alerta', 'timestamp', 'ultima_ocorrencia'
+    ):
+        intervalos[(usuario_id, tipo_alerta)].append((primeira - folga, (ultima or primeira) + folga))
+
+    return [
+        alerta for alerta in alertas
+        if not any(
+            primeira <= alerta.timestamp <= ultima
+            for primeira, ultima in intervalos.get((alerta.usuario_id, alerta.tipo_alerta), ())
+        )
+    ]
+
+
+@receiver(setting_changed)
+def _recarregar_configuracao(sender, setting, **kwargs):
+    if setting == 'UEBAX_ALERTAS':
+        reiniciar_cache()
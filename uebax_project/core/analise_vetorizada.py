@@ -0,0 +1,324 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Usuario, Evento
+from . import regras
+
+# Análise Vetorizada do Histórico (backtest)
+# Reaplica as regras do motor sobre um intervalo de eventos já gravados,
+# em blocos colunares NumPy (usuário, tipo, instante), sem passar evento a
+# evento pelo motor. O estado que atravessa os blocos é pequeno e de
+# tamanho fixo: o perfil comportamental de cada usuário em arrays densos
+# e, para as regras de janela, só a "cauda" de eventos ainda na janela.
+# A memória fica limitada pelo tamanho do bloco, não pelo intervalo.
+#
+# Equivalências com o motor (core/regras.py):
+#   - horario: mesma regra; com APRENDER usa o perfil acumulado até o evento
+#   - limite_janela: contagem em (t - janela, t] via searchsorted, como no
+#     modo síncrono (um alerta por evento que atinge o LIMITE)
+#   - baseline: probabilidades de hora/tipo e z-score do intervalo; a média
+#     e a variância vêm de somas acumuladas (mesmo resultado do Welford)
+# O perfil do backtest aprende com todos os eventos do intervalo e começa
+# vazio; os PerfilComportamental gravados não são lidos nem alterados.
+# Regras de outros tipos (classes customizadas) são ignoradas. Os alertas
+# saem por regra, para serem gravados pela mesma agregação do motor
+# (core/alertas.py), que junta as repetições na janela de supressão.
+
+TIPOS_EVENTO = list(Evento.TipoEvento.values)
+
+# Instantes em milissegundos desde a época (inteiros, para searchsorted exato)
+_MS_POR_HORA = 3600 * 1000
+_EPOCA = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise ImproperlyConfigured('A análise vetorizada requer o pacote "numpy" (pip install numpy).')
+    return numpy
+
+
+class Bloco:
+
+    # Colunas de um bloco de eventos, em ordem (timestamp, id).
+
+    def __init__(self, np, linhas, indice_usuario):
+        self.ids = np.fromiter((linha[0] for linha in linhas), dtype=np.int64, count=len(linhas))
+        self.usuarios = indice_usuario(np.fromiter((linha[1] for linha in linhas), dtype=np.int64, count=len(linhas)))
+        codigos = {tipo: codigo for codigo, tipo in enumerate(TIPOS_EVENTO)}
+        self.tipos = np.fromiter((codigos[linha[2]] for linha in linhas), dtype=np.int64, count=len(linhas))
+        self.instantes = np.fromiter(
+            ((linha[3] - _EPOCA) // timedelta(milliseconds=1) for linha in linhas), dtype=np.int64, count=len(linhas)
+        )
+        self.horas = _horas_locais(np, self.instantes)
+
+    def __len__(self):
+        return len(self.ids)
+
+
+def _horas_locais(np, instantes):
+    # Hora local de cada instante. O deslocamento do fuso só é calculado
+    # uma vez por hora UTC distinta do bloco.
+    horas_utc, inversa = np.unique(instantes // _MS_POR_HORA, return_inverse=True)
+    deslocamentos = np.array([
+        timezone.localtime(datetime.fromtimestamp(int(hora) * 3600, dt_timezone.utc)).utcoffset() // timedelta(milliseconds=1)
+        for hora in horas_utc
+    ], dtype=np.int64)
+    return ((instantes + deslocamentos[inversa]) // _MS_POR_HORA) % 24
+
+
+def carregar_blocos(inicio, fim, tamanho_bloco):
+    # Gera Blocos de até tamanho_bloco eventos do intervalo [inicio, fim),
+    # paginando por (timestamp, id) para não usar OFFSET. Os usuários são
+    # lidos uma vez, no início: eventos de quem foi criado durante a
+    # análise ficam de fora (os perfis têm tamanho fixo).
+    np = _numpy()
+    ids_usuarios = np.array(sorted(Usuario.objects.values_list('id', flat=True)), dtype=np.int64)
+    conhecidos = set(ids_usuarios.tolist())
+
+    def indice_usuario(ids):
+        return np.searchsorted(ids_usuarios, ids)
+
+    consulta = Evento.objects.filter(timestamp__gte=inicio, timestamp__lt=fim).order_by('timestamp', 'id')
+    ultimo = None
+    while True:
+        pagina = consulta
+        if ultimo is not None:
+            pagina = pagina.filter(Q(timestamp__gt=ultimo[0]) | Q(timestamp=ultimo[0], id__gt=ultimo[1]))
+        linhas = list(pagina.values_list('id', 'usuario_id', 'tipo_evento', 'timestamp')[:tamanho_bloco])
+        if not linhas:
+            return
+        ultimo = linhas[-1][3], linhas[-1][0]
+        linhas = [linha for linha in linhas if linha[1] in conhecidos]
+        if linhas:
+            yield ids_usuarios, Bloco(np, linhas, indice_usuario)
+
+
+def _posicao_no_grupo(np, chave):
+    # Para cada elemento, quantos elementos anteriores (na ordem do array)
+    # têm a mesma chave. Também retorna a permutação que agrupa por chave.
+    ordem = np.argsort(chave, kind='stable')
+    ordenada = chave[ordem]
+    indices = np.arange(len(chave))
+    inicio_do_grupo = np.r_[True, ordenada[1:] != ordenada[:-1]]
+    primeiro = np.maximum.accumulate(np.where(inicio_do_grupo, indices, 0))
+    posicao = np.empty_like(indices)
+    posicao[ordem] = indices - primeiro
+    return posicao, ordem, primeiro
+
+
+class Perfis:
+
+    # PerfilComportamental de todos os usuários em arrays densos.
+
+    def __init__(self, np, quantidade_usuarios):
+        self.np = np
+        self.total = np.zeros(quantidade_usuarios, dtype=np.int64)
+        self.histograma = np.zeros((quantidade_usuarios, 24), dtype=np.int64)
+        self.frequencia = np.zeros((quantidade_usuarios, len(TIPOS_EVENTO)), dtype=np.int64)
+        self.intervalos = np.zeros(quantidade_usuarios, dtype=np.int64)
+        self.soma = np.zeros(quantidade_usuarios)
+        self.soma_quadrados = np.zeros(quantidade_usuarios)
+        self.ultimo = np.full(quantidade_usuarios, -1, dtype=np.int64)
+
+    def anteriores(self, bloco):
+        # Estado do perfil imediatamente antes de cada evento do bloco.
+        np = self.np
+        u, h, t = bloco.usuarios, bloco.horas, bloco.tipos
+        quantidade_tipos = len(TIPOS_EVENTO)
+
+        posicao, ordem, primeiro = _posicao_no_grupo(np, u)
+        total = self.total[u] + posicao
+        na_hora = self.histograma[u, h] + _posicao_no_grupo(np, u * 24 + h)[0]
+        do_tipo = self.frequencia[u, t] + _posicao_no_grupo(np, u * quantidade_tipos + t)[0]
+
+        # Intervalo de cada evento até o anterior do mesmo usuário
+        instantes = bloco.instantes[ordem]
+        anterior = np.r_[-1, instantes[:-1]]
+        primeiro_do_usuario = np.arange(len(ordem)) == primeiro
+        anterior[primeiro_do_usuario] = self.ultimo[u[ordem][primeiro_do_usuario]]
+        valido = anterior >= 0
+        x = np.where(valido, np.log1p(np.maximum(instantes - anterior, 0) / 1000.0), 0.0)
+
+        # Somas acumuladas exclusivas dentro de cada usuário
+        def acumulado(valores):
+            exclusivo = np.cumsum(valores) - valores
+            return exclusivo - exclusivo[primeiro]
+
+        n = self.intervalos[u[ordem]] + acumulado(valido.astype(np.int64))
+        soma = self.soma[u[ordem]] + acumulado(x)
+        soma_quadrados = self.soma_quadrados[u[ordem]] + acumulado(x * x)
+
+        z = np.zeros(len(ordem))
+        com_desvio = valido & (n >= 2)
+        media = np.divide(soma, n, out=np.zeros_like(soma), where=n > 0)
+        variancia = np.divide(soma_quadrados - soma * media, n - 1, out=np.zeros_like(soma), where=com_desvio)
+        desvio = np.sqrt(np.maximum(variancia, 0.0))
+        np.divide(media - x, desvio, out=z, where=com_desvio & (desvio > 0))
+
+        # Volta para a ordem cronológica do bloco
+        z_cronologico = np.empty_like(z)
+        z_cronologico[ordem] = z
+        self._pendente = (ordem, valido, x)
+        return total, na_hora, do_tipo, z_cronologico
+
+    def incorporar(self, bloco):
+        # Acrescenta o bloco ao perfil (chamar depois de anteriores()).
+        np = self.np
+        u, h, t = bloco.usuarios, bloco.horas, bloco.tipos
+        quantidade = len(self.total)
+        quantidade_tipos = len(TIPOS_EVENTO)
+        ordem, valido, x = self._pendente
+
+        self.total += np.bincount(u, minlength=quantidade)
+        self.histograma += np.bincount(u * 24 + h, minlength=quantidade * 24).reshape(quantidade, 24)
+        self.frequencia += np.bincount(
+            u * quantidade_tipos + t, minlength=quantidade * quantidade_tipos
+        ).reshape(quantidade, quantidade_tipos)
+        u_ordenado = u[ordem]
+        self.intervalos += np.bincount(u_ordenado, weights=valido, minlength=quantidade).astype(np.int64)
+        self.soma += np.bincount(u_ordenado, weights=x, minlength=quantidade)
+        self.soma_quadrados += np.bincount(u_ordenado, weights=x * x, minlength=quantidade)
+        np.maximum.at(self.ultimo, u, bloco.instantes)
+
+
+class Janela:
+
+    # Estado de uma regra limite_janela entre blocos: a cauda de eventos
+    # que ainda cabem na janela.
+
+    def __init__(self, np, regra):
+        self.np = np
+        self.regra = regra
+        self.janela = regra.janela_minutos * 60 * 1000
+        self.codigos = [TIPOS_EVENTO.index(tipo) for tipo in regra.tipos_evento]
+        self.cauda_usuarios = np.zeros(0, dtype=np.int64)
+        self.cauda_instantes = np.zeros(0, dtype=np.int64)
+
+    def contar(self, bloco):
+        # Retorna (índices no bloco, contagem na janela) dos eventos da regra.
+        np = self.np
+        selecionados = np.flatnonzero(np.isin(bloco.tipos, self.codigos))
+        quantidade_cauda = len(self.cauda_usuarios)
+        usuarios = np.r_[self.cauda_usuarios, bloco.usuarios[selecionados]]
+        instantes = np.r_[self.cauda_instantes, bloco.instantes[selecionados]]
+        if not len(instantes):
+            return selecionados, np.zeros(0, dtype=np.int64)
+
+        # Chave composta usuário/instante: ordenar por ela é ordenar por
+        # (usuário, instante), e a janela vira um searchsorted.
+        base = instantes.min()
+        passo = int(instantes.max() - base) + self.janela + 1
+        if (int(usuarios.max()) + 1) * passo >= 2 ** 62:
+            raise ValueError('Bloco abrange tempo demais para a chave composta; reduza --tamanho-bloco.')
+        chave = usuarios * passo + (instantes - base)
+        ordem = np.argsort(chave, kind='stable')
+        ordenada = chave[ordem]
+        esquerda = np.searchsorted(ordenada, ordenada - self.janela, side='right')
+        contagem = np.empty(len(chave), dtype=np.int64)
+        contagem[ordem] = np.arange(len(chave)) - esquerda + 1
+
+        # Nova cauda: o que ainda está na janela do último instante do bloco
+        fim = bloco.instantes[-1]
+        na_janela = instantes > fim - self.janela
+        self.cauda_usuarios = usuarios[na_janela]
+        self.cauda_instantes = instantes[na_janela]
+        return selecionados, contagem[quantidade_cauda:]
+
+
+def analisar(blocos, motor=None):
+    # Aplica as regras do motor aos blocos. Para cada bloco gera
+    # ([(regra, alertas não salvos)], {nome da regra: quantidade}).
+    np = _numpy()
+    motor = motor or regras.obter_motor()
+    perfis = janelas = None
+
+    for ids_usuarios, bloco in blocos:
+        if perfis is None:
+            perfis = Perfis(np, len(ids_usuarios))
+            janelas = {
+                regra.nome: Janela(np, regra)
+                for regra in motor.regras if isinstance(regra, regras.RegraLimiteJanela)
+            }
+
+        total, na_hora, do_tipo, z = perfis.anteriores(bloco)
+        alertas_por_regra = []
+        contagem = {}
+        for regra in motor.regras:
+            mascara = np.isin(bloco.tipos, [TIPOS_EVENTO.index(tipo) for tipo in regra.tipos_evento])
+
+            if isinstance(regra, regras.RegraHorario):
+                gerados = _horario(np, regra, bloco, mascara, total, na_hora)
+            elif isinstance(regra, regras.RegraLimiteJanela):
+                gerados = _limite_janela(np, janelas[regra.nome], bloco)
+            elif isinstance(regra, regras.RegraBaseline):
+                gerados = _baseline(np, regra, bloco, mascara, total, na_hora, do_tipo, z)
+            else:
+                continue
+
+            alertas_por_regra.append((regra, [
+                regra._alerta(int(ids_usuarios[bloco.usuarios[i]]), descricao, _momento(bloco.instantes[i]))
+                for i, descricao in gerados
+            ]))
+            contagem[regra.nome] = len(gerados)
+
+        perfis.incorporar(bloco)
+        yield alertas_por_regra, contagem
+
+
+def _momento(instante):
+    return _EPOCA + timedelta(milliseconds=int(instante))
+
+
+def _horario(np, regra, bloco, mascara, total, na_hora):
+    hora = bloco.horas
+    fora_fixo = (hora < regra.hora_inicio) | (hora > regra.hora_fim)
+    if regra.aprender:
+        maduro = total >= regra.minimo_eventos
+        fora_aprendido = (na_hora + 1) / (total + 24) < regra.limiar_hora
+        fora = np.where(maduro, fora_aprendido, fora_fixo)
+    else:
+        maduro = np.zeros(len(bloco), dtype=bool)
+        fora = fora_fixo
+
+    return [
+        (i, f"Usuário fez login fora do seu horário habitual (às {hora[i]}h)." if maduro[i]
+            else f"Usuário fez login fora do horário comercial (às {hora[i]}h).")
+        for i in np.flatnonzero(mascara & fora)
+    ]
+
+
+def _limite_janela(np, janela, bloco):
+    regra = janela.regra
+    selecionados, contagem = janela.contar(bloco)
+    return [
+        (selecionados[k], regra._descricao(int(contagem[k])))
+        for k in np.flatnonzero(contagem >= regra.limite)
+    ]
+
+
+def _baseline(np, regra, bloco, mascara, total, na_hora, do_tipo, z):
+    p = regra.parametros
+    maduro = mascara & (total >= p['minimo_eventos'])
+    p_hora = (na_hora + 1) / (total + 24)
+    p_tipo = (do_tipo + 1) / (total + len(TIPOS_EVENTO))
+    hora_incomum = p_hora < p['limiar_hora']
+    tipo_incomum = p_tipo < p['limiar_tipo']
+    intervalo_curto = z > p['limiar_z']
+
+    gerados = []
+    for i in np.flatnonzero(maduro & (hora_incomum | tipo_incomum | intervalo_curto)):
+        tipo_evento = TIPOS_EVENTO[bloco.tipos[i]]
+        motivos = []
+        if hora_incomum[i]:
+            motivos.append(f"horário incomum para o usuário ({bloco.horas[i]}h, p={p_hora[i]:.3f})")
+        if tipo_incomum[i]:
+            motivos.append(f"tipo de evento incomum ({tipo_evento}, p={p_tipo[i]:.3f})")
+        if intervalo_curto[i]:
+            motivos.append(f"intervalo entre eventos muito curto (z={z[i]:.1f})")
+        gerados.append((i, f"Evento {tipo_evento} foge da linha de base do usuário: {'; '.join(motivos)}."))
+    return gerados
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "core"
+
+    def ready(self):
+        # Registra o receiver de connection_created (PRAGMAs do SQLite).
+        from . import banco  # noqa: F401
@@ -0,0 +1,132 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import Usuario
+
+# Autenticação
+# Verificação de senha fora do event loop: o hasher (PBKDF2) é CPU puro e
+# lento de propósito, então roda num pool de threads limitado. Assim um
+# processo ASGI atende muitos logins simultâneos sem uma thread por request
+# e sem deixar o hasher monopolizar a CPU.
+#
+# Usuário dos requests autenticados por JWT: em vez de um SELECT por
+# request (o dashboard faz polling), o Usuario fica no cache por
+# TTL_USUARIO segundos. Salvar ou apagar o usuário (is_active, troca de
+# senha, ...) apaga a entrada. O token carrega a "versão da senha"
+# (CLAIM_VERSAO_SENHA); depois de uma troca de senha, tokens emitidos antes
+# dela deixam de valer. Alterações via QuerySet.update() não disparam
+# post_save: valem só depois do TTL.
+
+CONFIG_PADRAO = {
+    'THREADS_SENHA': 4,
+    'TTL_USUARIO': 60,        # segundos; 0 desliga o cache de usuários
+    'CACHE': 'default',
+}
+
+CLAIM_VERSAO_SENHA = 'versao_senha'
+
+
+def configuracao():
+    return {**CONFIG_PADRAO, **getattr(settings, 'UEBAX_AUTENTICACAO', {})}
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def obter_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=configuracao()['THREADS_SENHA'],
+                thread_name_prefix='uebax-senha',
+            )
+        return _executor
+
+
+def _verificar(usuario, senha):
+    if usuario is None:
+        # Mesmo custo de um usuário existente: não revela, pelo tempo de
+        # resposta, quais e-mails estão cadastrados (como o ModelBackend).
+        Usuario().set_password(senha)
+        return False
+    return usuario.check_password(senha)
+
+
+async def verificar_senha(usuario, senha):
+    # Retorna True se a senha confere. usuario pode ser None.
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(obter_executor(), _verificar, usuario, senha)
+
+
+def versao_senha(usuario):
+    # Muda quando a senha muda (HMAC do hash, como a sessão do Django).
+    return usuario.get_session_auth_hash()[:16]
+
+
+def _chave(usuario_id):
+    return f'uebax:usuario:{usuario_id}'
+
+
+def _conferir(usuario, token):
+    # Retorna o usuário se ele ainda pode usar este token.
+    if usuario is None or not usuario.is_active:
+        return None
+    versao = token.get(CLAIM_VERSAO_SENHA)
+    if versao is not None and versao != versao_senha(usuario):
+        return None
+    return usuario
+
+
+def usuario_do_token(token):
+    usuario_id = token.get(api_settings.USER_ID_CLAIM)
+    config = configuracao()
+    cache = caches[config['CACHE']]
+    usuario = cache.get(_chave(usuario_id)) if config['TTL_USUARIO'] else None
+    if usuario is None:
+        usuario = Usuario.objects.filter(**{api_settings.USER_ID_FIELD: usuario_id}).first()
+        if usuario is not None and config['TTL_USUARIO']:
+            cache.set(_chave(usuario_id), usuario, config['TTL_USUARIO'])
+    return _conferir(usuario, token)
+
+
+async def ausuario_do_token(token):
+    usuario_id = token.get(api_settings.USER_ID_CLAIM)
+    config = configuracao()
+    cache = caches[config['CACHE']]
+    usuario = await cache.aget(_chave(usuario_id)) if config['TTL_USUARIO'] else None
+    if usuario is None:
+        usuario = await Usuario.objects.filter(**{api_settings.USER_ID_FIELD: usuario_id}).afirst()
+        if usuario is not None and config['TTL_USUARIO']:
+            await cache.aset(_chave(usuario_id), usuario, config['TTL_USUARIO'])
+    return _conferir(usuario, token)
+
+
+class JWTEmCache(JWTAuthentication):
+
+    # JWTAuthentication do simple-jwt com o usuário vindo do cache.
+
+    def get_user(self, validated_token):
+        if api_settings.USER_ID_CLAIM not in validated_token:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+        usuario = usuario_do_token(validated_token)
+        if usuario is None:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        return usuario
+
+
+@receiver(post_save, sender=Usuario)
+@receiver(post_delete, sender=Usuario)
+def _invalidar_usuario(sender, instance, **kwargs):
+    caches[configuracao()['CACHE']].delete(_chave(instance.pk))
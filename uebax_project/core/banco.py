@@ -0,0 +1,105 @@
+import random
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+# Banco de Dados: PRAGMAs do SQLite e Réplicas de Leitura
+# A configuração vem do ambiente (uebax_project/bancos.py). Aqui ficam as
+# partes que rodam com o Django no ar:
+#
+#   - Cada conexão SQLite nova recebe journal_mode=WAL (leitores não
+#     bloqueiam o escritor), synchronous=NORMAL (seguro com WAL, sem fsync
+#     por commit) e busy_timeout (espera a trava em vez de falhar).
+#   - RoteadorDeReplicas manda para as réplicas só as leituras feitas
+#     dentro de em_replica() (ex.: dashboard e listagens, via
+#     LeituraEmReplicaMixin). O resto, inclusive o motor de regras logo
+#     depois de gravar um evento, continua lendo do primário e enxerga as
+#     próprias escritas.
+#
+# Réplicas são os aliases de DATABASES com TEST['MIRROR'] == 'default'.
+
+CONFIG_PADRAO = {
+    'JOURNAL_MODE': 'WAL',
+    'SYNCHRONOUS': 'NORMAL',
+    'BUSY_TIMEOUT_MS': 5000,
+}
+
+
+def configuracao():
+    return {**CONFIG_PADRAO, **getattr(settings, 'UEBAX_SQLITE', {})}
+
+
+@receiver(connection_created)
+def _configurar_sqlite(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    config = configuracao()
+    with connection.cursor() as cursor:
+        # busy_timeout primeiro: trocar o journal_mode também disputa a trava
+        cursor.execute(f"PRAGMA busy_timeout = {int(config['BUSY_TIMEOUT_MS'])}")
+        if config['JOURNAL_MODE']:
+            cursor.execute(f"PRAGMA journal_mode = {config['JOURNAL_MODE']}")
+        if config['SYNCHRONOUS']:
+            cursor.execute(f"PRAGMA synchronous = {config['SYNCHRONOUS']}")
+
+
+def replicas():
+    return [
+        alias for alias, banco in settings.DATABASES.items()
+        if banco.get('TEST', {}).get('MIRROR') == 'default'
+    ]
+
+
+class _Estado(threading.local):
+    replica = False
+
+
+_estado = _Estado()
+
+
+@contextmanager
+def em_replica():
+    # Leituras dentro do bloco podem ir para uma réplica.
+    anterior = _estado.replica
+    _estado.replica = True
+    try:
+        yield
+    finally:
+        _estado.replica = anterior
+
+
+class RoteadorDeReplicas:
+
+    def db_for_read(self, model, **hints):
+        if not _estado.replica or connections['default'].in_atomic_block:
+            return None
+        disponiveis = replicas()
+        return random.choice(disponiveis) if disponiveis else None
+
+    def db_for_write(self, model, **hints):
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Réplicas têm os mesmos dados do primário.
+        bancos = {'default', *replicas()}
+        if obj1._state.db in bancos and obj2._state.db in bancos:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return False if db in replicas() else None
+
+
+class LeituraEmReplicaMixin:
+
+    # Para views só de leitura: o request inteiro roda em em_replica().
+    # Querysets avaliados depois do dispatch (respostas em streaming) devem
+    # ser fixados com .using(queryset.db) ainda dentro da view.
+
+    def dispatch(self, request, *args, **kwargs):
+        with em_replica():
+            return super().dispatch(request, *args, **kwargs)
@@ -0,0 +1,142 @@
+import math
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Evento, PerfilComportamental
+
+# Linha de Base Comportamental (UEBA)
+# Cada usuário tem um PerfilComportamental com estatísticas compactas que
+# são atualizadas em O(1) por evento, sem nunca reler o histórico:
+#   - histograma de horas (24 contadores)
+#   - frequência por tipo de evento
+#   - média e variância de log(1 + segundos desde o evento anterior),
+#     pelo algoritmo de Welford (numericamente estável, uma passada)
+#
+# pontuar() compara um evento com o perfil *antes* de atualizá-lo.
+
+PARAMETROS_PADRAO = {
+    'minimo_eventos': 50,   # perfil "maduro" a partir daqui
+    'limiar_hora': 0.02,    # probabilidade mínima da hora do evento
+    'limiar_tipo': 0.01,    # probabilidade mínima do tipo de evento
+    'limiar_z': 4.0,        # desvios-padrão abaixo do intervalo típico
+}
+
+CAMPOS_PERFIL = [
+    'total_eventos', 'histograma_horas', 'frequencia_tipos', 'ultimo_evento_em',
+    'intervalos', 'intervalo_media', 'intervalo_m2', 'atualizado_em',
+]
+
+
+def maduro(perfil, minimo_eventos):
+    return perfil is not None and perfil.total_eventos >= minimo_eventos
+
+
+def probabilidade_hora(perfil, hora):
+    # Estimativa com suavização de Laplace (nenhuma hora tem probabilidade 0)
+    return (perfil.histograma_horas[hora] + 1) / (perfil.total_eventos + 24)
+
+
+def probabilidade_tipo(perfil, tipo_evento):
+    quantidade_tipos = len(Evento.TipoEvento.values)
+    return (perfil.frequencia_tipos.get(tipo_evento, 0) + 1) / (perfil.total_eventos + quantidade_tipos)
+
+
+def _log_intervalo(perfil, momento):
+    segundos = max((momento - perfil.ultimo_evento_em).total_seconds(), 0.0)
+    return math.log1p(segundos)
+
+
+def desvio_padrao_intervalo(perfil):
+    if perfil.intervalos < 2:
+        return 0.0
+    return math.sqrt(perfil.intervalo_m2 / (perfil.intervalos - 1))
+
+
+def pontuar(perfil, evento, minimo_eventos, limiar_hora, limiar_tipo, limiar_z):
+    # Retorna a lista de motivos (texto) pelos quais o evento foge do
+    # perfil. Lista vazia = evento normal (ou perfil ainda imaturo).
+    if not maduro(perfil, minimo_eventos):
+        return []
+
+    motivos = []
+    hora = timezone.localtime(evento.timestamp).hour
+    p_hora = probabilidade_hora(perfil, hora)
+    if p_hora < limiar_hora:
+        motivos.append(f"horário incomum para o usuário ({hora}h, p={p_hora:.3f})")
+
+    p_tipo = probabilidade_tipo(perfil, evento.tipo_evento)
+    if p_tipo < limiar_tipo:
+        motivos.append(f"tipo de evento incomum ({evento.tipo_evento}, p={p_tipo:.3f})")
+
+    desvio = desvio_padrao_intervalo(perfil)
+    # Eventos fora de ordem (ex.: lote atrasado) não têm intervalo confiável
+    if desvio > 0 and perfil.ultimo_evento_em is not None and evento.timestamp >= perfil.ultimo_evento_em:
+        z = (perfil.intervalo_media - _log_intervalo(perfil, evento.timestamp)) / desvio
+        if z > limiar_z:
+            motivos.append(f"intervalo entre eventos muito curto (z={z:.1f})")
+
+    return motivos
+
+
+def atualizar(perfil, evento):
+    # Incorpora o evento ao perfil em O(1).
+    hora = timezone.localtime(evento.timestamp).hour
+    perfil.total_eventos += 1
+    perfil.histograma_horas[hora] += 1
+    perfil.frequencia_tipos[evento.tipo_evento] = perfil.frequencia_tipos.get(evento.tipo_evento, 0) + 1
+
+    if perfil.ultimo_evento_em is not None and evento.timestamp >= perfil.ultimo_evento_em:
+        # Welford
+        x = _log_intervalo(perfil, evento.timestamp)
+        perfil.intervalos += 1
+        delta = x - perfil.intervalo_media
+        perfil.intervalo_media += delta / perfil.intervalos
+        perfil.intervalo_m2 += delta * (x - perfil.intervalo_media)
+
+    if perfil.ultimo_evento_em is None or evento.timestamp > perfil.ultimo_evento_em:
+        perfil.ultimo_evento_em = evento.timestamp
+
+
+def carregar_perfis(usuario_ids, bloquear=False):
+    # {usuario_id: PerfilComportamental} numa única consulta.
+    consulta = PerfilComportamental.objects.filter(usuario_id__in=usuario_ids)
+    if bloquear:
+        consulta = consulta.select_for_update()
+    return {perfil.usuario_id: perfil for perfil in consulta}
+
+
+def processar_lote(eventos, parametros=None):
+    # Pontua e atualiza os perfis para um lote de eventos (em ordem).
+    # Retorna [(evento, motivos)] dos eventos anômalos. Uma leitura e uma
+    # escrita (upsert) por lote, independentemente do tamanho.
+    parametros = {**PARAMETROS_PADRAO, **(parametros or {})}
+    anomalos = []
+
+    with transaction.atomic():
+        perfis = carregar_perfis({evento.usuario_id for evento in eventos}, bloquear=True)
+
+        for evento in sorted(eventos, key=lambda e: (e.timestamp, e.id or 0)):
+            perfil = perfis.get(evento.usuario_id)
+            if perfil is None:
+                perfil = PerfilComportamental(usuario_id=evento.usuario_id)
+                perfis[evento.usuario_id] = perfil
+
+            motivos = pontuar(perfil, evento, **parametros)
+            if motivos:
+                anomalos.append((evento, motivos))
+            atualizar(perfil, evento)
+
+        if perfis:
+            # Upsert numa instrução (INSERT ... ON CONFLICT DO UPDATE): bem
+            # mais barato que o CASE WHEN por linha do bulk_update. Não
+            # passa pelo auto_now.
+            agora = timezone.now()
+            for perfil in perfis.values():
+                perfil.atualizado_em = agora
+            PerfilComportamental.objects.bulk_create(
+                perfis.values(), update_conflicts=True, unique_fields=['usuario'],
+                update_fields=CAMPOS_PERFIL,
+            )
+
+    return anomalos
@@ -0,0 +1,231 @@
+import json
+import math
+import time
+import tracemalloc
+
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .models import Usuario, Evento
+from .utils import log_event, _analisar_evento
+from . import cache_dashboard, coleta, sintetico
+
+# Benchmarks
+# Mede os caminhos quentes (ingestão, motor de regras e os endpoints mais
+# usados) sobre dados sintéticos (core/sintetico.py). Para cada caso:
+#   - latência p50/p95/p99 e vazão sobre N amostras cronometradas
+#   - consultas SQL e pico de memória (tracemalloc) numa execução extra,
+#     instrumentada à parte para não distorcer a latência
+# comparar() confronta o resultado com um arquivo base (JSON) e aponta as
+# regressões além da tolerância.
+
+
+def percentil(valores, p):
+    # Percentil pelo método "nearest rank".
+    ordenados = sorted(valores)
+    posicao = max(0, math.ceil(p / 100 * len(ordenados)) - 1)
+    return ordenados[posicao]
+
+
+class Caso:
+
+    # Um caso de benchmark: preparar() roda uma vez, executar() por amostra.
+
+    nome = None
+    eventos_por_execucao = 1   # casos em lote: a vazão sai em eventos/s
+
+    def __init__(self, contexto):
+        self.contexto = contexto
+
+    def preparar(self):
+        pass
+
+    def antes_de_cada(self):
+        pass
+
+    def executar(self):
+        raise NotImplementedError
+
+
+class LogEvent(Caso):
+    nome = 'log_event'
+
+    def executar(self):
+        log_event(self.contexto['usuario'], Evento.TipoEvento.ACESSO_ARQUIVO)
+
+
+class AnalisarEvento(Caso):
+    nome = 'analisar_evento'
+
+    def preparar(self):
+        self.eventos = iter(
+            Evento.objects.filter(tipo_evento=Evento.TipoEvento.FALHA_LOGIN).order_by('-id')
+        )
+
+    def executar(self):
+        evento = next(self.eventos, None)
+        if evento is None:
+            self.preparar()
+            evento = next(self.eventos)
+        _analisar_evento(evento)
+
+
+class IngestaoEmMassa(Caso):
+    # Caminho do POST /events/ingest/ (sem o HTTP): NDJSON -> validação ->
+    # mapa de e-mails -> bulk_create + rollups + regras, 1000 eventos por vez.
+    nome = 'ingest'
+    eventos_por_execucao = 1000
+
+    def preparar(self):
+        emails = list(
+            Usuario.objects.filter(email__endswith=f'@{sintetico.DOMINIO_EMAIL}')
+            .order_by('id').values_list('email', flat=True)[:100]
+        )
+        self.linhas = [
+            json.dumps({'email': emails[i % len(emails)], 'tipo_evento': 'ACESSO_ARQUIVO', 'descricao': f'/srv/dados/{i}'})
+            for i in range(self.eventos_por_execucao)
+        ]
+
+    def executar(self):
+        coleta.ingerir(coleta.ler_ndjson(self.linhas))
+
+
+class _Http(Caso):
+
+    metodo = 'get'
+    rota = None
+    parametros = None
+
+    def preparar(self):
+        self.cliente = Client()
+
+    def executar(self):
+        cabecalhos = {'HTTP_AUTHORIZATION': f"Bearer {self.contexto['token']}"}
+        resposta = getattr(self.cliente, self.metodo)(reverse(self.rota), self.parametros or {}, **cabecalhos)
+        if resposta.status_code >= 400:
+            raise RuntimeError(f'{self.nome}: HTTP {resposta.status_code}')
+
+
+class Login(_Http):
+    nome = 'login'
+    metodo = 'post'
+    rota = 'token_obtain_pair'
+
+    def executar(self):
+        resposta = self.cliente.post(
+            reverse(self.rota),
+            {'email': self.contexto['usuario'].email, 'password': sintetico.SENHA_PADRAO},
+            content_type='application/json',
+        )
+        if resposta.status_code != 200:
+            raise RuntimeError(f'login: HTTP {resposta.status_code}')
+
+
+class ListarEventos(_Http):
+    nome = 'events'
+    rota = 'event-list'
+
+
+class ListarAlertas(_Http):
+    nome = 'alerts'
+    rota = 'alert-list'
+
+
+class DashboardQuente(_Http):
+    nome = 'dashboard_quente'
+    rota = 'dashboard-stats'
+
+
+class DashboardFrio(_Http):
+    # Cache invalidado antes de cada amostra: mede o cálculo completo.
+    nome = 'dashboard_frio'
+    rota = 'dashboard-stats'
+
+    def antes_de_cada(self):
+        cache_dashboard.invalidar(forcar=True)
+
+
+CASOS = [LogEvent, AnalisarEvento, IngestaoEmMassa, Login, ListarEventos, ListarAlertas, DashboardQuente, DashboardFrio]
+
+
+def preparar_contexto():
+    # Usuário e token usados pelos casos (o primeiro usuário sintético).
+    usuario = Usuario.objects.get(email=sintetico.email(0))
+    resposta = Client().post(
+        reverse('token_obtain_pair'),
+        {'email': usuario.email, 'password': sintetico.SENHA_PADRAO},
+        content_type='application/json',
+    )
+    return {'usuario': usuario, 'token': resposta.json()['access']}
+
+
+def medir(caso, amostras, aquecimento=3):
+    caso.preparar()
+    for _ in range(aquecimento):
+        caso.antes_de_cada()
+        caso.executar()
+
+    duracoes = []
+    for _ in range(amostras):
+        caso.antes_de_cada()
+        inicio = time.perf_counter()
+        caso.executar()
+        duracoes.append(time.perf_counter() - inicio)
+
+    # Execução instrumentada: consultas e pico de memória
+    caso.antes_de_cada()
+    tracemalloc.start()
+    try:
+        with CaptureQueriesContext(connection) as consultas:
+            caso.executar()
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    total = sum(duracoes)
+    return {
+        'amostras': amostras,
+        'p50_ms': round(percentil(duracoes, 50) * 1000, 3),
+        'p95_ms': round(percentil(duracoes, 95) * 1000, 3),
+        'p99_ms': round(percentil(duracoes, 99) * 1000, 3),
+        'vazao_por_s': round(amostras * caso.eventos_por_execucao / total, 1) if total else None,
+        'consultas': len(consultas.captured_queries),
+        'pico_memoria_kb': round(pico / 1024, 1),
+    }
+
+
+def executar(amostras, nomes=None):
+    contexto = preparar_contexto()
+    resultados = {}
+    for classe in CASOS:
+        if nomes and classe.nome not in nomes:
+            continue
+        resultados[classe.nome] = medir(classe(contexto), amostras)
+    return resultados
+
+
+def comparar(resultados, base, tolerancia):
+    # Lista de regressões (texto) em relação à base. A latência tolera
+    # "tolerancia" (fração); o número de consultas não pode crescer.
+    regressoes = []
+    for nome, atual in resultados.items():
+        anterior = base.get('casos', {}).get(nome)
+        if anterior is None:
+            continue
+        if atual['p95_ms'] > anterior['p95_ms'] * (1 + tolerancia):
+            regressoes.append(f"{nome}: p95 {atual['p95_ms']}ms > base {anterior['p95_ms']}ms (+{tolerancia:.0%})")
+        if atual['consultas'] > anterior['consultas']:
+            regressoes.append(f"{nome}: {atual['consultas']} consultas > base {anterior['consultas']}")
+    return regressoes
+
+
+def ler_base(caminho):
+    with open(caminho, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def gravar_base(caminho, escala, resultados):
+    with open(caminho, 'w', encoding='utf-8') as f:
+        json.dump({'escala': escala, 'casos': resultados}, f, ensure_ascii=False, indent=2, sort_keys=True)
@@ -0,0 +1,237 @@
+import asyncio
+import json
+import logging
+import threading
+from collections import deque
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+# Broker de Publicação (push em tempo real)
+# Os eventos e alertas gravados são publicados aqui e repassados para cada
+# assinante (uma conexão SSE em /api/stream/). Cada assinante tem uma fila
+# limitada: se ele não consome a tempo, as mensagens mais antigas são
+# descartadas. Publicar nunca bloqueia a ingestão.
+
+CANAIS = ('eventos', 'alertas')
+
+CONFIG_PADRAO = {
+    'BACKEND': 'core.broker.BrokerEmMemoria',
+    'TAMANHO_FILA': 100,                 # mensagens por assinante
+    'REDIS_URL': 'redis://localhost:6379/0',  # só para BrokerRedis
+}
+
+
+def configuracao():
+    return {**CONFIG_PADRAO, **getattr(settings, 'UEBAX_BROKER', {})}
+
+
+class Assinatura:
+
+    # Fila de um assinante. entregar() é chamado pela thread que publica;
+    # aguardar() (async) ou aguardar_sync() pelo consumidor.
+
+    def __init__(self, broker, canais, tamanho_fila):
+        self.broker = broker
+        self.canais = frozenset(canais)
+        self.descartadas = 0
+        self._fila = deque(maxlen=tamanho_fila)
+        self._lock = threading.Lock()
+        self._sinal = threading.Event()
+        self._loop = None
+        self._sinal_async = None
+
+    def entregar(self, canal, mensagem):
+        with self._lock:
+            if len(self._fila) == self._fila.maxlen:
+                self.descartadas += 1
+            self._fila.append((canal, mensagem))
+        self._sinal.set()
+        if self._loop is not None:
+            try:
+                self._loop.call_soon_threadsafe(self._sinal_async.set)
+            except RuntimeError:
+                # Loop já encerrado: o consumidor foi embora.
+                pass
+
+    def retirar(self):
+        # Retorna e esvazia o que está na fila.
+        with self._lock:
+            mensagens = list(self._fila)
+            self._fila.clear()
+            self._sinal.clear()
+            if self._sinal_async is not None:
+                self._sinal_async.clear()
+        return mensagens
+
+    async def aguardar(self, timeout):
+        # Espera por mensagens (ou timeout) sem ocupar uma thread.
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+            self._sinal_async = asyncio.Event()
+            if self._sinal.is_set():
+                self._sinal_async.set()
+        try:
+            await asyncio.wait_for(self._sinal_async.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self.retirar()
+
+    def aguardar_sync(self, timeout):
+        self._sinal.wait(timeout)
+        return self.retirar()
+
+    def cancelar(self):
+        self.broker.cancelar(self)
+
+
+class BrokerEmMemoria:
+
+    # Fan-out dentro do processo.
+
+    def __init__(self, tamanho_fila=100, **opcoes):
+        self.tamanho_fila = tamanho_fila
+        self._assinaturas = set()
+        self._lock = threading.Lock()
+
+    def assinar(self, canais=CANAIS):
+        assinatura = Assinatura(self, canais, self.tamanho_fila)
+        with self._lock:
+            self._assinaturas.add(assinatura)
+        return assinatura
+
+    def cancelar(self, assinatura):
+        with self._lock:
+            self._assinaturas.discard(assinatura)
+
+    def tem_assinantes(self):
+        return bool(self._assinaturas)
+
+    def publicar(self, canal, mensagens):
+        self._repassar(canal, mensagens)
+
+    def _repassar(self, canal, mensagens):
+        with self._lock:
+            assinaturas = [a for a in self._assinaturas if canal in a.canais]
+        for assinatura in assinaturas:
+            for mensagem in mensagens:
+                assinatura.entregar(canal, mensagem)
+
+    def encerrar(self):
+        pass
+
+
+class BrokerRedis(BrokerEmMemoria):
+
+    # Para vários processos: publica no Redis (pub/sub) e uma thread de
+    # fundo repassa o que chega do Redis para os assinantes locais.
+    # Requer o pacote "redis".
+
+    PREFIXO = 'uebax:'
+
+    def __init__(self, redis_url='redis://localhost:6379/0', **opcoes):
+        super().__init__(**opcoes)
+        try:
+            import redis
+        except ImportError:
+            raise ImproperlyConfigured('BrokerRedis requer o pacote "redis" (pip install redis).')
+        self._redis = redis.Redis.from_url(redis_url)
+        self._pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        self._pubsub.subscribe(**{self.PREFIXO + canal: self._ao_receber for canal in CANAIS})
+        self._thread = self._pubsub.run_in_thread(sleep_time=0.5, daemon=True)
+        self._thread.name = 'uebax-broker-redis'
+
+    def tem_assinantes(self):
+        # Outros processos podem ter assinantes; sempre publica.
+        return True
+
+    def publicar(self, canal, mensagens):
+        self._redis.publish(self.PREFIXO + canal, json.dumps(mensagens))
+
+    def _ao_receber(self, mensagem):
+        canal = mensagem['channel'].decode()[len(self.PREFIXO):]
+        self._repassar(canal, json.loads(mensagem['data']))
+
+    def encerrar(self):
+        self._thread.stop()
+        self._pubsub.close()
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def obter_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            config = configuracao()
+            classe = import_string(config['BACKEND'])
+            _broker = classe(tamanho_fila=config['TAMANHO_FILA'], redis_url=config['REDIS_URL'])
+        return _broker
+
+
+def reiniciar_broker():
+    global _broker
+    with _broker_lock:
+        broker, _broker = _broker, None
+    if broker is not None:
+        broker.encerrar()
+
+
+def _serializar_evento(evento):
+    return {
+        'id': evento.id,
+        'usuario_id': evento.usuario_id,
+        'tipo_evento': evento.tipo_evento,
+        'evento_desc': evento.get_tipo_evento_display(),
+        'timestamp': evento.timestamp.isoformat(),
+    }
+
+
+def _serializar_alerta(alerta):
+    return {
+        'id': alerta.id,
+        'usuario_id': alerta.usuario_id,
+        'tipo_alerta': alerta.tipo_alerta,
+        'descricao': alerta.get_tipo_alerta_display(),
+        'descricao_detalhada': alerta.descricao_detalhada,
+        'timestamp': alerta.timestamp.isoformat(),
+        'ocorrencias': alerta.ocorrencias,
+    }
+
+
+def _publicar_apos_commit(canal, objetos, serializar):
+    broker = obter_broker()
+    if not objetos or not broker.tem_assinantes():
+        return
+
+    def publicar():
+        try:
+            broker.publicar(canal, [serializar(objeto) for objeto in objetos])
+        except Exception:
+            # Push é "best effort": nunca derruba a ingestão.
+            logger.exception('Falha ao publicar %d mensagens em %s.', len(objetos), canal)
+
+    # Só publica o que de fato foi gravado.
+    transaction.on_commit(publicar)
+
+
+def publicar_eventos(eventos):
+    _publicar_apos_commit('eventos', eventos, _serializar_evento)
+
+
+def publicar_alertas(alertas):
+    _publicar_apos_commit('alertas', alertas, _serializar_alerta)
+
+
+@receiver(setting_changed)
+def _recarregar_configuracao(sender, setting, **kwargs):
+    if setting == 'UEBAX_BROKER':
+        reiniciar_broker()
@@ -0,0 +1,101 @@
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+# Cache do Dashboard
+# O payload de /dashboard/stats/ é o mesmo para todos os usuários, então é
+# guardado uma vez no cache do Django com um TTL curto. Toda escrita que
+# muda as contagens (ver core/rollups.py) incrementa uma "versão"; a chave
+# do payload inclui a versão, então uma escrita invalida tudo com um único
+# incr, sem precisar apagar chaves.
+#
+# O incremento só acontece depois do commit da escrita: antes dele, uma
+# leitura recalcularia o payload sem a escrita e o guardaria já na versão
+# nova. E acontece no máximo uma vez a cada INTERVALO_INVALIDACAO
+# segundos: sob escrita contínua, incrementar a cada lote zeraria a taxa
+# de acerto. A escrita que cai dentro do intervalo deixa uma marca de
+# pendência, e a primeira leitura depois do intervalo incrementa; o
+# payload fica, no pior caso, esse intervalo atrasado.
+
+CONFIG_PADRAO = {
+    'CACHE': 'default',
+    'TTL': 30,  # segundos
+    'INTERVALO_INVALIDACAO': 5,  # segundos entre dois incrementos da versão
+}
+
+CHAVE_VERSAO = 'uebax:dashboard:versao'
+CHAVE_RECENTE = 'uebax:dashboard:invalidado'   # existe por um intervalo após o incremento
+CHAVE_PENDENTE = 'uebax:dashboard:pendente'
+
+
+def configuracao():
+    return {**CONFIG_PADRAO, **getattr(settings, 'UEBAX_CACHE_DASHBOARD', {})}
+
+
+def _cache():
+    return caches[configuracao()['CACHE']]
+
+
+def _versao():
+    cache = _cache()
+    valores = cache.get_many([CHAVE_VERSAO, CHAVE_PENDENTE])
+    if CHAVE_PENDENTE in valores and _liberado(cache):
+        cache.delete(CHAVE_PENDENTE)
+        _incrementar(cache)
+        valores = {}
+    versao = valores.get(CHAVE_VERSAO) or cache.get(CHAVE_VERSAO)
+    if versao is None:
+        cache.add(CHAVE_VERSAO, 1, timeout=None)
+        versao = cache.get(CHAVE_VERSAO, 1)
+    return versao
+
+
+def _chave(dia, variante):
+    return f'uebax:dashboard:{dia.isoformat()}:{variante}:{_versao()}'
+
+
+def obter(dia, variante=''):
+    # Retorna (etag, dados) do cache, ou None. "variante" distingue
+    # payloads pedidos com parâmetros diferentes.
+    return _cache().get(_chave(dia, variante))
+
+
+def guardar(dia, dados, variante=''):
+    # Guarda o payload e retorna o ETag calculado sobre ele.
+    corpo = json.dumps(dados, sort_keys=True, cls=DjangoJSONEncoder)
+    etag = '"' + hashlib.md5(corpo.encode()).hexdigest() + '"'
+    _cache().set(_chave(dia, variante), (etag, dados), timeout=configuracao()['TTL'])
+    return etag
+
+
+def invalidar(forcar=False):
+    # Chamado a cada escrita de eventos/alertas; vale depois do commit.
+    # forcar=True ignora o intervalo (reconstrução, benchmark).
+    transaction.on_commit(lambda: _invalidar(forcar))
+
+
+def _invalidar(forcar):
+    cache = _cache()
+    if forcar or _liberado(cache):
+        cache.delete(CHAVE_PENDENTE)
+        _incrementar(cache)
+    else:
+        cache.set(CHAVE_PENDENTE, 1, timeout=None)
+
+
+def _liberado(cache):
+    # True (uma vez por intervalo, entre todos os processos) se a versão
+    # pode ser incrementada agora.
+    intervalo = configuracao()['INTERVALO_INVALIDACAO']
+    return intervalo <= 0 or cache.add(CHAVE_RECENTE, 1, timeout=intervalo)
+
+
+def _incrementar(cache):
+    try:
+        cache.incr(CHAVE_VERSAO)
+    except ValueError:
+        cache.add(CHAVE_VERSAO, 1, timeout=None)
@@ -0,0 +1,180 @@
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+# Caixa de Saída de E-mails
+# O request só monta a mensagem e a coloca numa fila em memória; quem fala
+# com o servidor SMTP é uma thread de fundo. A cada INTERVALO_ENVIO
+# segundos (ou quando a fila chega a TAMANHO_LOTE) ela abre UMA conexão
+# com o EMAIL_BACKEND e envia o lote inteiro por ela.
+#
+# Mensagens que falham voltam para a fila com espera crescente
+# (ESPERA_INICIAL, 2x, 4x, ...) até TENTATIVAS; depois disso são
+# descartadas com um erro no log. A fila não sobrevive a um restart: o
+# encerramento do processo (atexit) tenta enviar o que restou.
+#
+# MODO 'sincrono' envia na hora, dentro do request (comportamento antigo).
+
+CONFIG_PADRAO = {
+    'MODO': 'fila',           # 'fila' ou 'sincrono'
+    'TAMANHO_LOTE': 50,       # mensagens por conexão SMTP
+    'INTERVALO_ENVIO': 2.0,   # segundos entre envios periódicos
+    'TENTATIVAS': 5,
+    'ESPERA_INICIAL': 5.0,    # segundos antes da 2ª tentativa
+}
+
+
+def configuracao():
+    return {**CONFIG_PADRAO, **getattr(settings, 'UEBAX_CAIXA_SAIDA', {})}
+
+
+class _Pendente:
+
+    __slots__ = ('mensagem', 'tentativas', 'proxima')
+
+    def __init__(self, mensagem):
+        self.mensagem = mensagem
+        self.tentativas = 0
+        self.proxima = 0.0
+
+
+class CaixaDeSaida:
+
+    # Fila de mensagens com envio em lote por uma conexão reaproveitada.
+
+    def __init__(self, tamanho_lote, intervalo_envio, tentativas, espera_inicial):
+        self.tamanho_lote = tamanho_lote
+        self.intervalo_envio = intervalo_envio
+        self.tentativas = tentativas
+        self.espera_inicial = espera_inicial
+
+        self._fila = []
+        self._lock = threading.Lock()
+        self._envio_lock = threading.Lock()
+        self._acordar = threading.Event()
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name='uebax-caixa-saida', daemon=True)
+        self._thread.start()
+
+    def adicionar(self, mensagem):
+        with self._lock:
+            self._fila.append(_Pendente(mensagem))
+            tamanho = len(self._fila)
+        if tamanho >= self.tamanho_lote:
+            self._acordar.set()
+
+    def pendentes(self):
+        with self._lock:
+            return len(self._fila)
+
+    def descarregar(self, agora=None):
+        # Envia as mensagens cuja vez chegou. Retorna quantas foram enviadas.
+        agora = time.monotonic() if agora is None else agora
+        with self._envio_lock:
+            with self._lock:
+                prontas = [p for p in self._fila if p.proxima <= agora]
+                self._fila = [p for p in self._fila if p.proxima > agora]
+
+            enviadas = 0
+            for i in range(0, len(prontas), self.tamanho_lote):
+                enviadas += self._enviar_lote(prontas[i:i + self.tamanho_lote], agora)
+            return enviadas
+
+    def _enviar_lote(self, lote, agora):
+        falhas = []
+        try:
+            with get_connection() as conexao:
+                for pendente in lote:
+                    try:
+                        conexao.send_messages([pendente.mensagem])
+                    except Exception:
+                        falhas.append(pendente)
+        except Exception:
+            # Não conseguiu nem abrir a conexão: o lote inteiro tenta de novo
+            logger.warning('Falha ao conectar no servidor de e-mail.', exc_info=True)
+            falhas = lote
+
+        for pendente in falhas:
+            pendente.tentativas += 1
+            if pendente.tentativas >= self.tentativas:
+                logger.error(
+                    'E-mail para %s descartado após %d tentativas.',
+                    ', '.join(pendente.mensagem.to), pendente.tentativas,
+                )
+                continue
+            pendente.proxima = agora + self.espera_inicial * 2 ** (pendente.tentativas - 1)
+            with self._lock:
+                self._fila.append(pendente)
+        return len(lote) - len(falhas)
+
+    def encerrar(self):
+        # Para a thread de fundo e tenta enviar o que restou (uma vez).
+        self._parar.set()
+        self._acordar.set()
+        if self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join(timeout=self.intervalo_envio + 5)
+        self.descarregar(agora=float('inf'))
+
+    def _loop(self):
+        while not self._parar.is_set():
+            self._acordar.wait(self.intervalo_envio)
+            self._acordar.clear()
+            if self._parar.is_set():
+                break
+            try:
+                self.descarregar()
+            except Exception:
+                logger.exception('Falha inesperada no envio de e-mails.')
+
+
+_caixa = None
+_caixa_lock = threading.Lock()
+
+
+def obter_caixa():
+    global _caixa
+    with _caixa_lock:
+        if _caixa is None:
+            config = configuracao()
+            _caixa = CaixaDeSaida(
+                tamanho_lote=config['TAMANHO_LOTE'],
+                intervalo_envio=config['INTERVALO_ENVIO'],
+                tentativas=config['TENTATIVAS'],
+                espera_inicial=config['ESPERA_INICIAL'],
+            )
+        return _caixa
+
+
+def encerrar_caixa():
+    global _caixa
+    with _caixa_lock:
+        caixa, _caixa = _caixa, None
+    if caixa is not None:
+        caixa.encerrar()
+
+
+def enviar(assunto, corpo, destinatarios, remetente=None):
+    # Substitui send_mail(): enfileira (ou envia, no modo 'sincrono').
+    mensagem = EmailMessage(assunto, corpo, remetente or settings.DEFAULT_FROM_EMAIL, list(destinatarios))
+    if configuracao()['MODO'] == 'sincrono':
+        mensagem.send()
+    else:
+        obter_caixa().adicionar(mensagem)
+    return mensagem
+
+
+atexit.register(encerrar_caixa)
+
+
+@receiver(setting_changed)
+def _recarregar_configuracao(sender, setting, **kwargs):
+    if setting in ('UEBAX_CAIXA_SAIDA', 'EMAIL_BACKEND'):
+        encerrar_caixa()
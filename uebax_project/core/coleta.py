@@ -0,0 +1,226 @@
+import json
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Usuario, Evento
+from . import ingestao
+
+# Coleta de Eventos Externos
+# Eventos enviados por agentes externos (POST /api/events/ingest/ e o
+# comando coletar_eventos) em lotes grandes. Cada registro é um objeto:
+#     {"email": "ana@empresa.com", "tipo_evento": "ACESSO_ARQUIVO",
+#      "timestamp": "2025-01-31T14:02:11-03:00", "descricao": "/srv/rh/folha.xlsx"}
+# timestamp e descricao são opcionais (sem timestamp vale o momento da
+# chegada). A validação é feita à mão, sem ModelSerializer, e o e-mail vira
+# usuario_id por um mapa em memória (uma consulta por lote só para os
+# e-mails ainda desconhecidos). Os válidos são gravados com
+# ingestao.gravar_lote (bulk_create + rollups + motor de regras sobre o
+# lote); os inválidos são contados e descritos em "erros".
+
+CONFIG_PADRAO = {
+    'MAXIMO_POR_REQUISICAO': 50000,
+    'TAMANHO_LOTE': 5000,              # eventos por bulk_create/análise
+    'TAMANHO_MAPA_EMAILS': 100000,
+    'TOLERANCIA_FUTURO_SEGUNDOS': 300, # relógio do agente adiantado
+    'MAXIMO_DESCRICAO': 2000,
+    'MAXIMO_ERROS': 100,               # erros detalhados na resposta
+}
+
+TIPOS_VALIDOS = frozenset(Evento.TipoEvento.values)
+
+
+def configuracao():
+    return {**CONFIG_PADRAO, **getattr(settings, 'UEBAX_COLETA', {})}
+
+
+class MapaDeEmails:
+
+    # e-mail -> usuario_id, LRU limitado. Salvar ou apagar um usuário tira
+    # a entrada dele (o e-mail pode ter mudado, o id pode ter sumido).
+
+    def __init__(self, tamanho):
+        self.tamanho = tamanho
+        self._por_email = OrderedDict()
+        self._por_id = {}
+        self._lock = threading.Lock()
+
+    def resolver(self, emails):
+        # {email: id} para os e-mails que existem.
+        encontrados = {}
+        faltando = []
+        with self._lock:
+            for email in emails:
+                usuario_id = self._por_email.get(email)
+                if usuario_id is None:
+                    faltando.append(email)
+                else:
+                    self._por_email.move_to_end(email)
+                    encontrados[email] = usuario_id
+        if faltando:
+            novos = {}
+            for inicio in range(0, len(faltando), 1000):  # limite de parâmetros do SQLite
+                parte = faltando[inicio:inicio + 1000]
+                novos.update(Usuario.objects.filter(email__in=parte).values_list('email', 'id'))
+            with self._lock:
+                for email, usuario_id in novos.items():
+                    self._guardar(email, usuario_id)
+            encontrados.update(novos)
+        return encontrados
+
+    def esquecer(self, usuario_id):
+        with self._lock:
+            email = self._por_id.pop(usuario_id, None)
+            if email is not None:
+                self._por_email.pop(email, None)
+
+    def limpar(self):
+        with self._lock:
+            self._por_email.clear()
+            self._por_id.clear()
+
+    def _guardar(self, email, usuario_id):
+        self._por_email[email] = usuario_id
+        self._por_id[usuario_id] = email
+        while len(self._por_email) > self.tamanho:
+            _, antigo = self._por_email.popitem(last=False)
+            self._por_id.pop(antigo, None)
+
+
+_mapa = None
+_mapa_lock = threading.Lock()
+
+
+def obter_mapa():
+    global _mapa
+    with _mapa_lock:
+        if _mapa is None:
+            _mapa = MapaDeEmails(configuracao()['TAMANHO_MAPA_EMAILS'])
+        return _mapa
+
+
+def reiniciar_mapa():
+    global _mapa
+    with _mapa_lock:
+        _mapa = None
+
+
+def ler_ndjson(linhas):
+    # Gera (registro, erro) por linha não vazia; erro é None se o JSON é válido.
+    for linha in linhas:
+        if isinstance(linha, bytes):
+            linha = linha.decode('utf-8', errors='replace')
+        linha = linha.strip()
+        if not linha:
+            continue
+        try:
+            yield json.loads(linha), None
+        except ValueError:
+            yield None, 'JSON inválido.'
+
+
+def _validar(registro, agora, limite_futuro, maximo_descricao):
+    # Retorna (email, tipo, timestamp, descricao) ou levanta ValueError.
+    if not isinstance(registro, dict):
+        raise ValueError('Cada evento deve ser um objeto JSON.')
+    email = registro.get('email')
+    if not isinstance(email, str) or not email:
+        raise ValueError('Campo "email" obrigatório.')
+    tipo = registro.get('tipo_evento')
+    if tipo not in TIPOS_VALIDOS:
+        raise ValueError(f'tipo_evento inválido: {tipo!r}.')
+
+    momento = registro.get('timestamp')
+    if momento is None:
+        momento = agora
+    else:
+        momento = parse_datetime(momento) if isinstance(momento, str) else None
+        if momento is None:
+            raise ValueError('timestamp deve ser data/hora ISO 8601.')
+        if timezone.is_naive(momento):
+            momento = timezone.make_aware(momento)
+        if momento > limite_futuro:
+            raise ValueError('timestamp no futuro.')
+
+    descricao = registro.get('descricao')
+    if descricao is not None:
+        if not isinstance(descricao, str):
+            raise ValueError('descricao deve ser texto.')
+        descricao = descricao[:maximo_descricao]
+    return email, tipo, momento, descricao
+
+
+def preparar(itens):
+    # Valida os itens e resolve os e-mails, sem gravar nada.
+    # itens: iterável de (registro, erro de leitura ou None).
+    # Retorna (eventos ainda não salvos, resumo), com resumo no formato de
+    # ingerir(). Lote acima de MAXIMO_POR_REQUISICAO levanta OverflowError.
+    config = configuracao()
+    agora = timezone.now()
+    limite_futuro = agora + timedelta(seconds=config['TOLERANCIA_FUTURO_SEGUNDOS'])
+    resumo = {'aceitos': 0, 'rejeitados': 0, 'erros': []}
+
+    def rejeitar(indice, erro):
+        resumo['rejeitados'] += 1
+        if len(resumo['erros']) < config['MAXIMO_ERROS']:
+            resumo['erros'].append({'indice': indice, 'erro': erro})
+
+    validos = []  # (indice, email, tipo, momento, descricao)
+    for indice, (registro, erro) in enumerate(itens):
+        if indice >= config['MAXIMO_POR_REQUISICAO']:
+            raise OverflowError(f"Máximo de {config['MAXIMO_POR_REQUISICAO']} eventos por lote.")
+        if erro is None:
+            try:
+                validos.append((indice, *_validar(registro, agora, limite_futuro, config['MAXIMO_DESCRICAO'])))
+                continue
+            except ValueError as invalido:
+                erro = str(invalido)
+        rejeitar(indice, erro)
+
+    mapa = obter_mapa().resolver({email for _, email, _, _, _ in validos})
+    eventos = []
+    for indice, email, tipo, momento, descricao in validos:
+        usuario_id = mapa.get(email)
+        if usuario_id is None:
+            rejeitar(indice, f'Usuário não encontrado: {email}.')
+            continue
+        eventos.append(Evento(usuario_id=usuario_id, tipo_evento=tipo, timestamp=momento, descricao=descricao))
+    resumo['aceitos'] = len(eventos)
+    return eventos, resumo
+
+
+def partes(eventos):
+    # Fatias de TAMANHO_LOTE eventos, cada uma para um ingestao.gravar_lote.
+    tamanho = configuracao()['TAMANHO_LOTE']
+    return [eventos[inicio:inicio + tamanho] for inicio in range(0, len(eventos), tamanho)]
+
+
+def ingerir(itens):
+    # itens: iterável de (registro, erro de leitura ou None).
+    # Retorna {'aceitos', 'rejeitados', 'erros': [{'indice', 'erro'}]}.
+    # Lote acima de MAXIMO_POR_REQUISICAO levanta OverflowError antes de
+    # gravar qualquer evento.
+    eventos, resumo = preparar(itens)
+    for parte in partes(eventos):
+        ingestao.gravar_lote(parte)
+    return resumo
+
+
+@receiver(post_save, sender=Usuario)
+@receiver(post_delete, sender=Usuario)
+def _esquecer_usuario(sender, instance, **kwargs):
+    if _mapa is not None:
+        _mapa.esquecer(instance.pk)
+
+
+@receiver(setting_changed)
+def _recarregar_configuracao(sender, setting, **kwargs):
+    if setting == 'UEBAX_COLETA':
+        reiniciar_mapa()
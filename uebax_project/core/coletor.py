@@ -0,0 +1,471 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import InterfaceError, OperationalError, close_old_connections
+from django.utils.module_loading import import_string
+
+from .models import Evento
+from . import coleta, ingestao
+
+logger = logging.getLogger(__name__)
+
+# Coletor de Logs (comando coletar_eventos)
+# Processo de longa duração que lê logs de autenticação reais e os
+# transforma em Eventos. As fontes são:
+#   - arquivos seguidos como "tail -F": o arquivo é identificado pelo
+#     inode. Numa rotação, o arquivo antigo é lido até o fim e o novo é
+#     lido do começo. Se o arquivo for truncado, a leitura volta ao início.
+#   - syslog por UDP e por TCP (uma mensagem por linha).
+#
+# Um parser transforma cada linha no registro de core/coleta.py
+# ({email, tipo_evento, timestamp?, descricao?}). Ele devolve None para
+# linhas que não interessam e levanta ValueError para linhas
+# malformadas. Os parsers ficam em PARSERS e são plugáveis (caminho da
+# classe, como os backends de core/limitacao.py).
+#
+# Todas as fontes alimentam UMA fila limitada (TAMANHO_FILA). Um único
+# consumidor junta lotes de até TAMANHO_LOTE linhas (ou o que chegou em
+# INTERVALO_LOTE segundos), prepara os eventos com coleta.preparar e os
+# grava com ingestao.gravar_lote numa thread, fora do event loop. Com a fila cheia, a pressão volta para as
+# fontes:
+#   - arquivo: a leitura para até a fila andar;
+#   - TCP: o socket deixa de ser lido e o controle de fluxo do TCP segura
+#     o remetente;
+#   - UDP: não há como segurar o remetente, então a linha é descartada e
+#     contada em "descartadas".
+#
+# O offset de cada arquivo (inode, posição) é gravado em ARQUIVO_ESTADO
+# depois que o lote que contém as linhas foi gravado no banco. Ao
+# reiniciar, cada arquivo continua de onde parou (entrega "pelo menos
+# uma vez"). Se o banco falhar com erro transitório (OperationalError ou
+# InterfaceError: fora do ar, travado), só o passo que falhou é tentado de
+# novo, com espera crescente, e enquanto isso a fila enche e segura as
+# fontes. Repetir é seguro porque gravar_lote, quando levanta, não gravou
+# nada, e as partes já gravadas não voltam. Os outros erros não melhoram
+# com outra tentativa: a parte é descartada, vai para o log e é contada
+# em "perdidos".
+
+CONFIG_PADRAO = {
+    'TAMANHO_FILA': 10000,        # linhas aguardando gravação
+    'TAMANHO_LOTE': 2000,         # linhas por chamada a coleta.ingerir
+    'INTERVALO_LOTE': 1.0,        # segundos até gravar um lote incompleto
+    'INTERVALO_LEITURA': 0.5,     # segundos entre leituras de arquivo sem novidade
+    'INTERVALO_RELATORIO': 10.0,  # segundos entre relatórios de vazão
+    'ESPERA_MAXIMA_FALHA': 60.0,  # teto da espera entre tentativas de um lote
+    'ARQUIVO_ESTADO': 'coletor-estado.json',
+    'DOMINIO_PADRAO': '',         # usuário "ana" vira "ana@DOMINIO_PADRAO"
+    'PARSERS': {
+        'sshd': 'core.coletor.ParserSshd',
+        'ndjson': 'core.coletor.ParserNdjson',
+    },
+}
+
+
+def configuracao():
+    return {**CONFIG_PADRAO, **getattr(settings, 'UEBAX_COLETOR', {})}
+
+
+def obter_parser(nome):
+    config = configuracao()
+    try:
+        caminho = config['PARSERS'][nome]
+    except KeyError:
+        raise ValueError(f"Parser desconhecido: {nome!r} (disponíveis: {', '.join(sorted(config['PARSERS']))}).")
+    return import_string(caminho)(dominio_padrao=config['DOMINIO_PADRAO'])
+
+
+# Parsers
+
+class ParserNdjson:
+
+    # Uma linha = um registro JSON de core/coleta.py. Se a linha tiver um
+    # cabeçalho syslog, o JSON começa no primeiro "{".
+
+    def __init__(self, **opcoes):
+        pass
+
+    def analisar(self, linha):
+        inicio = linha.find('{')
+        if inicio < 0:
+            raise ValueError('Linha sem objeto JSON.')
+        try:
+            return json.loads(linha[inicio:])
+        except ValueError:
+            raise ValueError('JSON inválido.')
+
+
+class ParserSshd:
+
+    # Mensagens do OpenSSH (/var/log/auth.log, /var/log/secure ou syslog
+    # remoto). Só logins aceitos, logins recusados e fim de sessão geram
+    # eventos; as demais linhas são ignoradas. O horário do syslog não tem
+    # ano nem fuso, então o evento usa o momento da leitura.
+
+    PADROES = [
+        (re.compile(r'sshd\[\d+\]: Accepted (?P<metodo>\S+) for (?P<usuario>\S+) from (?P<ip>\S+)'),
+         Evento.TipoEvento.LOGIN),
+        (re.compile(r'sshd\[\d+\]: Failed (?P<metodo>\S+) for (?:invalid user )?(?P<usuario>\S+) from (?P<ip>\S+)'),
+         Evento.TipoEvento.FALHA_LOGIN),
+        (re.compile(r'sshd\[\d+\]: pam_unix\(sshd:session\): session closed for user (?P<usuario>\S+)'),
+         Evento.TipoEvento.LOGOUT),
+    ]
+
+    def __init__(self, dominio_padrao='', **opcoes):
+        self.dominio_padrao = dominio_padrao
+
+    def analisar(self, linha):
+        if 'sshd[' not in linha:
+            return None
+        for padrao, tipo in self.PADROES:
+            achado = padrao.search(linha)
+            if achado is None:
+                continue
+            campos = achado.groupdict()
+            descricao = 'ssh'
+            if 'ip' in campos:
+                descricao = f"ssh {campos['metodo']} de {campos['ip']}"
+            return {'email': self._email(campos['usuario']), 'tipo_evento': tipo, 'descricao': descricao}
+        return None
+
+    def _email(self, usuario):
+        if '@' in usuario or not self.dominio_padrao:
+            return usuario
+        return f'{usuario}@{self.dominio_padrao}'
+
+
+# Arquivos
+
+class SeguidorDeArquivo:
+
+    # Lê as linhas novas de um arquivo, como "tail -F". O estado
+    # (inode, offset) aponta o fim da última linha completa entregue.
+
+    def __init__(self, caminho, estado=None, do_inicio=False):
+        self.caminho = os.path.abspath(caminho)
+        self._estado = estado
+        self._do_inicio = do_inicio
+        self._arquivo = None
+        self._inode = None
+        self._offset = 0
+        self._parcial = b''
+
+    def _abrir(self):
+        try:
+            self._arquivo = open(self.caminho, 'rb')
+        except FileNotFoundError:
+            return False
+        info = os.fstat(self._arquivo.fileno())
+        self._inode = info.st_ino
+        if self._estado is not None:
+            # Mesmo arquivo de antes: continua do offset. Outro inode (houve
+            # rotação com o coletor parado) ou offset além do fim (arquivo
+            # truncado): começa do zero.
+            mesmo = self._estado['inode'] == info.st_ino and self._estado['offset'] <= info.st_size
+            self._offset = self._estado['offset'] if mesmo else 0
+        elif self._do_inicio:
+            self._offset = 0
+        else:
+            self._offset = info.st_size
+        self._estado = None
+        self._do_inicio = True  # arquivos que surgirem depois (rotação) são lidos inteiros
+        self._arquivo.seek(self._offset)
+        self._parcial = b''
+        return True
+
+    def fechar(self):
+        if self._arquivo is not None:
+            self._arquivo.close()
+            self._arquivo = None
+
+    def ler(self, maximo):
+        # Até `maximo` linhas completas: [(texto, (caminho, inode, offset))].
+        if self._arquivo is None and not self._abrir():
+            return []
+        linhas = []
+        while len(linhas) < maximo:
+            trecho = self._arquivo.readline()
+            if not trecho:
+                if linhas or not self._trocou():
+                    break
+                continue
+            if not trecho.endswith(b'\n'):
+                # Linha ainda sendo escrita: espera o resto.
+                self._parcial += trecho
+                break
+            trecho, self._parcial = self._parcial + trecho, b''
+            self._offset += len(trecho)
+            texto = trecho.decode('utf-8', errors='replace').strip()
+            if texto:
+                linhas.append((texto, (self.caminho, self._inode, self._offset)))
+        return linhas
+
+    def _trocou(self):
+        # No fim do arquivo: houve rotação ou truncamento? Se sim, já
+        # reposiciona e retorna True (há o que ler de novo).
+        try:
+            info = os.stat(self.caminho)
+        except FileNotFoundError:
+            return False  # rotacionado e ainda não recriado
+        if info.st_ino != self._inode:
+            self.fechar()
+            return self._abrir()
+        if info.st_size < self._offset + len(self._parcial):
+            self._offset = 0
+            self._parcial = b''
+            self._arquivo.seek(0)
+            return True
+        return False
+
+
+def carregar_estado(caminho):
+    try:
+        with open(caminho, encoding='utf-8') as arquivo:
+            return json.load(arquivo)
+    except FileNotFoundError:
+        return {}
+
+
+def salvar_estado(caminho, estado):
+    # Grava num temporário e renomeia: uma queda no meio não corrompe.
+    temporario = f'{caminho}.tmp'
+    with open(temporario, 'w', encoding='utf-8') as arquivo:
+        json.dump(estado, arquivo)
+    os.replace(temporario, caminho)
+
+
+# Sockets
+
+class _ProtocoloUdp(asyncio.DatagramProtocol):
+
+    def __init__(self, coletor, parser):
+        self.coletor = coletor
+        self.parser = parser
+
+    def datagram_received(self, dados, endereco):
+        for linha in dados.decode('utf-8', errors='replace').splitlines():
+            if linha.strip():
+                self.coletor.oferecer(self.parser, linha.strip())
+
+
+class Coletor:
+
+    def __init__(self, arquivo_estado=None, tamanho_fila=None, tamanho_lote=None):
+        config = configuracao()
+        self.tamanho_lote = tamanho_lote or config['TAMANHO_LOTE']
+        self.intervalo_lote = config['INTERVALO_LOTE']
+        self.intervalo_leitura = config['INTERVALO_LEITURA']
+        self.espera_maxima_falha = config['ESPERA_MAXIMA_FALHA']
+        self.arquivo_estado = arquivo_estado if arquivo_estado is not None else config['ARQUIVO_ESTADO']
+        self.fila = asyncio.Queue(tamanho_fila or config['TAMANHO_FILA'])
+        self.estado = carregar_estado(self.arquivo_estado) if self.arquivo_estado else {}
+        self.contadores = dict.fromkeys(
+            ('linhas', 'aceitos', 'rejeitados', 'ignoradas', 'erros_parse', 'descartadas', 'perdidos'), 0,
+        )
+        self.enderecos = []  # (protocolo, host, porta) efetivos, após o bind
+        self._seguidores = []
+        self._servidores = []
+        self._clientes = set()  # tarefas das conexões TCP abertas
+        self._parar = None
+
+    # Fontes (chamar antes de executar)
+
+    def seguir_arquivo(self, caminho, parser, do_inicio=False):
+        caminho = os.path.abspath(caminho)
+        self._seguidores.append((SeguidorDeArquivo(caminho, self.estado.get(caminho), do_inicio), parser))
+
+    def ouvir_udp(self, host, porta, parser):
+        self._servidores.append(('udp', host, porta, parser))
+
+    def ouvir_tcp(self, host, porta, parser):
+        self._servidores.append(('tcp', host, porta, parser))
+
+    def oferecer(self, parser, linha):
+        # Entrada sem espera (UDP): com a fila cheia, a linha é descartada.
+        try:
+            self.fila.put_nowait((parser, linha, None))
+        except asyncio.QueueFull:
+            self.contadores['descartadas'] += 1
+
+    def parar(self):
+        if self._parar is not None:
+            self._parar.set()
+
+    async def executar(self, relatar=None, intervalo_relatorio=None):
+        # Roda até parar(). Ao parar, as fontes são fechadas, a fila é
+        # esvaziada e o estado dos arquivos é gravado.
+        self._parar = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        fechar = []
+        produtores = [asyncio.create_task(self._seguir(seguidor, parser)) for seguidor, parser in self._seguidores]
+        for protocolo, host, porta, parser in self._servidores:
+            if protocolo == 'udp':
+                transporte, _ = await loop.create_datagram_endpoint(
+                    lambda parser=parser: _ProtocoloUdp(self, parser), local_addr=(host, porta),
+                )
+                fechar.append(transporte.close)
+                endereco = transporte.get_extra_info('sockname')
+            else:
+                servidor = await asyncio.start_server(
+                    lambda leitor, escritor, parser=parser: self._cliente_tcp(parser, leitor, escritor), host, porta,
+                )
+                fechar.append(servidor.close)
+                endereco = servidor.sockets[0].getsockname()
+            self.enderecos.append((protocolo, endereco[0], endereco[1]))
+
+        consumidor = asyncio.create_task(self._consumir())
+        relatorio = None
+        if relatar is not None:
+            relatorio = asyncio.create_task(self._relatar(relatar, intervalo_relatorio or configuracao()['INTERVALO_RELATORIO']))
+
+        await self._parar.wait()
+        for fechamento in fechar:
+            fechamento()
+        tarefas = produtores + list(self._clientes) + ([relatorio] if relatorio else [])
+        for tarefa in tarefas:
+            tarefa.cancel()
+        await asyncio.gather(*tarefas, return_exceptions=True)
+        await consumidor
+        for seguidor, _ in self._seguidores:
+            seguidor.fechar()
+        return dict(self.contadores)
+
+    async def _seguir(self, seguidor, parser):
+        while True:
+            linhas = seguidor.ler(self.tamanho_lote)
+            for texto, marca in linhas:
+                await self.fila.put((parser, texto, marca))  # bloqueia com a fila cheia
+            if not linhas:
+                await asyncio.sleep(self.intervalo_leitura)
+
+    async def _cliente_tcp(self, parser, leitor, escritor):
+        tarefa = asyncio.current_task()
+        self._clientes.add(tarefa)
+        try:
+            while True:
+                linha = await leitor.readline()
+                if not linha:
+                    break
+                texto = linha.decode('utf-8', errors='replace').strip()
+                if texto:
+                    await self.fila.put((parser, texto, None))
+        except ValueError:
+            # Linha maior que o limite do StreamReader: fecha a conexão.
+            self.contadores['erros_parse'] += 1
+        except ConnectionError:
+            pass
+        finally:
+            self._clientes.discard(tarefa)
+            escritor.close()
+
+    async def _consumir(self):
+        while not (self._parar.is_set() and self.fila.empty()):
+            lote = await self._juntar_lote()
+            if lote:
+                await self._gravar(lote)
+
+    async def _juntar_lote(self):
+        lote = []
+        limite = time.monotonic() + self.intervalo_lote
+        while len(lote) < self.tamanho_lote:
+            try:
+                while len(lote) < self.tamanho_lote:
+                    lote.append(self.fila.get_nowait())
+                break
+            except asyncio.QueueEmpty:
+                pass
+            restante = limite - time.monotonic()
+            if restante <= 0 or self._parar.is_set():
+                break
+            try:
+                lote.append(await asyncio.wait_for(self.fila.get(), min(restante, 0.25)))
+            except asyncio.TimeoutError:
+                pass
+        return lote
+
+    async def _gravar(self, lote):
+        try:
+            parcial, eventos = await self._com_novas_tentativas(self._preparar, lote, f'lote de {len(lote)} linhas')
+        except Exception:
+            logger.exception('Lote de %d linhas descartado: falha ao preparar os eventos.', len(lote))
+            parcial, eventos = {'linhas': len(lote), 'perdidos': len(lote)}, []
+
+        for parte in coleta.partes(eventos):
+            try:
+                await self._com_novas_tentativas(ingestao.gravar_lote, parte, f'{len(parte)} eventos')
+            except Exception:
+                logger.exception('%d eventos descartados: falha não transitória ao gravar.', len(parte))
+                parcial['aceitos'] -= len(parte)
+                parcial['perdidos'] = parcial.get('perdidos', 0) + len(parte)
+
+        for chave, valor in parcial.items():
+            self.contadores[chave] += valor
+
+        marcas = {}
+        for _, _, marca in lote:
+            if marca is not None:
+                caminho, inode, offset = marca
+                marcas[caminho] = {'inode': inode, 'offset': offset}
+        if marcas and self.arquivo_estado:
+            self.estado.update(marcas)
+            await sync_to_async(salvar_estado, thread_sensitive=False)(self.arquivo_estado, self.estado)
+
+    async def _com_novas_tentativas(self, funcao, argumento, descricao):
+        # Roda funcao numa thread, repetindo enquanto o banco falhar com erro
+        # transitório. Qualquer outra exceção sobe na primeira vez.
+        tentativa = 0
+        while True:
+            try:
+                return await sync_to_async(funcao)(argumento)
+            except (OperationalError, InterfaceError):
+                tentativa += 1
+                espera = min(self.espera_maxima_falha, 2 ** tentativa)
+                logger.exception('Falha ao gravar %s (tentativa %d); nova tentativa em %.0fs.', descricao, tentativa, espera)
+                await sync_to_async(close_old_connections)()
+                await asyncio.sleep(espera)
+
+    @staticmethod
+    def _preparar(lote):
+        # Roda fora do event loop: parse + validação, sem gravar nada.
+        parcial = {'linhas': len(lote), 'ignoradas': 0, 'erros_parse': 0, 'aceitos': 0, 'rejeitados': 0}
+        registros = []
+        for parser, texto, _ in lote:
+            try:
+                registro = parser.analisar(texto)
+            except ValueError:
+                parcial['erros_parse'] += 1
+                continue
+            if registro is None:
+                parcial['ignoradas'] += 1
+            else:
+                registros.append((registro, None))
+        eventos = []
+        if registros:
+            eventos, resumo = coleta.preparar(registros)
+            parcial['aceitos'] = resumo['aceitos']
+            parcial['rejeitados'] = resumo['rejeitados']
+        return parcial, eventos
+
+    async def _relatar(self, relatar, intervalo):
+        anterior, momento = self.contadores['linhas'], time.monotonic()
+        while True:
+            await asyncio.sleep(intervalo)
+            agora = time.monotonic()
+            relatar(self.resumo((self.contadores['linhas'] - anterior) / (agora - momento)))
+            anterior, momento = self.contadores['linhas'], agora
+
+    def resumo(self, linhas_por_segundo=None):
+        c = self.contadores
+        texto = (
+            f"linhas {c['linhas']} | aceitos {c['aceitos']} | rejeitados {c['rejeitados']} | "
+            f"ignoradas {c['ignoradas']} | erros de parse {c['erros_parse']} | "
+            f"descartadas {c['descartadas']} | perdidos {c['perdidos']} | fila {self.fila.qsize()}"
+        )
+        if linhas_por_segundo is not None:
+            texto = f'{linhas_por_segundo:.0f} linhas/s | {texto}'
+        return texto
@@ -0,0 +1,225 @@
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import InterfaceError, OperationalError, connections, transaction
+from django.dispatch import receiver
+
+from .models import Evento
+
+logger = logging.getLogger(__name__)
+
+# Ingestão em Lote (modo "buffer")
+# Em vez de gravar cada evento no request, o log_event enfileira o evento
+# em memória. Uma thread de fundo descarrega a fila com bulk_create quando
+# ela atinge TAMANHO_LOTE ou a cada INTERVALO_FLUSH segundos, e o motor de
+# regras analisa o lote inteiro de uma vez.
+#
+# Se um lote falha com erro transitório do banco (OperationalError ou
+# InterfaceError: travado, fora do ar), ele volta para o início da fila
+# e a thread espera ESPERA_INICIAL, 2x, 4x... (até ESPERA_MAXIMA) antes de
+# tentar de novo. Qualquer outro erro (ex.: IntegrityError de um usuário
+# apagado) não passaria numa nova tentativa e travaria a fila: o lote é
+# descartado, cada evento vai para o log e a perda é contada em
+# "descartados". Com a fila em LIMITE_FILA, quem chama grava o próprio
+# evento na hora (backpressure; se o banco estiver fora, o erro aparece
+# para o chamador, como no modo síncrono). O que ainda estiver na fila
+# quando o processo termina e não puder ser gravado vai para o log, um
+# evento por linha.
+#
+# O modo padrão ("sincrono") mantém o comportamento original: grava e
+# analisa na hora. É o modo usado nos testes.
+
+CONFIG_PADRAO = {
+    'MODO': 'sincrono',       # 'sincrono' ou 'buffer'
+    'TAMANHO_LOTE': 500,      # descarrega ao atingir este tamanho
+    'INTERVALO_FLUSH': 1.0,   # segundos entre descargas periódicas
+    'LIMITE_FILA': 10000,     # acima disso o chamador grava o evento na hora (backpressure)
+    'ESPERA_INICIAL': 1.0,    # segundos antes de tentar de novo um lote que falhou
+    'ESPERA_MAXIMA': 60.0,
+}
+
+
+def configuracao():
+    return {**CONFIG_PADRAO, **getattr(settings, 'UEBAX_INGESTAO', {})}
+
+
+def modo_buffer():
+    return configuracao()['MODO'] == 'buffer'
+
+
+def gravar_lote(eventos):
+    # Grava um lote de eventos (ainda não salvos), atualiza os rollups e
+    # roda o motor de regras sobre o lote. Usado pelo buffer e por qualquer
+    # caminho de ingestão em massa.
+    #
+    # Se levantar exceção, nada foi gravado: o lote pode ser tentado de
+    # novo sem duplicar eventos. Uma falha do motor de regras, que roda
+    # depois do commit, só vai para o log.
+    from . import rollups, broker
+    from .utils import _analisar_lote
+
+    if not eventos:
+        return []
+    with transaction.atomic():
+        gravados = Evento.objects.bulk_create(eventos)
+        rollups.registrar_eventos(gravados)
+        broker.publicar_eventos(gravados)
+    try:
+        _analisar_lote(gravados)
+    except Exception:
+        logger.exception('Lote de %d eventos gravado, mas a análise das regras falhou.', len(gravados))
+    return gravados
+
+
+class BufferDeEventos:
+
+    # Fila de eventos em memória com descarga por tamanho ou por tempo.
+
+    def __init__(self, tamanho_lote, intervalo_flush, limite_fila, espera_inicial=1.0, espera_maxima=60.0):
+        self.tamanho_lote = tamanho_lote
+        self.intervalo_flush = intervalo_flush
+        self.limite_fila = limite_fila
+        self.espera_inicial = espera_inicial
+        self.espera_maxima = espera_maxima
+
+        self._fila = []
+        self.descartados = 0
+        self._falhas_seguidas = 0
+        self._proxima = 0.0  # monotonic antes do qual a thread não tenta de novo
+        self._lock = threading.Lock()
+        self._acordar = threading.Event()
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name='uebax-ingestao', daemon=True)
+        self._thread.start()
+
+    def adicionar(self, evento):
+        # Enfileira sem nenhum I/O (serve também ao event loop). Retorna
+        # False com a fila cheia: o evento NÃO entrou e o chamador deve
+        # gravá-lo (gravar_lote([evento])).
+        with self._lock:
+            aceito = len(self._fila) < self.limite_fila
+            if aceito:
+                self._fila.append(evento)
+            tamanho = len(self._fila)
+        if not aceito or tamanho >= self.tamanho_lote:
+            self._acordar.set()
+        return aceito
+
+    def pendentes(self):
+        with self._lock:
+            return len(self._fila)
+
+    def descarregar(self):
+        # Grava a fila em lotes de tamanho_lote e retorna quantos eventos
+        # foram gravados. O lote que falhar por erro transitório volta, com
+        # os seguintes, para o início da fila, e a próxima tentativa da
+        # thread espera mais. Com outro erro, o lote é descartado.
+        with self._lock:
+            fila, self._fila = self._fila, []
+
+        gravados = 0
+        for i in range(0, len(fila), self.tamanho_lote):
+            lote = fila[i:i + self.tamanho_lote]
+            try:
+                gravar_lote(lote)
+            except (OperationalError, InterfaceError):
+                with self._lock:
+                    self._fila[:0] = fila[i:]
+                    self._falhas_seguidas += 1
+                    espera = min(self.espera_maxima, self.espera_inicial * 2 ** (self._falhas_seguidas - 1))
+                    self._proxima = time.monotonic() + espera
+                logger.exception(
+                    'Falha ao gravar lote de %d eventos; %d eventos voltam para a fila (nova tentativa em %.0fs).',
+                    len(lote), len(fila) - i, espera,
+                )
+                return gravados
+            except Exception:
+                logger.exception('Lote de %d eventos descartado: erro que não passa com nova tentativa.', len(lote))
+                _registrar_perdidos(lote)
+                with self._lock:
+                    self.descartados += len(lote)
+                continue
+            gravados += len(lote)
+
+        with self._lock:
+            self._falhas_seguidas = 0
+            self._proxima = 0.0
+        return gravados
+
+    def encerrar(self):
+        # Para a thread de fundo e tenta uma última descarga. O que não
+        # puder ser gravado vai para o log, para recuperação manual.
+        self._parar.set()
+        self._acordar.set()
+        if self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join(timeout=self.intervalo_flush + 5)
+        self.descarregar()
+        with self._lock:
+            perdidos, self._fila = self._fila, []
+        _registrar_perdidos(perdidos)
+
+    def _loop(self):
+        while not self._parar.is_set():
+            self._acordar.wait(self.intervalo_flush)
+            self._acordar.clear()
+            if self._parar.is_set():
+                break
+            with self._lock:
+                esperando = time.monotonic() < self._proxima
+            if esperando:
+                continue
+            try:
+                self.descarregar()
+            finally:
+                # A thread tem a sua própria conexão; não a deixa aberta.
+                connections.close_all()
+
+
+def _registrar_perdidos(eventos):
+    # Um evento por linha no log, para recuperação manual.
+    for evento in eventos:
+        logger.error(
+            'Evento não gravado: usuario_id=%s tipo_evento=%s timestamp=%s descricao=%r',
+            evento.usuario_id, evento.tipo_evento, evento.timestamp.isoformat(), evento.descricao,
+        )
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def obter_buffer():
+    global _buffer
+    with _buffer_lock:
+        if _buffer is None:
+            config = configuracao()
+            _buffer = BufferDeEventos(
+                tamanho_lote=config['TAMANHO_LOTE'],
+                intervalo_flush=config['INTERVALO_FLUSH'],
+                limite_fila=config['LIMITE_FILA'],
+                espera_inicial=config['ESPERA_INICIAL'],
+                espera_maxima=config['ESPERA_MAXIMA'],
+            )
+        return _buffer
+
+
+def encerrar_buffer():
+    global _buffer
+    with _buffer_lock:
+        buffer, _buffer = _buffer, None
+    if buffer is not None:
+        buffer.encerrar()
+
+
+# Garante que nada fica na fila quando o processo termina.
+atexit.register(encerrar_buffer)
+
+
+@receiver(setting_changed)
+def _recarregar_configuracao(sender, setting, **kwargs):
+    if setting == 'UEBAX_INGESTAO':
+        encerrar_buffer()
@@ -0,0 +1,182 @@
+import threading
+from bisect import bisect_right, insort
+from collections import deque
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+# Contadores de Janela Deslizante
+# Respondem "quantas ocorrências desta chave nos últimos N segundos" sem
+# consultar o banco a cada evento. Usados pelas regras "limite_janela"
+# (ex.: falhas de login), um contador por regra.
+#
+# Na primeira vez que uma chave aparece (processo recém-iniciado, ou chave
+# expirada), o contador chama carregar_historico() para se reidratar a
+# partir do banco; depois disso tudo acontece em memória/cache.
+
+CONFIG_PADRAO = {
+    'BACKEND': 'core.janelas.JanelaEmMemoria',
+    'JANELA_MINUTOS': 10,
+    'LIMITE': 5,
+    'CACHE': 'default',        # só para JanelaEmCache
+    'GRANULARIDADE': 60,       # segundos por balde, só para JanelaEmCache
+}
+
+
+def configuracao():
+    return {**CONFIG_PADRAO, **getattr(settings, 'UEBAX_JANELA_FALHAS', {})}
+
+
+class JanelaEmMemoria:
+
+    # Um deque ordenado de timestamps (epoch) por chave, dentro do processo.
+    # Os momentos podem chegar fora de ordem (eventos retroativos, lotes da
+    # coleta): cada um entra na posição certa e a contagem é feita por
+    # busca binária em (momento - janela, momento]. Saem do deque os que já
+    # ficaram fora da janela do momento mais recente visto.
+
+    def __init__(self, janela_segundos, **opcoes):
+        self.janela = janela_segundos
+        self._eventos = {}
+        self._lock = threading.Lock()
+
+    def registrar(self, chave, momento, carregar_historico=None):
+        # Registra uma ocorrência em "momento" (epoch) e retorna quantas
+        # ocorrências a chave tem na janela que termina em "momento".
+        with self._lock:
+            fila = self._eventos.get(chave)
+            if fila is None:
+                fila = deque(sorted(carregar_historico())) if carregar_historico else deque()
+                self._eventos[chave] = fila
+            insort(fila, momento)
+            contagem = self._contar(fila, momento)
+            self._expirar(fila, fila[-1])
+            return contagem
+
+    def mais_recente(self, chave):
+        # Maior momento já registrado para a chave (None se desconhecida).
+        with self._lock:
+            fila = self._eventos.get(chave)
+            return fila[-1] if fila else None
+
+    def contar(self, chave, momento):
+        with self._lock:
+            fila = self._eventos.get(chave)
+            if not fila:
+                return 0
+            self._expirar(fila, max(momento, fila[-1]))
+            if not fila:
+                del self._eventos[chave]
+                return 0
+            return self._contar(fila, momento)
+
+    def limpar(self):
+        with self._lock:
+            self._eventos.clear()
+
+    def _expirar(self, fila, momento):
+        limite = momento - self.janela
+        while fila and fila[0] <= limite:
+            fila.popleft()
+
+    def _contar(self, fila, momento):
+        return bisect_right(fila, momento) - bisect_right(fila, momento - self.janela)
+
+
+class JanelaEmCache:
+
+    # Baldes de contagem no cache do Django (ex.: Redis/Memcached), para
+    # vários workers compartilharem o mesmo estado. Cada balde cobre
+    # GRANULARIDADE segundos; a janela é a soma dos baldes que ela cobre,
+    # então a borda mais antiga tem a precisão de um balde.
+
+    PREFIXO = 'uebax:janela'
+
+    def __init__(self, janela_segundos, cache='default', granularidade=60, **opcoes):
+        self.janela = janela_segundos
+        self.granularidade = granularidade
+        self.cache = caches[cache]
+        self.timeout = janela_segundos + granularidade
+
+    def registrar(self, chave, momento, carregar_historico=None):
+        # cache.add só tem sucesso para o primeiro que chegar: é ele quem
+        # reidrata a chave a partir do banco. A marca vive tanto quanto o
+        # balde mais novo da chave (é renovada a cada registro), então só
+        # expira quando nenhum balde ainda vivo contaria o histórico de novo.
+        marca = f'{self.PREFIXO}:{chave}:hidratado'
+        if self.cache.add(marca, 1, timeout=self.timeout):
+            for anterior in (carregar_historico() if carregar_historico else []):
+                self._incrementar(chave, anterior)
+        else:
+            self.cache.touch(marca, timeout=self.timeout)
+        self._incrementar(chave, momento)
+        recente = self.mais_recente(chave)
+        if recente is None or momento > recente:
+            # get + set sem atomicidade: sob corrida vale o último a gravar
+            self.cache.set(f'{self.PREFIXO}:{chave}:recente', momento, timeout=self.timeout)
+        return self.contar(chave, momento)
+
+    def mais_recente(self, chave):
+        return self.cache.get(f'{self.PREFIXO}:{chave}:recente')
+
+    def contar(self, chave, momento):
+        chaves = [self._chave_balde(chave, balde) for balde in self._baldes(momento)]
+        return sum(self.cache.get_many(chaves).values())
+
+    def limpar(self):
+        # O cache é compartilhado; as chaves expiram sozinhas.
+        pass
+
+    def _incrementar(self, chave, momento):
+        chave_balde = self._chave_balde(chave, int(momento // self.granularidade))
+        self.cache.add(chave_balde, 0, timeout=self.timeout)
+        try:
+            self.cache.incr(chave_balde)
+        except ValueError:
+            # Expirou entre o add e o incr
+            self.cache.set(chave_balde, 1, timeout=self.timeout)
+
+    def _baldes(self, momento):
+        ultimo = int(momento // self.granularidade)
+        primeiro = int((momento - self.janela) // self.granularidade) + 1
+        return range(primeiro, ultimo + 1)
+
+    def _chave_balde(self, chave, balde):
+        return f'{self.PREFIXO}:{chave}:{balde}'
+
+
+_contadores = {}
+_contadores_lock = threading.Lock()
+
+
+def obter_contador(nome='falhas', janela_segundos=None):
+    # Um contador por (nome da regra, janela). O backend vem das settings.
+    config = configuracao()
+    if janela_segundos is None:
+        janela_segundos = config['JANELA_MINUTOS'] * 60
+    with _contadores_lock:
+        chave = (nome, janela_segundos)
+        if chave not in _contadores:
+            classe = import_string(config['BACKEND'])
+            _contadores[chave] = classe(
+                janela_segundos=janela_segundos,
+                cache=config['CACHE'],
+                granularidade=config['GRANULARIDADE'],
+            )
+        return _contadores[chave]
+
+
+def reiniciar_contador():
+    with _contadores_lock:
+        for contador in _contadores.values():
+            contador.limpar()
+        _contadores.clear()
+
+
+@receiver(setting_changed)
+def _recarregar_configuracao(sender, setting, **kwargs):
+    if setting == 'UEBAX_JANELA_FALHAS':
+        reiniciar_contador()
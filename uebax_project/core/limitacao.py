@@ -0,0 +1,319 @@
+import atexit
+import hashlib
+import threading
+import time
+from collections.abc import Mapping
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.db import connections
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from rest_framework.throttling import BaseThrottle
+
+from .models import Usuario, Evento
+from .utils import log_event
+
+# Limite de Tentativas de Login (token bucket)
+# Cada tentativa de login gasta uma ficha de dois baldes: o do e-mail
+# tentado e o do IP do cliente. Sem ficha, a tentativa é recusada (HTTP
+# 429 + Retry-After) ANTES do authenticate(), ou seja, sem rodar o hasher
+# de senha, sem log_event e sem passar pelo motor de regras. Os baldes se
+# reabastecem continuamente (TAXA fichas por minuto, até CAPACIDADE).
+# Um login bem-sucedido devolve as fichas gastas.
+#
+# As tentativas recusadas não viram uma linha cada: por e-mail cadastrado,
+# no máximo um FALHA_LOGIN a cada INTERVALO_AGREGACAO segundos, com o
+# número de tentativas bloqueadas na descrição. As recusas que chegam
+# dentro do intervalo ficam pendentes e um temporizador as registra quando
+# ele termina (e na saída do processo), mesmo sem novas tentativas.
+#
+# Backends (como em core/janelas.py):
+#   - BaldeEmMemoria: dentro do processo
+#   - BaldeEmCache:   no cache do Django, compartilhado entre workers
+#     (leitura/escrita não atômicas: sob corrida, uma ou outra tentativa a
+#     mais pode passar)
+
+CONFIG_PADRAO = {
+    'HABILITADO': True,
+    'BACKEND': 'core.limitacao.BaldeEmMemoria',
+    'CAPACIDADE_EMAIL': 5,
+    'TAXA_EMAIL': 1,           # fichas por minuto
+    'CAPACIDADE_IP': 20,
+    'TAXA_IP': 10,
+    'INTERVALO_AGREGACAO': 60, # segundos entre FALHA_LOGIN agregados
+    'CONFIAR_X_FORWARDED_FOR': False,
+    'CACHE': 'default',        # só para BaldeEmCache
+    'MAXIMO_CHAVES': 100000,   # só para BaldeEmMemoria
+}
+
+
+def configuracao():
+    return {**CONFIG_PADRAO, **getattr(settings, 'UEBAX_LIMITE_LOGIN', {})}
+
+
+def _reabastecer(estado, capacidade, taxa, agora):
+    fichas, atualizado = estado[:2] if estado else (capacidade, agora)
+    return min(capacidade, fichas + (agora - atualizado) * taxa)
+
+
+class BaldeEmMemoria:
+
+    # {chave: (fichas, atualizado, cheio_em)}. Passando de MAXIMO_CHAVES,
+    # saem as chaves que já se reabasteceram (não limitam mais nada) e, se
+    # ainda preciso, as mais antigas.
+
+    def __init__(self, maximo_chaves=100000, **opcoes):
+        self.maximo_chaves = maximo_chaves
+        self._baldes = {}
+        self._lock = threading.Lock()
+
+    def consumir(self, baldes, agora):
+        # baldes: [(chave, capacidade, taxa por segundo)]. Gasta uma ficha de
+        # cada um, ou de nenhum. Retorna 0 ou os segundos até poder tentar.
+        with self._lock:
+            fichas = [_reabastecer(self._baldes.get(chave), capacidade, taxa, agora) for chave, capacidade, taxa in baldes]
+            espera = max(((1 - f) / taxa for f, (_, _, taxa) in zip(fichas, baldes) if f < 1), default=0)
+            if not espera:
+                fichas = [f - 1 for f in fichas]
+            for (chave, capacidade, taxa), f in zip(baldes, fichas):
+                self._guardar(chave, f, capacidade, taxa, agora)
+            if len(self._baldes) > self.maximo_chaves:
+                self._podar(agora)
+            return espera
+
+    def devolver(self, baldes, agora):
+        with self._lock:
+            for chave, capacidade, taxa in baldes:
+                if chave in self._baldes:
+                    fichas = min(capacidade, _reabastecer(self._baldes[chave], capacidade, taxa, agora) + 1)
+                    self._guardar(chave, fichas, capacidade, taxa, agora)
+
+    def limpar(self):
+        with self._lock:
+            self._baldes.clear()
+
+    def _guardar(self, chave, fichas, capacidade, taxa, agora):
+        self._baldes.pop(chave, None)  # reinsere no fim: a ordem é a do último uso
+        self._baldes[chave] = (fichas, agora, agora + (capacidade - fichas) / taxa)
+
+    def _podar(self, agora):
+        for chave in [chave for chave, estado in self._baldes.items() if estado[2] <= agora]:
+            del self._baldes[chave]
+        while len(self._baldes) > self.maximo_chaves:
+            del self._baldes[next(iter(self._baldes))]
+
+
+class BaldeEmCache:
+
+    PREFIXO = 'uebax:limite'
+
+    def __init__(self, cache='default', **opcoes):
+        self.cache = caches[cache]
+
+    def consumir(self, baldes, agora):
+        chaves = {self._chave(chave): (capacidade, taxa) for chave, capacidade, taxa in baldes}
+        estados = self.cache.get_many(list(chaves))
+        fichas = {chave: _reabastecer(estados.get(chave), capacidade, taxa, agora) for chave, (capacidade, taxa) in chaves.items()}
+        espera = max(((1 - fichas[chave]) / taxa for chave, (_, taxa) in chaves.items() if fichas[chave] < 1), default=0)
+        if not espera:
+            fichas = {chave: f - 1 for chave, f in fichas.items()}
+        self.cache.set_many({chave: (f, agora) for chave, f in fichas.items()}, timeout=self._timeout(chaves))
+        return espera
+
+    def devolver(self, baldes, agora):
+        chaves = {self._chave(chave): (capacidade, taxa) for chave, capacidade, taxa in baldes}
+        estados = self.cache.get_many(list(chaves))
+        self.cache.set_many({
+            chave: (min(capacidade, _reabastecer(estados[chave], capacidade, taxa, agora) + 1), agora)
+            for chave, (capacidade, taxa) in chaves.items() if chave in estados
+        }, timeout=self._timeout(chaves))
+
+    def limpar(self):
+        # O cache é compartilhado; as chaves expiram sozinhas.
+        pass
+
+    def _chave(self, chave):
+        # E-mails podem ter caracteres que o memcached não aceita em chaves.
+        return f'{self.PREFIXO}:{hashlib.sha256(chave.encode()).hexdigest()}'
+
+    def _timeout(self, chaves):
+        # Tempo para o balde mais lento encher de novo: depois disso, a
+        # chave ausente equivale a um balde cheio.
+        return max(int(capacidade / taxa) + 1 for capacidade, taxa in chaves.values())
+
+
+_limitador = None
+_limitador_lock = threading.Lock()
+_bloqueios = {}  # e-mail normalizado -> [tentativas ainda não registradas, último registro, e-mail digitado]
+_bloqueios_lock = threading.Lock()
+_temporizador = None
+
+
+def obter_limitador():
+    global _limitador
+    with _limitador_lock:
+        if _limitador is None:
+            config = configuracao()
+            _limitador = import_string(config['BACKEND'])(
+                cache=config['CACHE'], maximo_chaves=config['MAXIMO_CHAVES'],
+            )
+        return _limitador
+
+
+def reiniciar_limitador():
+    global _limitador, _temporizador
+    with _limitador_lock:
+        if _limitador is not None:
+            _limitador.limpar()
+        _limitador = None
+    with _bloqueios_lock:
+        _bloqueios.clear()
+        if _temporizador is not None:
+            _temporizador.cancel()
+            _temporizador = None
+
+
+def ip_do_cliente(request):
+    if configuracao()['CONFIAR_X_FORWARDED_FOR']:
+        encaminhado = request.META.get('HTTP_X_FORWARDED_FOR', '')
+        if encaminhado:
+            return encaminhado.split(',')[0].strip()
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def _baldes(email, ip):
+    config = configuracao()
+    baldes = [(f'ip:{ip}', config['CAPACIDADE_IP'], config['TAXA_IP'] / 60)]
+    if email:
+        baldes.append((f'email:{email}', config['CAPACIDADE_EMAIL'], config['TAXA_EMAIL'] / 60))
+    return baldes
+
+
+def _normalizar(email):
+    return str(email).strip().lower() if email else ''
+
+
+def email_da_requisicao(request):
+    # O corpo pode ser JSON que não é objeto (ex.: uma lista): sem e-mail.
+    dados = request.data
+    return dados.get('email') if isinstance(dados, Mapping) else None
+
+
+def tentar(email, ip):
+    # Chamado antes de verificar a senha. Retorna 0 se a tentativa pode
+    # seguir, ou os segundos de espera (e registra o bloqueio).
+    if not configuracao()['HABILITADO']:
+        return 0
+    normalizado = _normalizar(email)
+    espera = obter_limitador().consumir(_baldes(normalizado, ip), time.time())
+    if espera and normalizado:
+        _registrar_bloqueio(normalizado, str(email).strip())
+    return espera
+
+
+def sucesso(email, ip):
+    # Login válido: devolve as fichas gastas por esta tentativa.
+    if configuracao()['HABILITADO']:
+        obter_limitador().devolver(_baldes(_normalizar(email), ip), time.time())
+
+
+def _registrar_bloqueio(email, digitado):
+    # A primeira recusa do intervalo é registrada na hora; as seguintes
+    # esperam o temporizador. Toda entrada nova agenda o temporizador, que
+    # também apaga as entradas cujo intervalo acabou sem novas recusas.
+    agora = time.monotonic()
+    intervalo = configuracao()['INTERVALO_AGREGACAO']
+    with _bloqueios_lock:
+        pendente = _bloqueios.setdefault(email, [0, None, digitado])
+        pendente[0] += 1
+        if pendente[1] is not None and agora - pendente[1] < intervalo:
+            _agendar(pendente[1] + intervalo - agora)
+            return
+        tentativas, pendente[:2] = pendente[0], [0, agora]
+        _agendar(intervalo)
+    _registrar_tentativas(digitado, tentativas)
+
+
+def descarregar_bloqueios(agora=None, forcar=False):
+    # Registra as tentativas pendentes dos e-mails cujo intervalo já
+    # terminou (de todos, com forcar=True) e reagenda o temporizador para
+    # os que faltam. Retorna quantos e-mails foram registrados.
+    global _temporizador
+    agora = time.monotonic() if agora is None else agora
+    intervalo = configuracao()['INTERVALO_AGREGACAO']
+    prontos = []
+    with _bloqueios_lock:
+        _temporizador = None
+        proximo = None
+        for email, pendente in list(_bloqueios.items()):
+            restante = pendente[1] + intervalo - agora
+            if not pendente[0] and restante <= 0:
+                del _bloqueios[email]  # intervalo acabou sem recusas
+                continue
+            if pendente[0] and (forcar or restante <= 0):
+                prontos.append((pendente[2], pendente[0]))
+                pendente[:2] = [0, agora]
+                restante = intervalo
+            proximo = restante if proximo is None else min(proximo, restante)
+        if proximo is not None and not forcar:
+            _agendar(proximo)
+
+    for email, tentativas in prontos:
+        _registrar_tentativas(email, tentativas)
+    return len(prontos)
+
+
+def _agendar(espera):
+    # Chamado com _bloqueios_lock: um temporizador por vez, que ao disparar
+    # reagenda o próximo se ainda houver pendentes.
+    global _temporizador
+    if _temporizador is None:
+        _temporizador = threading.Timer(espera, _ao_disparar)
+        _temporizador.daemon = True
+        _temporizador.start()
+
+
+def _ao_disparar():
+    try:
+        descarregar_bloqueios()
+    finally:
+        # A thread do temporizador tem a sua própria conexão; não a deixa aberta.
+        connections.close_all()
+
+
+def _registrar_tentativas(email, tentativas):
+    # Busca exata (índice único), com o e-mail como foi digitado: é o mesmo
+    # critério do authenticate(), e um e-mail inexistente custa uma busca
+    # no índice, não uma varredura da tabela.
+    usuario = Usuario.objects.filter(email=email).first()
+    if usuario is not None:
+        log_event(
+            usuario=usuario,
+            tipo_evento=Evento.TipoEvento.FALHA_LOGIN,
+            descricao=f"{tentativas} tentativa(s) de login bloqueada(s) pelo limite de tentativas.",
+        )
+
+
+class LimiteDeLogin(BaseThrottle):
+
+    # Throttle do DRF para o /login/: roda em APIView.initial(), antes do
+    # serializer (e portanto antes do authenticate()).
+
+    def allow_request(self, request, view):
+        self.espera = tentar(email_da_requisicao(request), ip_do_cliente(request))
+        return not self.espera
+
+    def wait(self):
+        return self.espera
+
+
+# Não perde as recusas pendentes quando o processo termina.
+atexit.register(descarregar_bloqueios, forcar=True)
+
+
+@receiver(setting_changed)
+def _recarregar_configuracao(sender, setting, **kwargs):
+    if setting == 'UEBAX_LIMITE_LOGIN':
+        reiniciar_limitador()
@@ -0,0 +1,216 @@
+import hashlib
+import math
+import threading
+import time
+from collections import deque
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils import timezone
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+# Lista Negra de Tokens (filtro de Bloom)
+# O simple-jwt consulta a tabela BlacklistedToken a cada /token/refresh/.
+# Aqui um filtro de Bloom em memória responde primeiro: se o jti
+# certamente NÃO está na lista negra (o caso comum), o banco nem é
+# consultado; só um "talvez" (jti na lista ou falso positivo, ~1%) cai na
+# consulta original.
+#
+# O filtro é montado no primeiro uso a partir da tabela e recebe na hora
+# os tokens que este processo coloca na lista. Os que outros processos
+# colocaram entram pela sincronização incremental (ids novos da tabela),
+# feita no máximo a cada SINCRONIZAR_SEGUNDOS: esse é o atraso máximo para
+# um logout feito em outro worker valer aqui.
+#
+# No PostgreSQL e no MySQL os ids não são visíveis em ordem: um id menor
+# pode ser commitado depois de um maior já lido. Por isso a sincronização
+# relê a partir do último id visto MARGEM_SINCRONIZACAO segundos atrás
+# (pela chave primária, sem varrer a tabela) e pula os ids já lidos nessa
+# faixa. Só um logout cuja transação durou mais que a margem escapa até a
+# próxima remontagem do filtro.
+#
+# O comando limpar_tokens (ver limpar_expirados) apaga, em lotes, os
+# tokens expirados das duas tabelas; rode-o periodicamente (cron).
+
+CONFIG_PADRAO = {
+    'CAPACIDADE': 100000,           # jtis antes de o filtro ser refeito maior
+    'TAXA_FALSO_POSITIVO': 0.01,
+    'SINCRONIZAR_SEGUNDOS': 5,
+    'MARGEM_SINCRONIZACAO': 30,     # segundos de releitura dos ids recentes
+    'TAMANHO_LOTE_LIMPEZA': 1000,
+}
+
+
+def configuracao():
+    return {**CONFIG_PADRAO, **getattr(settings, 'UEBAX_LISTA_NEGRA', {})}
+
+
+class FiltroDeBloom:
+
+    # m bits e k funções de hash (hash duplo sobre um blake2b de 128 bits).
+
+    def __init__(self, capacidade, taxa_falso_positivo):
+        self.capacidade = capacidade
+        self.total_bits = max(64, math.ceil(-capacidade * math.log(taxa_falso_positivo) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.total_bits / capacidade * math.log(2)))
+        self.bits = bytearray((self.total_bits + 7) // 8)
+        self.quantidade = 0
+
+    def _posicoes(self, chave):
+        resumo = hashlib.blake2b(chave.encode(), digest_size=16).digest()
+        a = int.from_bytes(resumo[:8], 'little')
+        b = int.from_bytes(resumo[8:], 'little') | 1
+        return [(a + i * b) % self.total_bits for i in range(self.hashes)]
+
+    def adicionar(self, chave):
+        for posicao in self._posicoes(chave):
+            self.bits[posicao >> 3] |= 1 << (posicao & 7)
+        self.quantidade += 1
+
+    def __contains__(self, chave):
+        return all(self.bits[posicao >> 3] & (1 << (posicao & 7)) for posicao in self._posicoes(chave))
+
+
+class ListaNegra:
+
+    def __init__(self, capacidade, taxa_falso_positivo, sincronizar_segundos, margem_sincronizacao=0):
+        self.capacidade = capacidade
+        self.taxa_falso_positivo = taxa_falso_positivo
+        self.sincronizar_segundos = sincronizar_segundos
+        self.margem_sincronizacao = margem_sincronizacao
+        self._filtro = None
+        self._ultimo_id = 0
+        self._marcas = deque()      # (momento, maior id lido) de cada sincronização
+        self._lidos = set()         # ids já no filtro acima do piso da releitura
+        self._sincronizado_em = 0.0
+        self._lock = threading.Lock()
+
+    def pode_conter(self, jti):
+        # False: jti certamente fora da lista negra. True: consulte o banco.
+        with self._lock:
+            agora = time.monotonic()
+            if self._filtro is None:
+                self._montar(agora)
+            elif agora - self._sincronizado_em >= self.sincronizar_segundos:
+                self._sincronizar(agora)
+            return jti in self._filtro
+
+    def adicionar(self, jti):
+        with self._lock:
+            if self._filtro is not None:
+                self._filtro.adicionar(jti)
+
+    def _montar(self, agora):
+        total = BlacklistedToken.objects.count()
+        self._filtro = FiltroDeBloom(max(self.capacidade, total * 2), self.taxa_falso_positivo)
+        self._ultimo_id = 0
+        # Sem sincronização anterior, o piso é o maior id gravado antes da
+        # margem: um id ainda não visível só pode estar acima dele.
+        corte = timezone.now() - timedelta(seconds=self.margem_sincronizacao)
+        piso, recentes = 0, set()
+        linhas = BlacklistedToken.objects.order_by('id').values_list('id', 'token__jti', 'blacklisted_at')
+        for identificador, jti, colocado_em in linhas.iterator(chunk_size=5000):
+            self._filtro.adicionar(jti)
+            self._ultimo_id = identificador
+            if colocado_em < corte:
+                piso = identificador
+            else:
+                recentes.add(identificador)
+        self._marcas = deque([(agora, piso)])
+        self._lidos = {identificador for identificador in recentes if identificador > piso}
+        self._sincronizado_em = agora
+
+    def _sincronizar(self, agora):
+        # Piso: o último id visto na sincronização mais recente feita há
+        # pelo menos margem_sincronizacao segundos.
+        while len(self._marcas) > 1 and self._marcas[1][0] <= agora - self.margem_sincronizacao:
+            self._marcas.popleft()
+        piso = self._marcas[0][1]
+        novos = BlacklistedToken.objects.filter(id__gt=piso).order_by('id').values_list('id', 'token__jti')
+        for identificador, jti in novos:
+            if identificador in self._lidos:
+                continue
+            self._filtro.adicionar(jti)
+            self._lidos.add(identificador)
+            self._ultimo_id = max(self._ultimo_id, identificador)
+        self._lidos = {identificador for identificador in self._lidos if identificador > piso}
+        self._marcas.append((agora, self._ultimo_id))
+        self._sincronizado_em = agora
+        if self._filtro.quantidade > self._filtro.capacidade:
+            # Cheio demais: a taxa de falsos positivos subiria. Refaz maior.
+            self._montar(agora)
+
+
+_lista = None
+_lista_lock = threading.Lock()
+
+
+def obter_lista_negra():
+    global _lista
+    with _lista_lock:
+        if _lista is None:
+            config = configuracao()
+            _lista = ListaNegra(
+                capacidade=config['CAPACIDADE'],
+                taxa_falso_positivo=config['TAXA_FALSO_POSITIVO'],
+                sincronizar_segundos=config['SINCRONIZAR_SEGUNDOS'],
+                margem_sincronizacao=config['MARGEM_SINCRONIZACAO'],
+            )
+        return _lista
+
+
+def reiniciar_lista_negra():
+    global _lista
+    with _lista_lock:
+        _lista = None
+
+
+class RefreshTokenComFiltro(RefreshToken):
+
+    # RefreshToken do simple-jwt que consulta o filtro antes do banco.
+
+    def check_blacklist(self):
+        if obter_lista_negra().pode_conter(self.payload['jti']):
+            super().check_blacklist()
+
+    def blacklist(self):
+        resultado = super().blacklist()
+        obter_lista_negra().adicionar(self.payload['jti'])
+        return resultado
+
+
+class TokenRefreshComFiltroSerializer(TokenRefreshSerializer):
+    token_class = RefreshTokenComFiltro
+
+
+def limpar_expirados(tamanho_lote=None, simular=False):
+    # Apaga os OutstandingToken expirados (e, em cascata, os
+    # BlacklistedToken deles) em lotes, cada um na sua transação, para não
+    # segurar a trava do banco. Retorna quantos tokens foram (ou seriam)
+    # apagados. Token expirado é recusado pela assinatura/exp, então
+    # sair da lista negra não o torna válido de novo.
+    tamanho_lote = tamanho_lote or configuracao()['TAMANHO_LOTE_LIMPEZA']
+    expirados = OutstandingToken.objects.filter(expires_at__lt=timezone.now())
+    if simular:
+        return expirados.count()
+
+    total = 0
+    while True:
+        ids = list(expirados.order_by('id').values_list('id', flat=True)[:tamanho_lote])
+        if not ids:
+            return total
+        with transaction.atomic():
+            BlacklistedToken.objects.filter(token_id__in=ids).delete()
+            OutstandingToken.objects.filter(id__in=ids).delete()
+        total += len(ids)
+
+
+@receiver(setting_changed)
+def _recarregar_configuracao(sender, setting, **kwargs):
+    if setting == 'UEBAX_LISTA_NEGRA':
+        reiniciar_lista_negra()
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core import retencao
+
+
+class Command(BaseCommand):
+
+    # Retenção: move os eventos antigos da tabela viva para arquivos gzip
+    # NDJSON (um por dia) com manifesto. Ver core/retencao.py.
+
+    help = 'Arquiva (gzip NDJSON) e remove da tabela os eventos mais antigos que a retenção.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, help='Retenção em dias. Padrão: UEBAX_RETENCAO["DIAS"].')
+        parser.add_argument('--diretorio', help='Diretório do arquivo. Padrão: UEBAX_RETENCAO["DIRETORIO"].')
+        parser.add_argument('--tamanho-lote', type=int, help='Linhas por escrita/DELETE.')
+        parser.add_argument(
+            '--simular', action='store_true',
+            help='Só mostra quantos eventos seriam arquivados em cada arquivo.',
+        )
+
+    def handle(self, *args, **options):
+        if options['dias'] is not None and options['dias'] < 0:
+            raise CommandError('--dias não pode ser negativo.')
+        if options['tamanho_lote'] is not None and options['tamanho_lote'] <= 0:
+            raise CommandError('--tamanho-lote deve ser positivo.')
+
+        resumo = retencao.arquivar(
+            dias=options['dias'],
+            pasta=options['diretorio'],
+            tamanho_lote=options['tamanho_lote'],
+            simular=options['simular'],
+        )
+
+        for nome, quantidade in sorted(resumo.items()):
+            self.stdout.write(f'  {nome}: {quantidade}')
+        acao = 'seriam arquivados' if options['simular'] else 'arquivados'
+        self.stdout.write(self.style.SUCCESS(f'{sum(resumo.values())} eventos {acao}.'))
@@ -0,0 +1,93 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from core import benchmark, sintetico
+from core.models import Usuario
+
+ESCALAS = {
+    '10k': 10_000,
+    '100k': 100_000,
+    '1m': 1_000_000,
+    '10m': 10_000_000,
+}
+
+
+class Command(BaseCommand):
+
+    # Benchmarks de ingestão, regras e endpoints (ver core/benchmark.py).
+    # Por padrão cria um banco de teste descartável (como o "manage.py
+    # test"), popula com dados sintéticos na escala pedida e o destrói no
+    # fim. Com --base-comparar, termina com erro se houver regressão.
+
+    help = 'Mede latência (p50/p95/p99), consultas e memória dos caminhos quentes sobre dados sintéticos.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--escala', choices=ESCALAS, default='10k', help='Quantidade de eventos (padrão: 10k).')
+        parser.add_argument('--usuarios', type=int, help='Usuários sintéticos (padrão: eventos / 100).')
+        parser.add_argument('--amostras', type=int, default=50, help='Amostras cronometradas por caso (padrão: 50).')
+        parser.add_argument('--casos', nargs='+', choices=[caso.nome for caso in benchmark.CASOS], help='Só estes casos.')
+        parser.add_argument('--semente', type=int, default=42)
+        parser.add_argument('--base-salvar', metavar='ARQUIVO', help='Grava o resultado como nova base (JSON).')
+        parser.add_argument('--base-comparar', metavar='ARQUIVO', help='Compara com a base (JSON) e falha se regredir.')
+        parser.add_argument(
+            '--tolerancia', type=float, default=0.25,
+            help='Folga de latência sobre a base, em fração (padrão: 0.25).',
+        )
+        parser.add_argument(
+            '--usar-banco-atual', action='store_true',
+            help='Mede no banco configurado, sem criar um banco de teste (popula só se ainda não houver dados sintéticos).',
+        )
+
+    def handle(self, *args, **options):
+        if options['amostras'] <= 0:
+            raise CommandError('--amostras deve ser positivo.')
+        base = benchmark.ler_base(options['base_comparar']) if options['base_comparar'] else None
+
+        if options['usar_banco_atual']:
+            resultados = self._rodar(options)
+        else:
+            setup_test_environment()
+            nome_original = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+            try:
+                resultados = self._rodar(options)
+            finally:
+                connection.creation.destroy_test_db(nome_original, verbosity=0)
+                teardown_test_environment()
+
+        self._relatorio(resultados)
+        if options['base_salvar']:
+            benchmark.gravar_base(options['base_salvar'], options['escala'], resultados)
+            self.stdout.write(f"Base gravada em {options['base_salvar']}.")
+
+        if base is not None:
+            if base.get('escala') != options['escala']:
+                self.stderr.write(f"Aviso: base medida na escala {base.get('escala')}, não {options['escala']}.")
+            regressoes = benchmark.comparar(resultados, base, options['tolerancia'])
+            if regressoes:
+                raise CommandError('Regressões de desempenho:\n  ' + '\n  '.join(regressoes))
+            self.stdout.write(self.style.SUCCESS('Sem regressões em relação à base.'))
+
+    def _rodar(self, options):
+        eventos = ESCALAS[options['escala']]
+        usuarios = options['usuarios'] or max(10, eventos // 100)
+
+        if Usuario.objects.filter(email=sintetico.email(0)).exists():
+            # Banco atual já populado por uma execução anterior
+            self.stdout.write('Reutilizando os dados sintéticos já existentes.')
+            return benchmark.executar(options['amostras'], options['casos'])
+
+        inicio = time.perf_counter()
+        sintetico.popular(usuarios, eventos, alertas=max(1, eventos // 100), semente=options['semente'])
+        self.stdout.write(
+            f'Dados sintéticos: {usuarios} usuários, {eventos} eventos ({time.perf_counter() - inicio:.1f}s).'
+        )
+        return benchmark.executar(options['amostras'], options['casos'])
+
+    def _relatorio(self, resultados):
+        colunas = ('p50_ms', 'p95_ms', 'p99_ms', 'vazao_por_s', 'consultas', 'pico_memoria_kb')
+        self.stdout.write(f"{'caso':<18}" + ''.join(f'{coluna:>16}' for coluna in colunas))
+        for nome, valores in resultados.items():
+            self.stdout.write(f'{nome:<18}' + ''.join(f'{valores[coluna]!s:>16}' for coluna in colunas))
@@ -0,0 +1,63 @@
+import asyncio
+import signal
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import coletor
+
+
+def _endereco(texto):
+    host, _, porta = texto.rpartition(':')
+    try:
+        return host or '0.0.0.0', int(porta)
+    except ValueError:
+        raise CommandError(f'Endereço inválido: {texto!r} (use HOST:PORTA).')
+
+
+class Command(BaseCommand):
+
+    # Coletor de longa duração (ver core/coletor.py): segue arquivos de log
+    # e/ou escuta syslog por UDP/TCP, converte as linhas em Eventos com o
+    # parser escolhido e grava em lotes. Pare com Ctrl+C ou SIGTERM: a fila
+    # é esvaziada e os offsets dos arquivos são gravados antes de sair.
+
+    help = 'Coleta eventos de arquivos de log e de syslog (UDP/TCP) e os grava em lotes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--arquivo', action='append', default=[], help='Arquivo a seguir (pode repetir).')
+        parser.add_argument('--udp', action='append', default=[], metavar='HOST:PORTA', help='Escuta syslog UDP (pode repetir).')
+        parser.add_argument('--tcp', action='append', default=[], metavar='HOST:PORTA', help='Escuta syslog TCP, uma mensagem por linha (pode repetir).')
+        parser.add_argument('--parser', default='sshd', help='Parser das linhas (UEBAX_COLETOR["PARSERS"]). Padrão: sshd.')
+        parser.add_argument('--estado', help='Arquivo com os offsets dos arquivos. Padrão: UEBAX_COLETOR["ARQUIVO_ESTADO"].')
+        parser.add_argument('--do-inicio', action='store_true', help='Sem offset gravado, lê os arquivos desde o início (padrão: só linhas novas).')
+        parser.add_argument('--tamanho-lote', type=int, help='Linhas por gravação. Padrão: UEBAX_COLETOR["TAMANHO_LOTE"].')
+        parser.add_argument('--relatorio', type=float, help='Segundos entre relatórios de vazão. Padrão: UEBAX_COLETOR["INTERVALO_RELATORIO"].')
+
+    def handle(self, *args, **options):
+        if not (options['arquivo'] or options['udp'] or options['tcp']):
+            raise CommandError('Informe ao menos uma fonte: --arquivo, --udp ou --tcp.')
+        if options['tamanho_lote'] is not None and options['tamanho_lote'] <= 0:
+            raise CommandError('--tamanho-lote deve ser positivo.')
+        try:
+            parser = coletor.obter_parser(options['parser'])
+        except ValueError as erro:
+            raise CommandError(str(erro))
+
+        instancia = coletor.Coletor(arquivo_estado=options['estado'], tamanho_lote=options['tamanho_lote'])
+        for caminho in options['arquivo']:
+            instancia.seguir_arquivo(caminho, parser, do_inicio=options['do_inicio'])
+        for endereco in options['udp']:
+            instancia.ouvir_udp(*_endereco(endereco), parser)
+        for endereco in options['tcp']:
+            instancia.ouvir_tcp(*_endereco(endereco), parser)
+
+        fontes = options['arquivo'] + [f'udp://{e}' for e in options['udp']] + [f'tcp://{e}' for e in options['tcp']]
+        self.stdout.write(f"Coletando de {', '.join(fontes)} (parser {options['parser']}). Ctrl+C para parar.")
+        asyncio.run(self._executar(instancia, options['relatorio']))
+        self.stdout.write(self.style.SUCCESS(f'Coletor encerrado: {instancia.resumo()}'))
+
+    async def _executar(self, instancia, intervalo_relatorio):
+        loop = asyncio.get_running_loop()
+        for sinal in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sinal, instancia.parar)
+        await instancia.executar(relatar=self.stdout.write, intervalo_relatorio=intervalo_relatorio)
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core import lista_negra
+
+
+class Command(BaseCommand):
+
+    # Mantém as tabelas OutstandingToken/BlacklistedToken do simple-jwt
+    # limitadas: apaga os tokens já expirados, em lotes. Agende (ex.: cron
+    # diário). Ver core/lista_negra.py.
+
+    help = 'Apaga em lotes os tokens JWT expirados (pendentes e da lista negra).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tamanho-lote', type=int, help='Tokens por DELETE. Padrão: UEBAX_LISTA_NEGRA["TAMANHO_LOTE_LIMPEZA"].')
+        parser.add_argument('--simular', action='store_true', help='Só conta os tokens expirados.')
+
+    def handle(self, *args, **options):
+        if options['tamanho_lote'] is not None and options['tamanho_lote'] <= 0:
+            raise CommandError('--tamanho-lote deve ser positivo.')
+
+        total = lista_negra.limpar_expirados(tamanho_lote=options['tamanho_lote'], simular=options['simular'])
+        acao = 'seriam apagados' if options['simular'] else 'apagados'
+        self.stdout.write(self.style.SUCCESS(f'{total} tokens expirados {acao}.'))
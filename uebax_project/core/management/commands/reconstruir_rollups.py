@@ -0,0 +1,76 @@
+from datetime import datetime, time, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min
+from django.utils import timezone
+
+from core import retencao, rollups
+from core.models import Evento, Alerta
+
+
+class Command(BaseCommand):
+
+    # Reconstrói (ou preenche pela primeira vez) os rollups por hora a partir
+    # dos eventos e alertas brutos, processando um bloco de tempo por vez.
+    # Os rollups de eventos anteriores ao corte do arquivo (arquivar_eventos)
+    # são preservados: os eventos brutos dessas horas não estão mais na tabela.
+
+    help = 'Reconstrói os rollups por hora de eventos e alertas a partir dos dados brutos.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--inicio', help='Data inicial (AAAA-MM-DD, fuso local). Padrão: evento mais antigo.')
+        parser.add_argument('--fim', help='Data final inclusiva (AAAA-MM-DD, fuso local). Padrão: hoje.')
+        parser.add_argument(
+            '--horas-por-bloco', type=int, default=24,
+            help='Tamanho de cada bloco processado, em horas (padrão: 24).',
+        )
+
+    def handle(self, *args, **options):
+        if options['horas_por_bloco'] <= 0:
+            raise CommandError('--horas-por-bloco deve ser positivo.')
+
+        inicio = self._data(options['inicio']) if options['inicio'] else self._mais_antigo()
+        if inicio is None:
+            self.stdout.write('Nenhum evento ou alerta encontrado.')
+            return
+        if options['fim']:
+            fim = self._data(options['fim']) + timedelta(days=1)
+        else:
+            fim = self._data(timezone.localdate().isoformat()) + timedelta(days=1)
+
+        bloco = timedelta(hours=options['horas_por_bloco'])
+        inicio = rollups.inicio_da_hora(inicio)
+        total_eventos = total_alertas = 0
+
+        atual = inicio
+        while atual < fim:
+            proximo = min(atual + bloco, fim)
+            linhas_eventos, linhas_alertas = rollups.reconstruir(atual, proximo)
+            total_eventos += linhas_eventos
+            total_alertas += linhas_alertas
+            atual = proximo
+
+        marca = retencao.arquivado_ate()
+        if marca is not None and inicio < marca:
+            self.stdout.write(
+                f'Eventos arquivados até {timezone.localtime(marca):%Y-%m-%d %H:%M}: '
+                'os rollups de eventos até ali foram mantidos.'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Rollups reconstruídos: {total_eventos} linhas de eventos, {total_alertas} linhas de alertas.'
+        ))
+
+    def _data(self, valor):
+        try:
+            dia = datetime.strptime(valor, '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError(f'Data inválida: {valor} (use AAAA-MM-DD).')
+        return timezone.make_aware(datetime.combine(dia, time.min))
+
+    def _mais_antigo(self):
+        candidatos = [
+            Evento.objects.aggregate(m=Min('timestamp'))['m'],
+            Alerta.objects.aggregate(m=Min('timestamp'))['m'],
+        ]
+        candidatos = [c for c in candidatos if c is not None]
+        return min(candidatos) if candidatos else None
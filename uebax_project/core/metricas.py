@@ -0,0 +1,296 @@
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+from rest_framework.renderers import JSONRenderer
+
+logger = logging.getLogger(__name__)
+
+# Métricas (formato de texto do Prometheus)
+# Um registro em memória, por processo, com contadores e histogramas
+# rotulados. O MetricasMiddleware mede cada requisição por view (latência,
+# número e tempo das consultas SQL via connection.execute_wrapper); o motor
+# de regras e o renderizador JSON registram o seu próprio tempo. Tudo é
+# exposto em /metrics/ para o Prometheus coletar.
+#
+# Requisições mais lentas que LIMITE_LENTO_MS geram um aviso no log
+# "core.metricas" com as consultas SQL mais demoradas daquela requisição.
+# As views de VIEWS_SEM_LOG_LENTO ficam de fora: o hash da senha (PBKDF2)
+# sozinho já passa do limite, e todo login viraria um aviso.
+#
+# /metrics/ só responde com "Authorization: Bearer <TOKEN>" ou para um
+# usuário staff logado; sem TOKEN configurado, só staff.
+
+CONFIG_PADRAO = {
+    'HABILITADO': True,
+    'LIMITE_LENTO_MS': 500,
+    'MAXIMO_SQL_NO_LOG': 5,   # consultas mais lentas listadas no log
+    'VIEWS_SEM_LOG_LENTO': (
+        'token_obtain_pair', 'async-login', 'register', 'password_reset_confirm',
+    ),
+    'TOKEN': None,
+}
+
+BALDES_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BALDES_CONSULTAS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+
+def configuracao():
+    return {**CONFIG_PADRAO, **getattr(settings, 'UEBAX_METRICAS', {})}
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _rotulos(nomes, valores, extra=()):
+    pares = list(zip(nomes, valores)) + list(extra)
+    if not pares:
+        return ''
+    return '{' + ','.join(f'{nome}="{_escapar(valor)}"' for nome, valor in pares) + '}'
+
+
+def _numero(valor):
+    return repr(float(valor)) if not float(valor).is_integer() else str(int(valor))
+
+
+class Contador:
+
+    tipo = 'counter'
+
+    def __init__(self, nome, ajuda, rotulos=()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self._valores = defaultdict(float)
+
+    def inc(self, valor=1, **rotulos):
+        self._valores[tuple(rotulos[r] for r in self.rotulos)] += valor
+
+    def valor(self, **rotulos):
+        return self._valores.get(tuple(rotulos[r] for r in self.rotulos), 0)
+
+    def linhas(self):
+        for chave, valor in sorted(self._valores.items()):
+            yield f'{self.nome}{_rotulos(self.rotulos, chave)} {_numero(valor)}'
+
+
+class Histograma:
+
+    tipo = 'histogram'
+
+    def __init__(self, nome, ajuda, rotulos=(), baldes=BALDES_SEGUNDOS):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self.baldes = tuple(baldes)
+        self._series = {}
+
+    def observar(self, valor, **rotulos):
+        chave = tuple(rotulos[r] for r in self.rotulos)
+        serie = self._series.get(chave)
+        if serie is None:
+            serie = self._series[chave] = {'baldes': [0] * len(self.baldes), 'soma': 0.0, 'contagem': 0}
+        for i, limite in enumerate(self.baldes):
+            if valor <= limite:
+                serie['baldes'][i] += 1
+        serie['soma'] += valor
+        serie['contagem'] += 1
+
+    def contagem(self, **rotulos):
+        serie = self._series.get(tuple(rotulos[r] for r in self.rotulos))
+        return serie['contagem'] if serie else 0
+
+    def linhas(self):
+        for chave, serie in sorted(self._series.items()):
+            for limite, quantidade in zip(self.baldes, serie['baldes']):
+                yield f"{self.nome}_bucket{_rotulos(self.rotulos, chave, [('le', _numero(limite))])} {quantidade}"
+            yield f"{self.nome}_bucket{_rotulos(self.rotulos, chave, [('le', '+Inf')])} {serie['contagem']}"
+            yield f"{self.nome}_sum{_rotulos(self.rotulos, chave)} {_numero(serie['soma'])}"
+            yield f"{self.nome}_count{_rotulos(self.rotulos, chave)} {serie['contagem']}"
+
+
+class Registro:
+
+    # Conjunto de métricas do processo. Todas as escritas passam pelo lock.
+
+    def __init__(self):
+        self._metricas = {}
+        self._lock = threading.Lock()
+
+    def _obter(self, classe, nome, ajuda, **opcoes):
+        with self._lock:
+            metrica = self._metricas.get(nome)
+            if metrica is None:
+                metrica = self._metricas[nome] = classe(nome, ajuda, **opcoes)
+            return metrica
+
+    def contador(self, nome, ajuda, rotulos=()):
+        return self._obter(Contador, nome, ajuda, rotulos=rotulos)
+
+    def histograma(self, nome, ajuda, rotulos=(), baldes=BALDES_SEGUNDOS):
+        return self._obter(Histograma, nome, ajuda, rotulos=rotulos, baldes=baldes)
+
+    def inc(self, metrica, valor=1, **rotulos):
+        with self._lock:
+            metrica.inc(valor, **rotulos)
+
+    def observar(self, metrica, valor, **rotulos):
+        with self._lock:
+            metrica.observar(valor, **rotulos)
+
+    def exportar(self):
+        linhas = []
+        with self._lock:
+            for nome in sorted(self._metricas):
+                metrica = self._metricas[nome]
+                linhas.append(f'# HELP {nome} {metrica.ajuda}')
+                linhas.append(f'# TYPE {nome} {metrica.tipo}')
+                linhas.extend(metrica.linhas())
+        return '\n'.join(linhas) + '\n'
+
+    def limpar(self):
+        with self._lock:
+            for metrica in self._metricas.values():
+                if isinstance(metrica, Contador):
+                    metrica._valores.clear()
+                else:
+                    metrica._series.clear()
+
+
+registro = Registro()
+
+REQUISICOES = registro.contador(
+    'uebax_http_requisicoes_total', 'Requisições HTTP por view, método e status.', ('view', 'metodo', 'status'))
+DURACAO = registro.histograma(
+    'uebax_http_duracao_segundos', 'Latência das requisições HTTP por view.', ('view',))
+CONSULTAS = registro.histograma(
+    'uebax_db_consultas_por_requisicao', 'Consultas SQL por requisição.', ('view',), baldes=BALDES_CONSULTAS)
+TEMPO_SQL = registro.contador(
+    'uebax_db_tempo_segundos_total', 'Tempo gasto em SQL por view.', ('view',))
+REGRAS = registro.histograma(
+    'uebax_regra_duracao_segundos', 'Tempo de avaliação de cada regra, por lote.', ('regra',))
+REGRAS_EVENTOS = registro.contador(
+    'uebax_regra_eventos_total', 'Eventos avaliados por regra.', ('regra',))
+REGRAS_ALERTAS = registro.contador(
+    'uebax_regra_alertas_total', 'Alertas gerados por regra (antes da agregação).', ('regra',))
+MOTOR = registro.histograma(
+    'uebax_motor_regras_segundos', 'Tempo do motor de regras por lote de eventos (inclui gravar alertas).')
+SERIALIZACAO = registro.histograma(
+    'uebax_serializacao_segundos', 'Tempo de renderização JSON das respostas DRF, por view.', ('view',))
+
+
+class _ContadorDeConsultas:
+
+    # execute_wrapper: conta e cronometra cada consulta da requisição.
+
+    def __init__(self):
+        self.quantidade = 0
+        self.tempo = 0.0
+        self.consultas = []
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duracao = time.perf_counter() - inicio
+            self.quantidade += 1
+            self.tempo += duracao
+            self.consultas.append((duracao, sql))
+
+
+def _nome_da_view(request):
+    correspondencia = getattr(request, 'resolver_match', None)
+    return correspondencia.view_name if correspondencia else 'nao_resolvida'
+
+
+class MetricasMiddleware:
+
+    # Mede cada requisição. Em views assíncronas o ORM roda em outras
+    # threads, então só a latência é registrada (sem contagem de SQL).
+    # Em respostas em streaming, a latência vai até o primeiro byte.
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.assincrono = iscoroutinefunction(get_response)
+        if self.assincrono:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.assincrono:
+            return self._acall(request)
+        if not configuracao()['HABILITADO']:
+            return self.get_response(request)
+
+        contador = _ContadorDeConsultas()
+        inicio = time.perf_counter()
+        with ExitStack() as pilha:
+            for alias in connections:
+                pilha.enter_context(connections[alias].execute_wrapper(contador))
+            resposta = self.get_response(request)
+        self._registrar(request, resposta, time.perf_counter() - inicio, contador)
+        return resposta
+
+    async def _acall(self, request):
+        if not configuracao()['HABILITADO']:
+            return await self.get_response(request)
+        inicio = time.perf_counter()
+        resposta = await self.get_response(request)
+        self._registrar(request, resposta, time.perf_counter() - inicio, None)
+        return resposta
+
+    def _registrar(self, request, resposta, duracao, contador):
+        view = _nome_da_view(request)
+        registro.inc(REQUISICOES, view=view, metodo=request.method, status=resposta.status_code)
+        registro.observar(DURACAO, duracao, view=view)
+        if contador is not None:
+            registro.observar(CONSULTAS, contador.quantidade, view=view)
+            registro.inc(TEMPO_SQL, contador.tempo, view=view)
+
+        config = configuracao()
+        if duracao * 1000 >= config['LIMITE_LENTO_MS'] and view not in config['VIEWS_SEM_LOG_LENTO']:
+            detalhes = ''
+            if contador is not None and contador.consultas:
+                lentas = sorted(contador.consultas, key=lambda c: c[0], reverse=True)[:config['MAXIMO_SQL_NO_LOG']]
+                detalhes = ''.join(f'\n  {d * 1000:.1f}ms {sql}' for d, sql in lentas)
+            logger.warning(
+                'Requisição lenta: %s %s (%s) em %.0fms, %s consultas SQL.%s',
+                request.method, request.path, view, duracao * 1000,
+                contador.quantidade if contador is not None else '?', detalhes,
+            )
+
+
+class JSONRendererMedido(JSONRenderer):
+
+    # JSONRenderer do DRF cronometrado (métrica uebax_serializacao_segundos).
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        inicio = time.perf_counter()
+        try:
+            return super().render(data, accepted_media_type, renderer_context)
+        finally:
+            request = (renderer_context or {}).get('request')
+            view = _nome_da_view(request) if request is not None else 'desconhecida'
+            registro.observar(SERIALIZACAO, time.perf_counter() - inicio, view=view)
+
+
+def metricas_view(request):
+    # GET /metrics/ no formato de texto do Prometheus.
+    token = configuracao()['TOKEN']
+    autorizado = (
+        (token and request.headers.get('Authorization') == f'Bearer {token}')
+        or getattr(request, 'user', None) is not None and request.user.is_staff
+    )
+    if not autorizado:
+        return HttpResponseForbidden()
+    return HttpResponse(registro.exportar(), content_type='text/plain; version=0.0.4; charset=utf-8')
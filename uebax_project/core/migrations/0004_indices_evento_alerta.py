@@ -0,0 +1,37 @@
+# Generated by Django 5.2.7 on 2026-10-18 16:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_remove_usuario_cpf'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='alerta',
+            index=models.Index(fields=['timestamp'], name='alerta_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='alerta',
+            index=models.Index(fields=['tipo_alerta', 'timestamp'], name='alerta_tipo_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='alerta',
+            index=models.Index(fields=['usuario', 'tipo_alerta', 'timestamp'], name='alerta_usr_tipo_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='evento',
+            index=models.Index(fields=['timestamp'], name='evento_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='evento',
+            index=models.Index(fields=['tipo_evento', 'timestamp'], name='evento_tipo_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='evento',
+            index=models.Index(fields=['usuario', 'tipo_evento', 'timestamp'], name='evento_usr_tipo_ts_idx'),
+        ),
+    ]
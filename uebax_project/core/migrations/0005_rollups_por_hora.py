@@ -0,0 +1,41 @@
+# Generated by Django 5.2.7 on 2026-10-18 16:03
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_indices_evento_alerta'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlertaRollupHora',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hora', models.DateTimeField()),
+                ('tipo_alerta', models.CharField(choices=[('ACESSO_NEGADO', 'Acesso Negado'), ('FORA_DO_HORARIO', 'Acesso fora do horário'), ('FALHA_LOGIN_MULTIPLA', 'Múltiplas falhas de login')], max_length=50)),
+                ('total', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('hora', 'tipo_alerta'), name='alerta_rollup_unico')],
+            },
+        ),
+        migrations.CreateModel(
+            name='EventoRollupHora',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hora', models.DateTimeField()),
+                ('tipo_evento', models.CharField(choices=[('LOGIN', 'Login'), ('LOGOUT', 'Logout'), ('ACESSO_ARQUIVO', 'Acesso a Arquivo'), ('FALHA_LOGIN', 'Falha de Login')], max_length=20)),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['tipo_evento', 'hora'], name='evento_rollup_tipo_hora_idx')],
+                'constraints': [models.UniqueConstraint(fields=('hora', 'tipo_evento', 'usuario'), name='evento_rollup_unico')],
+            },
+        ),
+    ]
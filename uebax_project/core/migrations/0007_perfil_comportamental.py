@@ -0,0 +1,41 @@
+# Generated by Django 5.2.7 on 2026-10-18 16:16
+
+import core.models
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_timestamp_default_now'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='alerta',
+            name='tipo_alerta',
+            field=models.CharField(choices=[('ACESSO_NEGADO', 'Acesso Negado'), ('FORA_DO_HORARIO', 'Acesso fora do horário'), ('FALHA_LOGIN_MULTIPLA', 'Múltiplas falhas de login'), ('COMPORTAMENTO_ANOMALO', 'Comportamento anômalo')], max_length=50),
+        ),
+        migrations.AlterField(
+            model_name='alertarolluphora',
+            name='tipo_alerta',
+            field=models.CharField(choices=[('ACESSO_NEGADO', 'Acesso Negado'), ('FORA_DO_HORARIO', 'Acesso fora do horário'), ('FALHA_LOGIN_MULTIPLA', 'Múltiplas falhas de login'), ('COMPORTAMENTO_ANOMALO', 'Comportamento anômalo')], max_length=50),
+        ),
+        migrations.CreateModel(
+            name='PerfilComportamental',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_eventos', models.PositiveIntegerField(default=0)),
+                ('histograma_horas', models.JSONField(default=core.models._histograma_vazio)),
+                ('frequencia_tipos', models.JSONField(default=dict)),
+                ('ultimo_evento_em', models.DateTimeField(blank=True, null=True)),
+                ('intervalos', models.PositiveIntegerField(default=0)),
+                ('intervalo_media', models.FloatField(default=0.0)),
+                ('intervalo_m2', models.FloatField(default=0.0)),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+                ('usuario', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='perfil_comportamental', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.7 on 2026-10-18 16:22
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def preencher_ultima_ocorrencia(apps, schema_editor):
+    # Alertas antigos: uma ocorrência só, a própria.
+    Alerta = apps.get_model('core', 'Alerta')
+    Alerta.objects.filter(ultima_ocorrencia__isnull=True).update(ultima_ocorrencia=F('timestamp'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_perfil_comportamental'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='alerta',
+            name='ocorrencias',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='alerta',
+            name='ultima_ocorrencia',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(preencher_ultima_ocorrencia, migrations.RunPython.noop),
+    ]
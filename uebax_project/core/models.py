@@ -67,6 +67,16 @@ class ResetPasswordToken(models.Model):
         
         super().save(*args, **kwargs) 
 
+    @classmethod
+    def emitir(cls, usuario):
+        # Cria ou renova o token do usuário num único INSERT ... ON CONFLICT
+        # (em vez de get_or_create + save).
+        token = cls(usuario=usuario, token=str(random.randint(100000, 999999)), created_at=timezone.now())
+        cls.objects.bulk_create(
+            [token], update_conflicts=True, unique_fields=['usuario'], update_fields=['token', 'created_at'],
+        )
+        return token
+
     def is_expired(self):
         return timezone.now() > self.created_at + timedelta(minutes=5)
 
@@ -88,11 +98,20 @@ class Evento(models.Model):
 
     usuario = models.ForeignKey(Usuario, on_delete=models.CASCADE, related_name='eventos')
     tipo_evento = models.CharField(max_length=20, choices=TipoEvento.choices)
-    timestamp = models.DateTimeField(auto_now_add=True) 
+    # default (e não auto_now_add) para que gravações em lote preservem o
+    # momento em que o evento aconteceu.
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
     descricao = models.TextField(blank=True, null=True) 
 
     class Meta:
         ordering = ['-timestamp'] 
+        # Índices usados pelo dashboard (intervalo do dia), pelos filtros
+        # por tipo e pela Regra 2 (falhas recentes de um usuário).
+        indexes = [
+            models.Index(fields=['timestamp'], name='evento_ts_idx'),
+            models.Index(fields=['tipo_evento', 'timestamp'], name='evento_tipo_ts_idx'),
+            models.Index(fields=['usuario', 'tipo_evento', 'timestamp'], name='evento_usr_tipo_ts_idx'),
+        ]
 
     def __str__(self):
         return f"[{self.timestamp}] {self.usuario.email} - {self.tipo_evento}"
@@ -105,14 +124,89 @@ class Alerta(models.Model):
         ACESSO_NEGADO = 'ACESSO_NEGADO', 'Acesso Negado'
         FORA_DO_HORARIO = 'FORA_DO_HORARIO', 'Acesso fora do horário'
         FALHA_LOGIN_MULTIPLA = 'FALHA_LOGIN_MULTIPLA', 'Múltiplas falhas de login'
+        COMPORTAMENTO_ANOMALO = 'COMPORTAMENTO_ANOMALO', 'Comportamento anômalo'
 
     usuario = models.ForeignKey(Usuario, on_delete=models.CASCADE, related_name='alertas')
     tipo_alerta = models.CharField(max_length=50, choices=TipoAlerta.choices)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
     descricao_detalhada = models.TextField()
 
+    # timestamp é a primeira ocorrência. Repetições dentro da janela de
+    # supressão só incrementam o contador (ver core/alertas.py).
+    ocorrencias = models.PositiveIntegerField(default=1)
+    ultima_ocorrencia = models.DateTimeField(null=True, blank=True)
+
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['timestamp'], name='alerta_ts_idx'),
+            models.Index(fields=['tipo_alerta', 'timestamp'], name='alerta_tipo_ts_idx'),
+            models.Index(fields=['usuario', 'tipo_alerta', 'timestamp'], name='alerta_usr_tipo_ts_idx'),
+        ]
 
     def __str__(self):
         return f"ALERTA: {self.usuario.email} - {self.tipo_alerta}"
+
+def _histograma_vazio():
+    return [0] * 24
+
+class PerfilComportamental(models.Model):
+
+    # Linha de base (baseline) do comportamento de um usuário, mantida
+    # incrementalmente a cada evento (ver core/baseline.py):
+    #   - histograma de eventos por hora do dia (fuso local)
+    #   - frequência de cada tipo de evento
+    #   - média/variância do log do intervalo entre eventos (Welford)
+
+    usuario = models.OneToOneField(Usuario, on_delete=models.CASCADE, related_name='perfil_comportamental')
+    total_eventos = models.PositiveIntegerField(default=0)
+    histograma_horas = models.JSONField(default=_histograma_vazio)
+    frequencia_tipos = models.JSONField(default=dict)
+    ultimo_evento_em = models.DateTimeField(null=True, blank=True)
+    intervalos = models.PositiveIntegerField(default=0)
+    intervalo_media = models.FloatField(default=0.0)
+    intervalo_m2 = models.FloatField(default=0.0)
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Perfil de {self.usuario_id} ({self.total_eventos} eventos)"
+
+# Tabelas de Agregação (Rollups)
+
+class EventoRollupHora(models.Model):
+
+    # Contagem pré-agregada de eventos por hora × tipo × usuário.
+    # Mantida incrementalmente pelo log_event (ver core/rollups.py).
+    # "hora" é o início da hora em UTC.
+
+    hora = models.DateTimeField()
+    tipo_evento = models.CharField(max_length=20, choices=Evento.TipoEvento.choices)
+    usuario = models.ForeignKey(Usuario, on_delete=models.CASCADE, related_name='+')
+    total = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['hora', 'tipo_evento', 'usuario'], name='evento_rollup_unico'),
+        ]
+        indexes = [
+            models.Index(fields=['tipo_evento', 'hora'], name='evento_rollup_tipo_hora_idx'),
+        ]
+
+    def __str__(self):
+        return f"[{self.hora}] {self.tipo_evento} ({self.usuario_id}): {self.total}"
+
+class AlertaRollupHora(models.Model):
+
+    # Contagem pré-agregada de alertas por hora × tipo de alerta.
+
+    hora = models.DateTimeField()
+    tipo_alerta = models.CharField(max_length=50, choices=Alerta.TipoAlerta.choices)
+    total = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['hora', 'tipo_alerta'], name='alerta_rollup_unico'),
+        ]
+
+    def __str__(self):
+        return f"[{self.hora}] {self.tipo_alerta}: {self.total}"
@@ -0,0 +1,95 @@
+import base64
+from collections import OrderedDict
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class PaginacaoPorCursor(BasePagination):
+
+    # Paginação "keyset" em (-timestamp, -id).
+    # O cursor guarda o (timestamp, id) da última linha da página; a próxima
+    # página é "tudo estritamente depois dele" na ordem decrescente. Ao
+    # contrário de OFFSET, o custo não cresce com a profundidade da página.
+
+    tamanho_padrao = 50
+    tamanho_maximo = 500
+    parametro_cursor = 'cursor'
+    parametro_tamanho = 'tamanho'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.paginar(list(self.preparar(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request):
+        # Mesma coisa, buscando a página com o ORM assíncrono.
+        return self.paginar([linha async for linha in self.preparar(queryset, request)])
+
+    def preparar(self, queryset, request):
+        # Aplica ordenação, cursor e LIMIT; ainda não executa a consulta.
+        self.request = request
+        self.tamanho = self._tamanho(request)
+        posicao = self._decodificar(request.query_params.get(self.parametro_cursor))
+
+        queryset = queryset.order_by('-timestamp', '-id')
+        if posicao is not None:
+            timestamp, ultimo_id = posicao
+            queryset = queryset.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=ultimo_id))
+
+        # Uma linha a mais só para saber se existe próxima página
+        return queryset[:self.tamanho + 1]
+
+    def paginar(self, linhas):
+        self.tem_proxima = len(linhas) > self.tamanho
+        self.pagina = linhas[:self.tamanho]
+        return self.pagina
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_next_link(self):
+        if not self.tem_proxima:
+            return None
+        ultima = self.pagina[-1]
+        cursor = self._codificar(ultima.timestamp, ultima.id)
+        return replace_query_param(self.request.build_absolute_uri(), self.parametro_cursor, cursor)
+
+    def _tamanho(self, request):
+        valor = request.query_params.get(self.parametro_tamanho)
+        if valor is None:
+            return self.tamanho_padrao
+        try:
+            tamanho = int(valor)
+        except ValueError:
+            raise ValidationError({self.parametro_tamanho: 'Deve ser um número inteiro.'})
+        return max(1, min(tamanho, self.tamanho_maximo))
+
+    def _codificar(self, timestamp, ultimo_id):
+        bruto = f'{timestamp.isoformat()}|{ultimo_id}'
+        return base64.urlsafe_b64encode(bruto.encode()).decode()
+
+    def _decodificar(self, cursor):
+        if not cursor:
+            return None
+        try:
+            bruto = base64.urlsafe_b64decode(cursor.encode()).decode()
+            timestamp, ultimo_id = bruto.split('|')
+            return datetime.fromisoformat(timestamp), int(ultimo_id)
+        except (ValueError, UnicodeDecodeError):
+            raise ValidationError({self.parametro_cursor: 'Cursor inválido.'})
@@ -0,0 +1,21 @@
+import os
+
+# Ponto de entrada dos processos de trabalho ("spawn"). Este módulo não
+# importa nada do Django no topo: o processo filho o importa para achar as
+# funções antes de o Django estar configurado.
+
+
+def iniciar_worker(settings_module):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    import django
+    django.setup()
+
+
+def popular_fatia(*args, **kwargs):
+    from django.db import connections
+    from .sintetico import popular_fatia
+
+    try:
+        return popular_fatia(*args, **kwargs)
+    finally:
+        connections.close_all()
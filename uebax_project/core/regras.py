@@ -0,0 +1,389 @@
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Evento, Alerta
+from . import alertas as agregacao, baseline, broker, janelas, metricas, rollups
+
+# Motor de Regras Declarativo
+# As regras são declaradas em settings.UEBAX_REGRAS (ou num arquivo JSON
+# apontado por settings.UEBAX_REGRAS_ARQUIVO) e compiladas uma vez numa
+# tabela de despacho {tipo_evento: [regras]}. Cada evento só passa pelas
+# regras que podem casar com o seu tipo.
+#
+# Formato de uma regra:
+#   {
+#       'NOME': 'fora_do_horario',          # identificador único
+#       'TIPO': 'horario',                  # ver TIPOS_DE_REGRA (ou caminho de classe)
+#       'TIPOS_EVENTO': ['LOGIN'],          # filtro de tipo de evento
+#       'TIPO_ALERTA': 'FORA_DO_HORARIO',   # alerta gerado
+#       'SUPRESSAO_MINUTOS': 60,            # opcional (ver core/alertas.py)
+#       'UNICO_POR_USUARIO': False,         # opcional: um alerta por usuário, sem expirar
+#       ...parâmetros do tipo (HORA_INICIO, JANELA_MINUTOS, LIMITE, ...)
+#   }
+
+REGRAS_PADRAO = [
+    {
+        'NOME': 'fora_do_horario',
+        'TIPO': 'horario',
+        'TIPOS_EVENTO': [Evento.TipoEvento.LOGIN],
+        'TIPO_ALERTA': Alerta.TipoAlerta.FORA_DO_HORARIO,
+        'HORA_INICIO': 8,
+        'HORA_FIM': 18,
+        # Usa o horário aprendido do usuário quando o perfil está maduro;
+        # até lá vale a janela fixa acima.
+        'APRENDER': True,
+    },
+    {
+        # JANELA_MINUTOS e LIMITE vêm de UEBAX_JANELA_FALHAS quando omitidos.
+        # Novas falhas dentro da janela de supressão (UEBAX_ALERTAS) só
+        # incrementam as ocorrências do alerta aberto.
+        'NOME': 'falhas_de_login',
+        'TIPO': 'limite_janela',
+        'TIPOS_EVENTO': [Evento.TipoEvento.FALHA_LOGIN],
+        'TIPO_ALERTA': Alerta.TipoAlerta.FALHA_LOGIN_MULTIPLA,
+    },
+    {
+        # Linha de base por usuário (core/baseline.py). A hora do evento já
+        # é coberta por fora_do_horario (APRENDER), por isso LIMIAR_HORA 0.
+        'NOME': 'comportamento',
+        'TIPO': 'baseline',
+        'TIPOS_EVENTO': list(Evento.TipoEvento.values),
+        'TIPO_ALERTA': Alerta.TipoAlerta.COMPORTAMENTO_ANOMALO,
+        'LIMIAR_HORA': 0,
+    },
+]
+
+# Intervalo mínimo (segundos) entre verificações do arquivo de regras.
+INTERVALO_VERIFICACAO_ARQUIVO = 5
+
+
+class Regra:
+
+    # Classe base. Subclasses implementam avaliar(), que recebe só os
+    # eventos do lote cujo tipo casa com a regra e retorna os alertas
+    # (ainda não salvos) a criar.
+
+    def __init__(self, nome, tipos_evento, tipo_alerta, unico_por_usuario=False, supressao_minutos=None, **parametros):
+        self.nome = nome
+        self.tipos_evento = tuple(tipos_evento)
+        self.tipo_alerta = tipo_alerta
+        self.unico_por_usuario = unico_por_usuario
+        self.supressao_minutos = supressao_minutos
+
+    def avaliar(self, eventos):
+        raise NotImplementedError
+
+    def _alerta(self, usuario_id, descricao, timestamp=None):
+        alerta = Alerta(usuario_id=usuario_id, tipo_alerta=self.tipo_alerta, descricao_detalhada=descricao)
+        if timestamp is not None:
+            alerta.timestamp = timestamp
+        return alerta
+
+
+class RegraHorario(Regra):
+
+    # Alerta quando o evento acontece fora de [HORA_INICIO, HORA_FIM]
+    # (horas cheias, no fuso local).
+    # Com APRENDER, o horário de cada usuário vem do seu PerfilComportamental
+    # assim que ele tem MINIMO_EVENTOS: a hora é "fora do horário" quando a
+    # sua probabilidade no histograma fica abaixo de LIMIAR_HORA.
+
+    def __init__(self, hora_inicio=8, hora_fim=18, aprender=False, minimo_eventos=None, limiar_hora=None, **kwargs):
+        super().__init__(**kwargs)
+        self.hora_inicio = hora_inicio
+        self.hora_fim = hora_fim
+        self.aprender = aprender
+        self.minimo_eventos = minimo_eventos if minimo_eventos is not None else baseline.PARAMETROS_PADRAO['minimo_eventos']
+        self.limiar_hora = limiar_hora if limiar_hora is not None else baseline.PARAMETROS_PADRAO['limiar_hora']
+
+    def avaliar(self, eventos):
+        perfis = baseline.carregar_perfis({evento.usuario_id for evento in eventos}) if self.aprender else {}
+        alertas = []
+        for evento in eventos:
+            hora_do_evento = timezone.localtime(evento.timestamp).hour
+            perfil = perfis.get(evento.usuario_id)
+            if baseline.maduro(perfil, self.minimo_eventos):
+                if baseline.probabilidade_hora(perfil, hora_do_evento) < self.limiar_hora:
+                    alertas.append(self._alerta(
+                        evento.usuario_id,
+                        f"Usuário fez login fora do seu horário habitual (às {hora_do_evento}h).",
+                        evento.timestamp
+                    ))
+            elif hora_do_evento < self.hora_inicio or hora_do_evento > self.hora_fim:
+                alertas.append(self._alerta(
+                    evento.usuario_id,
+                    f"Usuário fez login fora do horário comercial (às {hora_do_evento}h).",
+                    evento.timestamp
+                ))
+        return alertas
+
+
+class RegraLimiteJanela(Regra):
+
+    # Alerta quando um usuário acumula LIMITE eventos em JANELA_MINUTOS.
+    # A contagem usa o contador de janela deslizante (core/janelas.py).
+    # Lotes (buffer, coleta) podem chegar fora de ordem: são avaliados por
+    # (timestamp, id), e eventos que já estão fora da janela do instante
+    # mais recente visto para o usuário são ignorados.
+
+    def __init__(self, janela_minutos=None, limite=None, **kwargs):
+        super().__init__(**kwargs)
+        config = janelas.configuracao()
+        self.janela_minutos = janela_minutos if janela_minutos is not None else config['JANELA_MINUTOS']
+        self.limite = limite if limite is not None else config['LIMITE']
+        self.contador = janelas.obter_contador(self.nome, self.janela_minutos * 60)
+
+    def avaliar(self, eventos):
+        eventos = sorted(eventos, key=lambda evento: (evento.timestamp, evento.id))
+        janela = self.janela_minutos * 60
+        recente_no_lote = {evento.usuario_id: evento.timestamp.timestamp() for evento in eventos}
+        primeiro_id = {}
+        for evento in eventos:
+            primeiro_id[evento.usuario_id] = min(evento.id, primeiro_id.get(evento.usuario_id, evento.id))
+
+        maior_por_usuario = {}  # usuario_id -> (contagem, momento do evento)
+        for evento in eventos:
+            chave = f'{self.nome}:{evento.usuario_id}'
+            momento = evento.timestamp.timestamp()
+            recente = max(recente_no_lote[evento.usuario_id], self.contador.mais_recente(chave) or momento)
+            if momento <= recente - janela:
+                continue
+            contagem = self.contador.registrar(
+                chave, momento, carregar_historico=self._historico(evento, primeiro_id[evento.usuario_id]),
+            )
+            if contagem > maior_por_usuario.get(evento.usuario_id, (0,))[0]:
+                maior_por_usuario[evento.usuario_id] = (contagem, evento.timestamp)
+
+        return [
+            self._alerta(usuario_id, self._descricao(contagem), momento)
+            for usuario_id, (contagem, momento) in maior_por_usuario.items()
+            if contagem >= self.limite
+        ]
+
+    def _descricao(self, contagem):
+        if self.tipos_evento == (Evento.TipoEvento.FALHA_LOGIN,):
+            return f"Detectadas {contagem} falhas de login em {self.janela_minutos} minutos."
+        return f"Detectados {contagem} eventos em {self.janela_minutos} minutos."
+
+    def _historico(self, evento, antes_do_id):
+        # Carrega do banco os eventos da janela gravados antes do lote (id
+        # menor que o primeiro do usuário no lote: os do lote são
+        # registrados um a um). Só é chamado quando o contador ainda não
+        # conhece o usuário.
+        def carregar():
+            inicio = evento.timestamp - timezone.timedelta(minutes=self.janela_minutos)
+            timestamps = Evento.objects.filter(
+                usuario_id=evento.usuario_id,
+                tipo_evento__in=self.tipos_evento,
+                timestamp__gt=inicio,
+                id__lt=antes_do_id
+            ).values_list('timestamp', flat=True)
+            return [momento.timestamp() for momento in timestamps]
+        return carregar
+
+
+class RegraBaseline(Regra):
+
+    # Compara cada evento com a linha de base do usuário e atualiza o perfil
+    # em seguida (O(1) por evento, sem reler o histórico). Parâmetros:
+    # MINIMO_EVENTOS, LIMIAR_HORA, LIMIAR_TIPO e LIMIAR_Z (ver
+    # baseline.PARAMETROS_PADRAO). Deve cobrir todos os tipos de evento,
+    # senão o perfil só aprende parte do comportamento.
+
+    def __init__(self, minimo_eventos=None, limiar_hora=None, limiar_tipo=None, limiar_z=None, **kwargs):
+        super().__init__(**kwargs)
+        informados = {
+            'minimo_eventos': minimo_eventos, 'limiar_hora': limiar_hora,
+            'limiar_tipo': limiar_tipo, 'limiar_z': limiar_z,
+        }
+        self.parametros = {
+            **baseline.PARAMETROS_PADRAO,
+            **{chave: valor for chave, valor in informados.items() if valor is not None},
+        }
+
+    def avaliar(self, eventos):
+        return [
+            self._alerta(
+                evento.usuario_id,
+                f"Evento {evento.tipo_evento} foge da linha de base do usuário: {'; '.join(motivos)}.",
+                evento.timestamp
+            )
+            for evento, motivos in baseline.processar_lote(eventos, self.parametros)
+        ]
+
+
+TIPOS_DE_REGRA = {
+    'horario': RegraHorario,
+    'limite_janela': RegraLimiteJanela,
+    'baseline': RegraBaseline,
+}
+
+
+class MotorDeRegras:
+
+    # Tabela de despacho compilada + estatísticas de tempo por regra.
+
+    def __init__(self, regras):
+        self.regras = list(regras)
+        self.despacho = defaultdict(list)
+        for regra in self.regras:
+            for tipo_evento in regra.tipos_evento:
+                self.despacho[tipo_evento].append(regra)
+
+        self._estatisticas = {
+            regra.nome: {'avaliacoes': 0, 'eventos': 0, 'alertas': 0, 'tempo_total': 0.0, 'tempo_maximo': 0.0}
+            for regra in self.regras
+        }
+        self._lock = threading.Lock()
+
+    def analisar(self, eventos):
+        # Agrupa os eventos do lote por regra e avalia cada regra uma vez.
+        eventos_por_regra = defaultdict(list)
+        for evento in eventos:
+            for regra in self.despacho.get(evento.tipo_evento, ()):
+                eventos_por_regra[regra].append(evento)
+
+        criados = []
+        # Na ordem de declaração: regras que leem o perfil comportamental
+        # rodam antes da regra que o atualiza.
+        for regra in self.regras:
+            eventos_da_regra = eventos_por_regra.get(regra)
+            if not eventos_da_regra:
+                continue
+            inicio = time.perf_counter()
+            alertas = regra.avaliar(eventos_da_regra)
+            if alertas:
+                criados.extend(gravar_alertas(alertas, regra))
+            self._medir(regra, len(eventos_da_regra), len(alertas), time.perf_counter() - inicio)
+        return criados
+
+    def estatisticas(self):
+        with self._lock:
+            return {nome: dict(valores) for nome, valores in self._estatisticas.items()}
+
+    def _medir(self, regra, eventos, alertas, duracao):
+        with self._lock:
+            valores = self._estatisticas[regra.nome]
+            valores['avaliacoes'] += 1
+            valores['eventos'] += eventos
+            valores['alertas'] += alertas
+            valores['tempo_total'] += duracao
+            valores['tempo_maximo'] = max(valores['tempo_maximo'], duracao)
+        metricas.registro.observar(metricas.REGRAS, duracao, regra=regra.nome)
+        metricas.registro.inc(metricas.REGRAS_EVENTOS, eventos, regra=regra.nome)
+        metricas.registro.inc(metricas.REGRAS_ALERTAS, alertas, regra=regra.nome)
+
+
+def gravar_alertas(alertas, regra=None):
+    # Grava os alertas gerados por uma regra, agregando repetições na
+    # janela de supressão, e atualiza os rollups. Rollups e stream só veem
+    # os alertas novos.
+    criados = agregacao.gravar(
+        alertas,
+        janela_minutos=getattr(regra, 'supressao_minutos', None),
+        sem_expirar=getattr(regra, 'unico_por_usuario', False),
+    )
+    rollups.registrar_alertas(criados)
+    broker.publicar_alertas(criados)
+    return criados
+
+
+def compilar(declaracoes):
+    # Valida as declarações e instancia as regras.
+    tipos_evento_validos = set(Evento.TipoEvento.values)
+    tipos_alerta_validos = set(Alerta.TipoAlerta.values)
+    nomes = set()
+    regras = []
+
+    for declaracao in declaracoes:
+        declaracao = dict(declaracao)
+        nome = declaracao.pop('NOME', None)
+        tipo = declaracao.pop('TIPO', None)
+        if not nome or not tipo:
+            raise ImproperlyConfigured(f'Regra sem NOME ou TIPO: {declaracao}')
+        if nome in nomes:
+            raise ImproperlyConfigured(f'Regra duplicada: {nome}')
+        nomes.add(nome)
+
+        classe = TIPOS_DE_REGRA.get(tipo) or import_string(tipo)
+        tipos_evento = declaracao.pop('TIPOS_EVENTO', [])
+        invalidos = set(tipos_evento) - tipos_evento_validos
+        if not tipos_evento or invalidos:
+            raise ImproperlyConfigured(f'Regra {nome}: TIPOS_EVENTO inválidos {sorted(invalidos) or tipos_evento}')
+        tipo_alerta = declaracao.pop('TIPO_ALERTA', None)
+        if tipo_alerta not in tipos_alerta_validos:
+            raise ImproperlyConfigured(f'Regra {nome}: TIPO_ALERTA inválido {tipo_alerta}')
+
+        parametros = {chave.lower(): valor for chave, valor in declaracao.items()}
+        regras.append(classe(nome=nome, tipos_evento=tipos_evento, tipo_alerta=tipo_alerta, **parametros))
+
+    return MotorDeRegras(regras)
+
+
+def _declaracoes():
+    arquivo = getattr(settings, 'UEBAX_REGRAS_ARQUIVO', None)
+    if arquivo:
+        with open(arquivo, encoding='utf-8') as f:
+            return json.load(f)
+    return getattr(settings, 'UEBAX_REGRAS', REGRAS_PADRAO)
+
+
+def _mtime_do_arquivo():
+    arquivo = getattr(settings, 'UEBAX_REGRAS_ARQUIVO', None)
+    if not arquivo:
+        return None
+    try:
+        return os.stat(arquivo).st_mtime
+    except OSError:
+        return None
+
+
+_motor = None
+_mtime = None
+_ultima_verificacao = 0.0
+_motor_lock = threading.Lock()
+
+
+def obter_motor():
+    # Retorna o motor compilado. Se as regras vêm de um arquivo, recompila
+    # quando o arquivo muda (verificado no máximo a cada alguns segundos).
+    global _motor, _mtime, _ultima_verificacao
+    with _motor_lock:
+        agora = time.monotonic()
+        if _motor is not None and agora - _ultima_verificacao >= INTERVALO_VERIFICACAO_ARQUIVO:
+            _ultima_verificacao = agora
+            if _mtime_do_arquivo() != _mtime:
+                _motor = None
+        if _motor is None:
+            _mtime = _mtime_do_arquivo()
+            _ultima_verificacao = agora
+            _motor = compilar(_declaracoes())
+        return _motor
+
+
+def recarregar_regras():
+    # Descarta o motor compilado; a próxima análise recompila as regras.
+    global _motor
+    with _motor_lock:
+        _motor = None
+
+
+def estatisticas():
+    # Tempo de avaliação por regra desde a última compilação.
+    return obter_motor().estatisticas()
+
+
+@receiver(setting_changed)
+def _recarregar_configuracao(sender, setting, **kwargs):
+    if setting in ('UEBAX_REGRAS', 'UEBAX_REGRAS_ARQUIVO', 'UEBAX_JANELA_FALHAS'):
+        recarregar_regras()
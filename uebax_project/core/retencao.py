@@ -0,0 +1,235 @@
+import gzip
+import json
+import os
+import threading
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Min
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Evento
+
+# Retenção e Arquivamento de Eventos
+# Eventos mais antigos que DIAS saem da tabela viva e vão para arquivos
+# gzip NDJSON em DIRETORIO, um arquivo por dia (UTC):
+#     eventos-AAAA-MM-DD.ndjson.gz
+# Cada lote é escrito (e sincronizado em disco) antes de ser apagado do
+# banco. Rodar de novo sobre o mesmo dia acrescenta um novo membro gzip ao
+# arquivo. Enquanto um lote está escrito mas ainda não apagado, seus ids
+# ficam em "pendentes" no manifesto: se a execução cair nesse meio, a
+# próxima só termina o DELETE, sem escrevê-los de novo. (Os ids não seguem
+# a ordem do timestamp, então não dá para deduzir isso de uma faixa de ids.)
+#
+# O manifesto (manifesto.json) guarda, por arquivo, o intervalo de tempo,
+# a faixa de ids e a contagem; ler() o usa para abrir só os arquivos que
+# cobrem o intervalo pedido. Os rollups por hora não são tocados, então o
+# dashboard e as séries históricas continuam completos. A marca
+# "arquivado_ate" (gravada antes do primeiro DELETE) diz até onde a tabela
+# viva pode não ter mais os eventos: rollups.reconstruir não recalcula os
+# rollups de eventos antes dela.
+
+CONFIG_PADRAO = {
+    'DIAS': 90,                 # eventos mais antigos que isso são arquivados
+    'DIRETORIO': 'arquivo',     # relativo a BASE_DIR se não for absoluto
+    'TAMANHO_LOTE': 2000,       # linhas por escrita/DELETE
+}
+
+NOME_MANIFESTO = 'manifesto.json'
+
+# Mesmas colunas da exportação de eventos (/api/events/export/)
+COLUNAS = ('id', 'timestamp', 'tipo_evento', 'usuario_id', 'usuario__email', 'descricao')
+NOMES = tuple(coluna.replace('__', '_') for coluna in COLUNAS)
+
+_manifesto_lock = threading.Lock()
+
+
+def configuracao():
+    return {**CONFIG_PADRAO, **getattr(settings, 'UEBAX_RETENCAO', {})}
+
+
+def diretorio():
+    caminho = Path(configuracao()['DIRETORIO'])
+    return caminho if caminho.is_absolute() else Path(settings.BASE_DIR) / caminho
+
+
+def ler_manifesto(pasta=None):
+    caminho = Path(pasta or diretorio()) / NOME_MANIFESTO
+    try:
+        with open(caminho, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'arquivos': {}}
+
+
+def _gravar_manifesto(pasta, manifesto):
+    # Escrita atômica: um manifesto parcial nunca fica visível.
+    caminho = Path(pasta) / NOME_MANIFESTO
+    temporario = caminho.with_suffix('.tmp')
+    with open(temporario, 'w', encoding='utf-8') as f:
+        json.dump(manifesto, f, ensure_ascii=False, indent=2, sort_keys=True)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporario, caminho)
+
+
+def arquivado_ate(pasta=None):
+    # Corte da execução mais recente de arquivar() (None se nunca rodou).
+    marca = ler_manifesto(pasta).get('arquivado_ate')
+    return parse_datetime(marca) if marca else None
+
+
+def _marcar_corte(pasta, corte):
+    with _manifesto_lock:
+        manifesto = ler_manifesto(pasta)
+        anterior = manifesto.get('arquivado_ate')
+        if anterior is None or parse_datetime(anterior) < corte:
+            manifesto['arquivado_ate'] = corte.isoformat()
+            _gravar_manifesto(pasta, manifesto)
+
+
+def _registro(linha):
+    registro = dict(zip(NOMES, linha))
+    registro['timestamp'] = registro['timestamp'].isoformat()
+    return registro
+
+
+def _corte(dias):
+    return timezone.now() - timedelta(days=dias)
+
+
+def arquivar(dias=None, pasta=None, tamanho_lote=None, simular=False):
+    # Move para o arquivo os eventos com timestamp anterior ao corte.
+    # Retorna {nome do arquivo: eventos arquivados} desta execução.
+    config = configuracao()
+    dias = config['DIAS'] if dias is None else dias
+    pasta = Path(pasta or diretorio())
+    tamanho_lote = tamanho_lote or config['TAMANHO_LOTE']
+    corte = _corte(dias)
+    antigos = Evento.objects.filter(timestamp__lt=corte)
+
+    if simular:
+        resumo = {}
+        for momento in antigos.values_list('timestamp', flat=True).iterator(chunk_size=tamanho_lote):
+            nome = _nome_do_arquivo(momento.astimezone(dt_timezone.utc).date())
+            resumo[nome] = resumo.get(nome, 0) + 1
+        return resumo
+
+    pasta.mkdir(parents=True, exist_ok=True)
+    if antigos.exists():
+        _marcar_corte(pasta, corte)
+    resumo = {}
+    while True:
+        primeiro = antigos.aggregate(m=Min('timestamp'))['m']
+        if primeiro is None:
+            return resumo
+        dia = primeiro.astimezone(dt_timezone.utc).date()
+        inicio = datetime.combine(dia, time.min, tzinfo=dt_timezone.utc)
+        fim = min(inicio + timedelta(days=1), corte)
+        nome = _nome_do_arquivo(dia)
+        resumo[nome] = resumo.get(nome, 0) + _arquivar_intervalo(pasta, nome, inicio, fim, tamanho_lote)
+
+
+def _nome_do_arquivo(dia):
+    return f'eventos-{dia.isoformat()}.ndjson.gz'
+
+
+def _arquivar_intervalo(pasta, nome, inicio, fim, tamanho_lote):
+    consulta = Evento.objects.filter(timestamp__gte=inicio, timestamp__lt=fim)
+    with _manifesto_lock:
+        entrada = ler_manifesto(pasta)['arquivos'].get(nome)
+    pendentes = entrada.get('pendentes') if entrada else None
+    if pendentes:
+        # Execução anterior interrompida entre a escrita e o DELETE: esses
+        # ids já estão no arquivo, só falta apagá-los.
+        with transaction.atomic():
+            consulta.filter(id__in=pendentes).delete()
+
+    consulta = consulta.order_by('id')
+    total = 0
+    while True:
+        linhas = list(consulta.values_list(*COLUNAS)[:tamanho_lote])
+        if not linhas:
+            break
+
+        with open(pasta / nome, 'ab') as bruto:
+            with gzip.GzipFile(fileobj=bruto, mode='ab') as f:
+                for linha in linhas:
+                    f.write((json.dumps(_registro(linha), ensure_ascii=False) + '\n').encode('utf-8'))
+            bruto.flush()
+            os.fsync(bruto.fileno())
+        _atualizar_manifesto(pasta, nome, linhas)
+
+        with transaction.atomic():
+            Evento.objects.filter(id__in=[linha[0] for linha in linhas]).delete()
+        total += len(linhas)
+
+    if total or pendentes:
+        _limpar_pendentes(pasta, nome)
+    return total
+
+
+def _atualizar_manifesto(pasta, nome, linhas):
+    inicio = min(linha[1] for linha in linhas).isoformat()
+    fim = max(linha[1] for linha in linhas).isoformat()
+    with _manifesto_lock:
+        manifesto = ler_manifesto(pasta)
+        entrada = manifesto['arquivos'].get(nome)
+        if entrada is None:
+            entrada = manifesto['arquivos'][nome] = {
+                'inicio': inicio, 'fim': fim, 'eventos': 0,
+                'id_min': linhas[0][0], 'id_max': linhas[-1][0],
+            }
+        else:
+            entrada['inicio'] = min(entrada['inicio'], inicio, key=parse_datetime)
+            entrada['fim'] = max(entrada['fim'], fim, key=parse_datetime)
+        entrada['eventos'] += len(linhas)
+        entrada['id_min'] = min(entrada['id_min'], linhas[0][0])
+        entrada['id_max'] = max(entrada['id_max'], linhas[-1][0])
+        entrada['pendentes'] = [linha[0] for linha in linhas]
+        entrada['atualizado_em'] = timezone.now().isoformat()
+        _gravar_manifesto(pasta, manifesto)
+    return entrada
+
+
+def _limpar_pendentes(pasta, nome):
+    with _manifesto_lock:
+        manifesto = ler_manifesto(pasta)
+        entrada = manifesto['arquivos'].get(nome)
+        if entrada is not None and entrada.pop('pendentes', None) is not None:
+            _gravar_manifesto(pasta, manifesto)
+
+
+def ler(inicio=None, fim=None, tipo=None, usuario_id=None, usuario_email=None, desde_id=None, pasta=None):
+    # Gera os eventos arquivados (dicts com NOMES) que casam com os filtros,
+    # abrindo só os arquivos do manifesto que cobrem [inicio, fim).
+    pasta = Path(pasta or diretorio())
+    arquivos = ler_manifesto(pasta)['arquivos']
+    for nome in sorted(arquivos):
+        entrada = arquivos[nome]
+        if inicio is not None and parse_datetime(entrada['fim']) < inicio:
+            continue
+        if fim is not None and parse_datetime(entrada['inicio']) >= fim:
+            continue
+        if desde_id is not None and entrada['id_max'] <= desde_id:
+            continue
+
+        with gzip.open(pasta / nome, 'rt', encoding='utf-8') as f:
+            for linha in f:
+                registro = json.loads(linha)
+                if tipo and registro['tipo_evento'] != tipo:
+                    continue
+                if usuario_id is not None and registro['usuario_id'] != usuario_id:
+                    continue
+                if usuario_email and registro['usuario_email'] != usuario_email:
+                    continue
+                if desde_id is not None and registro['id'] <= desde_id:
+                    continue
+                if inicio is not None or fim is not None:
+                    momento = parse_datetime(registro['timestamp'])
+                    if (inicio is not None and momento < inicio) or (fim is not None and momento >= fim):
+                        continue
+                yield registro
@@ -0,0 +1,158 @@
+from collections import Counter
+from datetime import timedelta, timezone as dt_timezone
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncHour
+
+from .models import Evento, Alerta, EventoRollupHora, AlertaRollupHora
+from . import cache_dashboard, retencao
+
+# Rollups (Agregações por Hora)
+# Em vez de varrer Evento/Alerta a cada consulta, o dashboard e as séries
+# temporais leem estas tabelas, cujo tamanho cresce com O(horas) e não
+# com O(eventos). Toda atualização aqui também invalida o cache do
+# dashboard (core/cache_dashboard.py).
+
+
+def inicio_da_hora(momento):
+    # Trunca um datetime "aware" para o início da hora, em UTC.
+    return momento.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def _somar(modelo, chave: dict, quantidade: int):
+    # Upsert portátil: tenta o UPDATE com F(); se a linha ainda não existe,
+    # cria. Se outro processo criar a linha no meio, repete o UPDATE.
+    atualizadas = modelo.objects.filter(**chave).update(total=F('total') + quantidade)
+    if atualizadas:
+        return
+    try:
+        with transaction.atomic():
+            modelo.objects.create(total=quantidade, **chave)
+    except IntegrityError:
+        modelo.objects.filter(**chave).update(total=F('total') + quantidade)
+
+
+def _somar_lote(modelo, campos, contagem):
+    # Mesmo efeito de _somar para cada chave de contagem ({(valores dos
+    # campos): quantidade}), em três instruções em vez de uma ou duas por
+    # chave: cria as linhas que faltam (total 0, conflitos ignorados),
+    # lê e trava as linhas do lote e grava os novos totais num upsert.
+    if len(contagem) == 1:
+        (valores, quantidade), = contagem.items()
+        _somar(modelo, dict(zip(campos, valores)), quantidade)
+        return
+    with transaction.atomic():
+        modelo.objects.bulk_create(
+            [modelo(total=0, **dict(zip(campos, valores))) for valores in contagem],
+            ignore_conflicts=True,
+        )
+        # Filtro por campo (IN) e o cruzamento exato em Python: um OR de
+        # chaves compostas sairia caro de compilar.
+        filtro = {f'{campo}__in': {valores[i] for valores in contagem} for i, campo in enumerate(campos)}
+        linhas = []
+        for linha in modelo.objects.select_for_update().filter(**filtro):
+            quantidade = contagem.get(tuple(getattr(linha, campo) for campo in campos))
+            if quantidade:
+                linha.total += quantidade
+                linhas.append(linha)
+        modelo.objects.bulk_create(
+            linhas, update_conflicts=True, unique_fields=list(campos), update_fields=['total'],
+        )
+
+
+def registrar_eventos(eventos):
+    # Incrementa os rollups de uma lista de eventos já gravados.
+    contagem = Counter(
+        (inicio_da_hora(evento.timestamp), evento.tipo_evento, evento.usuario_id)
+        for evento in eventos
+    )
+    if contagem:
+        _somar_lote(EventoRollupHora, ('hora', 'tipo_evento', 'usuario_id'), contagem)
+        cache_dashboard.invalidar()
+
+
+def registrar_alertas(alertas):
+    # Incrementa os rollups de uma lista de alertas já gravados.
+    contagem = Counter(
+        (inicio_da_hora(alerta.timestamp), alerta.tipo_alerta)
+        for alerta in alertas
+    )
+    if contagem:
+        _somar_lote(AlertaRollupHora, ('hora', 'tipo_alerta'), contagem)
+        cache_dashboard.invalidar()
+
+
+def reconstruir(inicio, fim):
+    # Recalcula os rollups do intervalo [inicio, fim) a partir dos dados
+    # brutos. A agregação é feita no banco; só as linhas agregadas vêm
+    # para o Python. Retorna (linhas de eventos, linhas de alertas).
+    #
+    # Eventos anteriores à marca do arquivo (retencao.arquivado_ate) já
+    # saíram da tabela: os rollups de eventos dessas horas, inclusive a
+    # hora parcial da marca, ficam como estão. Alertas não são arquivados.
+    marca = retencao.arquivado_ate()
+    inicio_eventos = inicio if marca is None else max(inicio, primeira_hora_completa(marca))
+    with transaction.atomic():
+        EventoRollupHora.objects.filter(hora__gte=inicio_eventos, hora__lt=fim).delete()
+        AlertaRollupHora.objects.filter(hora__gte=inicio, hora__lt=fim).delete()
+
+        linhas_eventos = (
+            Evento.objects.filter(timestamp__gte=inicio_eventos, timestamp__lt=fim)
+            .annotate(hora=TruncHour('timestamp', tzinfo=dt_timezone.utc))
+            .values('hora', 'tipo_evento', 'usuario_id')
+            .annotate(qtd=Count('id'))
+            .order_by()
+        )
+        novos_eventos = EventoRollupHora.objects.bulk_create(
+            EventoRollupHora(
+                hora=linha['hora'],
+                tipo_evento=linha['tipo_evento'],
+                usuario_id=linha['usuario_id'],
+                total=linha['qtd'],
+            )
+            for linha in linhas_eventos
+        )
+
+        linhas_alertas = (
+            Alerta.objects.filter(timestamp__gte=inicio, timestamp__lt=fim)
+            .annotate(hora=TruncHour('timestamp', tzinfo=dt_timezone.utc))
+            .values('hora', 'tipo_alerta')
+            .annotate(qtd=Count('id'))
+            .order_by()
+        )
+        novos_alertas = AlertaRollupHora.objects.bulk_create(
+            AlertaRollupHora(hora=linha['hora'], tipo_alerta=linha['tipo_alerta'], total=linha['qtd'])
+            for linha in linhas_alertas
+        )
+
+    cache_dashboard.invalidar(forcar=True)
+    return len(novos_eventos), len(novos_alertas)
+
+
+def primeira_hora_completa(momento):
+    # Início da primeira hora inteira a partir de "momento".
+    hora = inicio_da_hora(momento)
+    return hora if hora == momento else hora + timedelta(hours=1)
+
+
+def serie_eventos(inicio, fim, tipo_evento=None):
+    # Série temporal [(hora, total)] de eventos no intervalo, a partir dos rollups.
+    consulta = EventoRollupHora.objects.filter(hora__gte=inicio, hora__lt=fim)
+    if tipo_evento:
+        consulta = consulta.filter(tipo_evento=tipo_evento)
+    return list(
+        consulta.values('hora').annotate(total_hora=Sum('total')).order_by('hora')
+        .values_list('hora', 'total_hora')
+    )
+
+
+def serie_alertas(inicio, fim, tipo_alerta=None):
+    # Série temporal [(hora, total)] de alertas no intervalo, a partir dos rollups.
+    consulta = AlertaRollupHora.objects.filter(hora__gte=inicio, hora__lt=fim)
+    if tipo_alerta:
+        consulta = consulta.filter(tipo_alerta=tipo_alerta)
+    return list(
+        consulta.values('hora').annotate(total_hora=Sum('total')).order_by('hora')
+        .values_list('hora', 'total_hora')
+    )
@@ -1,9 +1,11 @@
 from rest_framework import serializers
 from .models import Usuario, ResetPasswordToken, Evento, Alerta
 from django.contrib.auth.password_validation import validate_password
-from rest_framework_simplejwt.tokens import RefreshToken, TokenError
+from rest_framework_simplejwt.tokens import TokenError
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from .utils import log_event
+from .autenticacao import CLAIM_VERSAO_SENHA, versao_senha
+from .lista_negra import RefreshTokenComFiltro
 
 class UserRegistrationSerializer(serializers.ModelSerializer):
     
@@ -38,17 +40,21 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
 class PasswordResetRequestSerializer(serializers.Serializer):
     
     # Serializador para a Tela 3 ("Esqueci a Senha").
-    # Apenas valida se o email existe.
+    # Valida se o email existe e devolve o usuário em validated_data.
     
     email = serializers.EmailField()
 
     def validate_email(self, value):
         try:
-            Usuario.objects.get(email=value)
+            self._usuario = Usuario.objects.get(email=value)
         except Usuario.DoesNotExist:
             raise serializers.ValidationError("E-mail Inválido")
         return value
 
+    def validate(self, data):
+        data['usuario'] = self._usuario
+        return data
+
 class PasswordResetVerifySerializer(serializers.Serializer):
     
     # Serializador para a "Tela de Verificação de Código" (Tela 4).
@@ -156,7 +162,7 @@ class LogoutSerializer(serializers.Serializer):
 
     def save(self, **kwargs):
         try:
-            RefreshToken(self.token).blacklist()
+            RefreshTokenComFiltro(self.token).blacklist()
         except TokenError:
             self.fail('bad_token')
 
@@ -165,10 +171,13 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
     # Serializer de Login (Versão E-mail).
     # Usa o padrão do Django (email/senha) e registra os eventos.
     
-    
+    token_class = RefreshTokenComFiltro
+
     @classmethod
     def get_token(cls, user):
         token = super().get_token(user)
+        # Troca de senha invalida os tokens antigos (ver core/autenticacao.py)
+        token[CLAIM_VERSAO_SENHA] = versao_senha(user)
         return token
 
     def validate(self, attrs):
@@ -206,7 +215,7 @@ class AlertaSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Alerta
-        fields = ['descricao', 'usuario_email', 'data', 'horario']
+        fields = ['descricao', 'usuario_email', 'data', 'horario', 'ocorrencias']
 
 
 class EventoSerializer(serializers.ModelSerializer):
@@ -0,0 +1,216 @@
+import random
+from datetime import datetime, time, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Usuario, Evento, Alerta
+from . import rollups
+
+# Dados Sintéticos
+# Gera usuários, eventos e alertas em massa para benchmarks e ambientes de
+# desenvolvimento. Tudo é gravado com bulk_create em lotes (sem passar pelo
+# log_event nem pelo motor de regras) e os rollups são reconstruídos no
+# fim, então o dashboard fica consistente com os dados gerados.
+# O hash da senha é calculado uma única vez e compartilhado por todos os
+# usuários: com PBKDF2 isso é a diferença entre segundos e horas.
+#
+# Há dois geradores de eventos:
+#   - criar_eventos(): eventos independentes, rápidos (usado pelos benchmarks)
+#   - popular_fatia(): fluxos realistas por usuário, com sessões de trabalho,
+#     rajadas de acesso, tempestades de falhas de login e atividade fora do
+#     horário (usado pelo comando seed_uebax, inclusive em paralelo)
+
+SENHA_PADRAO = 'SenhaForte#123'
+DOMINIO_EMAIL = 'sintetico.uebax'
+
+# Distribuição aproximada dos tipos de evento num ambiente real
+PESOS_TIPOS_EVENTO = {
+    Evento.TipoEvento.LOGIN: 40,
+    Evento.TipoEvento.LOGOUT: 35,
+    Evento.TipoEvento.FALHA_LOGIN: 10,
+    Evento.TipoEvento.ACESSO_ARQUIVO: 15,
+}
+
+
+def email(indice, prefixo='usuario'):
+    return f'{prefixo}{indice}@{DOMINIO_EMAIL}'
+
+
+def criar_usuarios(quantidade, inicio=0, senha=SENHA_PADRAO, tamanho_lote=5000, prefixo='usuario', senha_hash=None):
+    # Cria usuários email(inicio) .. email(inicio + quantidade - 1).
+    # Retorna os ids criados.
+    senha_hash = senha_hash or make_password(senha)
+    ids = []
+    for comeco in range(inicio, inicio + quantidade, tamanho_lote):
+        lote = [
+            Usuario(email=email(i, prefixo), nome_completo=f'Usuário Sintético {i}', password=senha_hash)
+            for i in range(comeco, min(comeco + tamanho_lote, inicio + quantidade))
+        ]
+        ids.extend(usuario.pk for usuario in Usuario.objects.bulk_create(lote))
+    return ids
+
+
+def _instantes(aleatorio, quantidade, fim, dias):
+    # Instantes concentrados no horário comercial (fuso local), com uma
+    # cauda noturna para exercitar as regras de horário.
+    inicio = fim - timedelta(days=dias)
+    for _ in range(quantidade):
+        dia = inicio + timedelta(days=aleatorio.randrange(dias))
+        if aleatorio.random() < 0.9:
+            hora = aleatorio.randint(8, 18)
+        else:
+            hora = aleatorio.randrange(24)
+        momento = timezone.localtime(dia).replace(hour=hora, minute=aleatorio.randrange(60), second=aleatorio.randrange(60))
+        yield min(momento, fim)
+
+
+def criar_eventos(usuario_ids, quantidade, dias=30, semente=None, tamanho_lote=5000, fim=None):
+    # Gera "quantidade" eventos distribuídos entre os usuários nos últimos
+    # "dias" dias. Não roda as regras. Retorna o intervalo (inicio, fim).
+    aleatorio = random.Random(semente)
+    fim = fim or timezone.now()
+    tipos = list(PESOS_TIPOS_EVENTO)
+    pesos = list(PESOS_TIPOS_EVENTO.values())
+
+    lote = []
+    for momento in _instantes(aleatorio, quantidade, fim, dias):
+        lote.append(Evento(
+            usuario_id=aleatorio.choice(usuario_ids),
+            tipo_evento=aleatorio.choices(tipos, pesos)[0],
+            timestamp=momento,
+        ))
+        if len(lote) >= tamanho_lote:
+            Evento.objects.bulk_create(lote)
+            lote = []
+    if lote:
+        Evento.objects.bulk_create(lote)
+    return fim - timedelta(days=dias + 1), fim
+
+
+def criar_alertas(usuario_ids, quantidade, dias=30, semente=None, tamanho_lote=5000, fim=None):
+    aleatorio = random.Random(semente)
+    fim = fim or timezone.now()
+    tipos = Alerta.TipoAlerta.values
+
+    lote = []
+    for momento in _instantes(aleatorio, quantidade, fim, dias):
+        lote.append(Alerta(
+            usuario_id=aleatorio.choice(usuario_ids),
+            tipo_alerta=aleatorio.choice(tipos),
+            descricao_detalhada='Alerta sintético.',
+            timestamp=momento,
+            ultima_ocorrencia=momento,
+        ))
+        if len(lote) >= tamanho_lote:
+            Alerta.objects.bulk_create(lote)
+            lote = []
+    if lote:
+        Alerta.objects.bulk_create(lote)
+    return fim - timedelta(days=dias + 1), fim
+
+
+def popular(usuarios, eventos, alertas, dias=30, semente=None):
+    # Atalho: usuários + eventos + alertas + rollups, numa transação.
+    # Retorna os ids dos usuários criados.
+    with transaction.atomic():
+        ids = criar_usuarios(usuarios)
+        inicio, fim = criar_eventos(ids, eventos, dias=dias, semente=semente)
+        criar_alertas(ids, alertas, dias=dias, semente=semente)
+        rollups.reconstruir(rollups.inicio_da_hora(inicio), fim + timedelta(hours=1))
+    return ids
+
+
+# Fluxos realistas
+
+PROBABILIDADES_PADRAO = {
+    'FALHA_DIGITACAO': 0.05,   # FALHA_LOGIN isolada antes do login do dia
+    'TEMPESTADE': 0.002,       # rajada de 6-30 falhas em poucos minutos (por usuário/dia)
+    'FORA_DO_HORARIO': 0.03,   # sessão entre 22h e 4h (por usuário/dia)
+    'FIM_DE_SEMANA': 0.1,      # trabalha num sábado/domingo
+}
+
+
+def _momento(dia, segundos):
+    # dia (date) + segundos desde a meia-noite local, podendo passar de 24h.
+    return timezone.make_aware(datetime.combine(dia, time.min)) + timedelta(seconds=segundos)
+
+
+def _sessao(aleatorio, usuario_id, dia, entrada, saida):
+    # LOGIN, rajadas de ACESSO_ARQUIVO e LOGOUT entre entrada e saida
+    # (segundos desde a meia-noite local).
+    yield Evento(usuario_id=usuario_id, tipo_evento=Evento.TipoEvento.LOGIN, timestamp=_momento(dia, entrada))
+    instante = entrada
+    while True:
+        instante += aleatorio.expovariate(1 / 1800)  # uma rajada a cada ~30 min
+        if instante >= saida:
+            break
+        for _ in range(aleatorio.randint(1, 8)):
+            instante += aleatorio.uniform(1, 20)
+            yield Evento(usuario_id=usuario_id, tipo_evento=Evento.TipoEvento.ACESSO_ARQUIVO, timestamp=_momento(dia, instante))
+    yield Evento(usuario_id=usuario_id, tipo_evento=Evento.TipoEvento.LOGOUT, timestamp=_momento(dia, saida))
+
+
+def fluxo_do_usuario(aleatorio, usuario_id, primeiro_dia, dias, probabilidades=PROBABILIDADES_PADRAO):
+    # Gera os eventos de um usuário, dia a dia (cada dia em ordem
+    # cronológica; a sessão noturna pode invadir a madrugada seguinte).
+    # Cada usuário tem um horário próprio de entrada e uma jornada própria.
+    entrada_habitual = aleatorio.uniform(7, 10.5) * 3600
+    jornada = aleatorio.uniform(7, 10) * 3600
+    falha = Evento.TipoEvento.FALHA_LOGIN
+
+    for deslocamento in range(dias):
+        dia = primeiro_dia + timedelta(days=deslocamento)
+        eventos = []
+
+        if dia.weekday() < 5 or aleatorio.random() < probabilidades['FIM_DE_SEMANA']:
+            entrada = max(0.0, aleatorio.gauss(entrada_habitual, 1200))
+            if aleatorio.random() < probabilidades['FALHA_DIGITACAO']:
+                eventos.append(Evento(usuario_id=usuario_id, tipo_evento=falha, timestamp=_momento(dia, entrada - 30)))
+            eventos.extend(_sessao(aleatorio, usuario_id, dia, entrada, entrada + aleatorio.gauss(jornada, 1800)))
+
+        if aleatorio.random() < probabilidades['FORA_DO_HORARIO']:
+            inicio = aleatorio.uniform(22, 28) * 3600
+            eventos.extend(_sessao(aleatorio, usuario_id, dia, inicio, inicio + aleatorio.uniform(600, 5400)))
+
+        if aleatorio.random() < probabilidades['TEMPESTADE']:
+            instante = aleatorio.uniform(0, 24) * 3600
+            for _ in range(aleatorio.randint(6, 30)):
+                instante += aleatorio.uniform(1, 15)
+                eventos.append(Evento(usuario_id=usuario_id, tipo_evento=falha, timestamp=_momento(dia, instante)))
+
+        eventos.sort(key=lambda evento: evento.timestamp)
+        yield from eventos
+
+
+def popular_fatia(inicio, quantidade, dias, semente, senha_hash, prefixo='usuario', tamanho_lote=5000, fim=None):
+    # Cria os usuários [inicio, inicio + quantidade) e os seus fluxos de
+    # eventos dos últimos "dias" dias, em lotes de bulk_create. Cada lote
+    # de usuários é uma transação. Retorna (usuários, eventos) criados.
+    fim = fim or timezone.now()
+    primeiro_dia = timezone.localtime(fim).date() - timedelta(days=dias - 1)
+    total_usuarios = total_eventos = 0
+
+    for comeco in range(inicio, inicio + quantidade, tamanho_lote):
+        tamanho = min(tamanho_lote, inicio + quantidade - comeco)
+        with transaction.atomic():
+            ids = criar_usuarios(tamanho, inicio=comeco, prefixo=prefixo, senha_hash=senha_hash, tamanho_lote=tamanho_lote)
+            lote = []
+            for deslocamento, usuario_id in enumerate(ids):
+                # Semente por usuário: o resultado não depende da divisão em workers
+                aleatorio = random.Random(f'{semente}:{comeco + deslocamento}')
+                for evento in fluxo_do_usuario(aleatorio, usuario_id, primeiro_dia, dias):
+                    if evento.timestamp > fim:
+                        continue
+                    lote.append(evento)
+                    if len(lote) >= tamanho_lote:
+                        Evento.objects.bulk_create(lote)
+                        total_eventos += len(lote)
+                        lote = []
+            if lote:
+                Evento.objects.bulk_create(lote)
+                total_eventos += len(lote)
+        total_usuarios += len(ids)
+
+    return total_usuarios, total_eventos
@@ -1,3 +1,1674 @@
-from django.test import TestCase
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+import tempfile
+import time as time_module
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError, OperationalError, connection
+from django.db.models import Sum
+from asgiref.sync import async_to_sync, sync_to_async
+from django.core import mail
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from .models import Usuario, ResetPasswordToken, Evento, Alerta, EventoRollupHora, AlertaRollupHora, PerfilComportamental
+from .serializers import CustomTokenObtainPairSerializer
+from .utils import alog_event, log_event
+from uebax_project import bancos
+
+from . import alertas, analise_vetorizada, banco, baseline, caixa_saida, cache_dashboard, benchmark, coleta, coletor, ingestao, janelas, limitacao, lista_negra, metricas, regras, retencao, rollups, sintetico, broker
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def _criar_usuario(email, nome='Usuário Teste'):
+    return Usuario.objects.create_user(email=email, password='SenhaForte#123', nome_completo=nome)
+
+
+def _criar_evento(usuario, tipo, quando):
+    # timestamp tem default=timezone.now (desde a 0006), então dá para
+    # passar o momento direto na criação.
+    return Evento.objects.create(usuario=usuario, tipo_evento=tipo, timestamp=quando)
+
+
+def _hoje_as(hora, minuto=0):
+    hoje = timezone.localdate()
+    return timezone.make_aware(datetime.combine(hoje, time(hora, minuto)))
+
+
+class UebaxTestCase(TestCase):
+
+    # Zera o estado mantido em memória pelo processo entre os testes.
+
+    def setUp(self):
+        janelas.reiniciar_contador()
+        regras.recarregar_regras()
+        alertas.reiniciar_cache()
+        metricas.registro.limpar()
+        limitacao.reiniciar_limitador()
+        caixa_saida.encerrar_caixa()
+        lista_negra.reiniciar_lista_negra()
+        coleta.reiniciar_mapa()
+        caches['default'].clear()
+
+        # Aviso de requisição lenta: só interessa a quem usa assertLogs.
+        log_lento = logging.getLogger('core.metricas')
+        self.addCleanup(log_lento.setLevel, log_lento.level)
+        log_lento.setLevel(logging.ERROR)
+
+
+class DashboardStatsViewTests(UebaxTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.admin = _criar_usuario('admin@uebax.com', 'Admin')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        self.url = reverse('dashboard-stats')
+
+    def _reconstruir(self):
+        ontem = (timezone.localdate() - timedelta(days=1)).isoformat()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('reconstruir_rollups', inicio=ontem, stdout=StringIO())
+
+    def test_cards_e_histograma(self):
+        outro = _criar_usuario('outro@uebax.com', 'Outro')
+        _criar_evento(self.admin, Evento.TipoEvento.LOGIN, _hoje_as(9))
+        _criar_evento(self.admin, Evento.TipoEvento.LOGIN, _hoje_as(9, 30))
+        _criar_evento(outro, Evento.TipoEvento.LOGIN, _hoje_as(14))
+        _criar_evento(outro, Evento.TipoEvento.LOGOUT, _hoje_as(15, 5))
+        # Evento de ontem não entra nas contagens.
+        _criar_evento(outro, Evento.TipoEvento.LOGIN, _hoje_as(10) - timedelta(days=1))
+        Alerta.objects.create(
+            usuario=outro,
+            tipo_alerta=Alerta.TipoAlerta.FORA_DO_HORARIO,
+            descricao_detalhada='teste',
+        )
+        self._reconstruir()
+
+        resposta = self.client.get(self.url)
+
+        self.assertEqual(resposta.status_code, 200)
+        cards = resposta.data['cards']
+        self.assertEqual(cards['logins_hoje'], 3)
+        self.assertEqual(cards['dispositivos_conectados'], 2)
+        self.assertEqual(cards['alertas_ativos'], 1)
+        self.assertEqual(cards['ultimo_evento'], 'Logout às 15:05')
+
+        histograma = resposta.data['grafico_logins_por_hora']['data']
+        self.assertEqual(histograma[9], 2)
+        self.assertEqual(histograma[14], 1)
+        self.assertEqual(sum(histograma), 3)
+
+    def test_status_de_conexao(self):
+        ana = _criar_usuario('ana@uebax.com', 'Ana')
+        _criar_usuario('bia@uebax.com', 'Bia')
+        log_event(ana, Evento.TipoEvento.LOGIN)
+
+        tabela = self.client.get(self.url).data['tabela_status_conexao']
+        self.assertEqual(tabela, [
+            {'nome_usuario': 'Ana', 'status': 'Ativo'},
+            {'nome_usuario': 'Admin', 'status': 'Inativo'},
+            {'nome_usuario': 'Bia', 'status': 'Inativo'},
+        ])
+
+        tabela = self.client.get(self.url, {'apenas_ativos': '1'}).data['tabela_status_conexao']
+        self.assertEqual(tabela, [{'nome_usuario': 'Ana', 'status': 'Ativo'}])
+
+        tabela = self.client.get(self.url, {'status_limite': 1, 'status_pagina': 3}).data['tabela_status_conexao']
+        self.assertEqual(tabela, [{'nome_usuario': 'Bia', 'status': 'Inativo'}])
+
+    def test_cache_e_etag(self):
+        primeira = self.client.get(self.url)
+        etag = primeira['ETag']
+
+        with self.assertNumQueries(0):
+            segunda = self.client.get(self.url)
+        self.assertEqual(segunda.data, primeira.data)
+
+        with self.assertNumQueries(0):
+            nao_modificada = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(nao_modificada.status_code, 304)
+
+        # Um novo evento invalida o cache (no commit) e muda o ETag
+        with self.captureOnCommitCallbacks(execute=True):
+            log_event(self.admin, Evento.TipoEvento.LOGIN)
+        terceira = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(terceira.status_code, 200)
+        self.assertNotEqual(terceira['ETag'], etag)
+        self.assertEqual(terceira.data['cards']['logins_hoje'], 1)
+
+    @override_settings(TIME_ZONE='Asia/Kolkata')
+    def test_fuso_de_meia_hora_conta_as_pontas_do_dia(self):
+        # +05:30: o dia local começa e termina no meio de uma hora UTC.
+        outro = _criar_usuario('outro@uebax.com', 'Outro')
+        eventos = [
+            _criar_evento(self.admin, Evento.TipoEvento.LOGIN, _hoje_as(0, 10)),
+            _criar_evento(self.admin, Evento.TipoEvento.LOGIN, _hoje_as(12)),
+            _criar_evento(outro, Evento.TipoEvento.LOGIN, _hoje_as(23, 45)),
+            # 23:50 de ontem cai na mesma hora UTC que 00:10 de hoje
+            _criar_evento(outro, Evento.TipoEvento.LOGIN, _hoje_as(23, 50) - timedelta(days=1)),
+        ]
+        rollups.registrar_eventos(eventos)
+        rollups.registrar_alertas([
+            Alerta.objects.create(
+                usuario=outro, tipo_alerta=Alerta.TipoAlerta.FORA_DO_HORARIO,
+                descricao_detalhada='teste', timestamp=quando,
+            )
+            for quando in (_hoje_as(0, 5), _hoje_as(12), _hoje_as(23, 55) - timedelta(days=1))
+        ])
+
+        dados = self.client.get(self.url).data
+        self.assertEqual(dados['cards']['logins_hoje'], 3)
+        self.assertEqual(dados['cards']['dispositivos_conectados'], 2)
+        self.assertEqual(dados['cards']['alertas_ativos'], 2)
+        histograma = dados['grafico_logins_por_hora']['data']
+        self.assertEqual((histograma[0], histograma[23], sum(histograma)), (1, 1, 3))
+        self.assertEqual(
+            [linha['status'] for linha in dados['tabela_status_conexao']], ['Ativo', 'Ativo']
+        )
+
+    def test_invalidacao_depois_do_commit_e_no_maximo_uma_por_intervalo(self):
+        hoje = timezone.localdate()
+        cache_dashboard.guardar(hoje, {'v': 1})
+        with self.captureOnCommitCallbacks(execute=True):
+            cache_dashboard.invalidar()
+            # Antes do commit, o payload antigo continua valendo.
+            self.assertIsNotNone(cache_dashboard.obter(hoje))
+        self.assertIsNone(cache_dashboard.obter(hoje))
+
+        # Outra escrita dentro do intervalo não incrementa a versão...
+        cache_dashboard.guardar(hoje, {'v': 2})
+        with self.captureOnCommitCallbacks(execute=True):
+            cache_dashboard.invalidar()
+        self.assertIsNotNone(cache_dashboard.obter(hoje))
+
+        # ...mas fica pendente: a primeira leitura depois dele incrementa.
+        agora = time_module.time()
+        with mock.patch('time.time', return_value=agora + 6):
+            self.assertIsNone(cache_dashboard.obter(hoje))
+
+    def test_numero_de_queries_nao_depende_do_volume(self):
+        _criar_evento(self.admin, Evento.TipoEvento.LOGIN, _hoje_as(9))
+        self._reconstruir()
+        with self.assertNumQueries(5):
+            self.client.get(self.url)
+
+        for hora in range(24):
+            _criar_evento(self.admin, Evento.TipoEvento.LOGIN, _hoje_as(hora))
+            _criar_evento(self.admin, Evento.TipoEvento.FALHA_LOGIN, _hoje_as(hora))
+        self._reconstruir()
+        with self.assertNumQueries(5):
+            self.client.get(self.url)
+
+
+class RollupTests(UebaxTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.usuario = _criar_usuario('rollup@uebax.com')
+
+    def test_log_event_incrementa_rollup(self):
+        for _ in range(3):
+            log_event(self.usuario, Evento.TipoEvento.LOGOUT)
+
+        rollup = EventoRollupHora.objects.get(tipo_evento=Evento.TipoEvento.LOGOUT)
+        self.assertEqual(rollup.total, 3)
+        self.assertEqual(rollup.usuario_id, self.usuario.id)
+
+    def test_reconstruir_bate_com_incremental(self):
+        for _ in range(6):
+            log_event(self.usuario, Evento.TipoEvento.FALHA_LOGIN)
+        incremental = {
+            (r.hora, r.tipo_evento, r.usuario_id): r.total for r in EventoRollupHora.objects.all()
+        }
+        alertas_incremental = sum(AlertaRollupHora.objects.values_list('total', flat=True))
+
+        EventoRollupHora.objects.all().delete()
+        AlertaRollupHora.objects.all().delete()
+        call_command('reconstruir_rollups', horas_por_bloco=1, stdout=StringIO())
+
+        reconstruido = {
+            (r.hora, r.tipo_evento, r.usuario_id): r.total for r in EventoRollupHora.objects.all()
+        }
+        self.assertEqual(incremental, reconstruido)
+        self.assertEqual(alertas_incremental, Alerta.objects.count())
+        self.assertEqual(sum(AlertaRollupHora.objects.values_list('total', flat=True)), Alerta.objects.count())
+
+
+@override_settings(UEBAX_INGESTAO={'MODO': 'buffer', 'TAMANHO_LOTE': 100, 'INTERVALO_FLUSH': 3600})
+class IngestaoEmBufferTests(UebaxTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.usuario = _criar_usuario('buffer@uebax.com')
+        self.addCleanup(ingestao.encerrar_buffer)
+
+    def test_eventos_ficam_na_fila_ate_a_descarga(self):
+        for _ in range(3):
+            log_event(self.usuario, Evento.TipoEvento.LOGOUT)
+
+        self.assertEqual(Evento.objects.count(), 0)
+        self.assertEqual(ingestao.obter_buffer().pendentes(), 3)
+
+        with CaptureQueriesContext(connection) as consultas:
+            self.assertEqual(ingestao.obter_buffer().descarregar(), 3)
+
+        # Um único INSERT para o lote inteiro
+        inserts = [q for q in consultas.captured_queries if q['sql'].startswith('INSERT INTO "core_evento"')]
+        self.assertEqual(len(inserts), 1)
+
+        self.assertEqual(Evento.objects.count(), 3)
+        self.assertEqual(EventoRollupHora.objects.get().total, 3)
+
+    def test_regras_analisam_o_lote(self):
+        for _ in range(5):
+            log_event(self.usuario, Evento.TipoEvento.FALHA_LOGIN)
+
+        ingestao.obter_buffer().descarregar()
+
+        self.assertTrue(Alerta.objects.filter(
+            usuario=self.usuario, tipo_alerta=Alerta.TipoAlerta.FALHA_LOGIN_MULTIPLA
+        ).exists())
+
+    def test_encerrar_descarrega_pendentes(self):
+        log_event(self.usuario, Evento.TipoEvento.LOGOUT)
+        ingestao.encerrar_buffer()
+        self.assertEqual(Evento.objects.count(), 1)
+
+    def test_lote_que_falha_volta_para_a_fila(self):
+        for _ in range(3):
+            log_event(self.usuario, Evento.TipoEvento.LOGOUT)
+        buffer = ingestao.obter_buffer()
+        with mock.patch.object(Evento.objects, 'bulk_create', side_effect=OperationalError('database is locked')):
+            with self.assertLogs('core.ingestao', 'ERROR'):
+                self.assertEqual(buffer.descarregar(), 0)
+        self.assertEqual(buffer.pendentes(), 3)
+
+        self.assertEqual(buffer.descarregar(), 3)
+        self.assertEqual(Evento.objects.count(), 3)
+
+    @override_settings(UEBAX_INGESTAO={'MODO': 'buffer', 'TAMANHO_LOTE': 2, 'INTERVALO_FLUSH': 3600})
+    def test_erro_permanente_descarta_o_lote_sem_travar_a_fila(self):
+        for _ in range(3):
+            log_event(self.usuario, Evento.TipoEvento.LOGOUT)
+        buffer = ingestao.obter_buffer()
+        original = Evento.objects.bulk_create
+
+        def recusa_o_primeiro_lote(eventos, *args, **kwargs):
+            if len(eventos) == 2:
+                raise IntegrityError('FOREIGN KEY constraint failed')
+            return original(eventos, *args, **kwargs)
+
+        with mock.patch.object(Evento.objects, 'bulk_create', side_effect=recusa_o_primeiro_lote):
+            with self.assertLogs('core.ingestao', 'ERROR') as logs:
+                self.assertEqual(buffer.descarregar(), 1)
+        self.assertEqual((buffer.pendentes(), buffer.descartados), (0, 2))
+        self.assertEqual(sum('Evento não gravado' in linha for linha in logs.output), 2)
+        self.assertEqual(Evento.objects.count(), 1)
+
+    def test_falha_das_regras_nao_devolve_lote_gravado(self):
+        log_event(self.usuario, Evento.TipoEvento.LOGOUT)
+        with mock.patch('core.utils._analisar_lote', side_effect=RuntimeError('regra quebrada')):
+            with self.assertLogs('core.ingestao', 'ERROR'):
+                self.assertEqual(ingestao.obter_buffer().descarregar(), 1)
+        self.assertEqual(ingestao.obter_buffer().pendentes(), 0)
+        self.assertEqual(Evento.objects.count(), 1)
+
+    @override_settings(UEBAX_INGESTAO={'MODO': 'buffer', 'TAMANHO_LOTE': 100, 'INTERVALO_FLUSH': 3600, 'LIMITE_FILA': 2})
+    async def test_fila_cheia_no_event_loop_grava_fora_dele(self):
+        # Sem a thread de fundo: só o caminho do event loop grava aqui.
+        with mock.patch.object(ingestao.BufferDeEventos, '_loop'):
+            for _ in range(3):
+                await alog_event(self.usuario, Evento.TipoEvento.LOGIN)
+            buffer = ingestao.obter_buffer()
+            self.assertEqual(buffer.pendentes(), 2)
+            self.assertEqual(await Evento.objects.acount(), 1)
+
+            self.assertEqual(await sync_to_async(buffer.descarregar)(), 2)
+        self.assertEqual(await Evento.objects.acount(), 3)
+
+    def test_encerrar_registra_o_que_nao_foi_gravado(self):
+        log_event(self.usuario, Evento.TipoEvento.LOGOUT)
+        with mock.patch.object(Evento.objects, 'bulk_create', side_effect=OperationalError('database is locked')):
+            with self.assertLogs('core.ingestao', 'ERROR') as logs:
+                ingestao.encerrar_buffer()
+        self.assertTrue(any('Evento não gravado' in linha and 'LOGOUT' in linha for linha in logs.output))
+
+
+class JanelaDeslizanteTests(UebaxTestCase):
+
+    def test_memoria_expira_ocorrencias_antigas(self):
+        janela = janelas.JanelaEmMemoria(janela_segundos=600)
+        for segundo in (0, 100, 200):
+            janela.registrar('u1', segundo)
+
+        self.assertEqual(janela.registrar('u1', 650), 3)  # o de 0s saiu
+        self.assertEqual(janela.contar('u1', 1300), 0)
+
+    def test_memoria_aceita_momentos_fora_de_ordem(self):
+        janela = janelas.JanelaEmMemoria(janela_segundos=600)
+        self.assertEqual(janela.registrar('u1', 1000), 1)
+        self.assertEqual(janela.registrar('u1', 100), 1)   # só ele na janela que termina em 100
+        self.assertEqual(janela.registrar('u1', 1001), 2)  # o de 100 não conta
+        self.assertEqual(janela.registrar('u1', 900), 1)
+        self.assertEqual(janela.contar('u1', 1001), 3)
+        self.assertEqual(janela.contar('u1', 1550), 2)
+
+    def test_cache_nao_reidrata_com_baldes_vivos(self):
+        # A marca de hidratação não pode expirar antes dos baldes: senão o
+        # histórico do banco é somado de novo aos baldes que ainda existem.
+        janela = janelas.JanelaEmCache(janela_segundos=600, granularidade=60)
+        janela.cache.clear()
+        gravados = []
+
+        def registrar(segundo):
+            with mock.patch('time.time', return_value=1_000_000 + segundo):
+                contagem = janela.registrar('u1', segundo, carregar_historico=lambda: list(gravados))
+            gravados.append(segundo)
+            return contagem
+
+        for segundo in (0, 180, 360, 540):
+            registrar(segundo)
+        self.assertEqual(registrar(720), 4)  # 180, 360, 540 e 720
+
+    def test_cache_soma_os_baldes_da_janela(self):
+        janela = janelas.JanelaEmCache(janela_segundos=600, granularidade=60)
+        janela.cache.clear()
+        for segundo in (0, 30, 120):
+            janela.registrar('u1', segundo)
+
+        self.assertEqual(janela.contar('u1', 590), 3)
+        self.assertEqual(janela.contar('u1', 700), 1)
+
+    def test_regra_de_falhas_reidrata_do_banco_uma_vez(self):
+        usuario = _criar_usuario('bruteforce@uebax.com')
+        for _ in range(3):
+            Evento.objects.create(usuario=usuario, tipo_evento=Evento.TipoEvento.FALHA_LOGIN)
+
+        log_event(usuario, Evento.TipoEvento.FALHA_LOGIN)  # reidrata: 4 falhas
+        self.assertFalse(Alerta.objects.exists())
+
+        # Usuário "quente": a contagem não consulta mais a tabela de eventos
+        with CaptureQueriesContext(connection) as consultas:
+            log_event(usuario, Evento.TipoEvento.FALHA_LOGIN)
+        selects = [q for q in consultas.captured_queries if q['sql'].startswith('SELECT "core_evento"')]
+        self.assertEqual(selects, [])
+
+        alerta = Alerta.objects.get(tipo_alerta=Alerta.TipoAlerta.FALHA_LOGIN_MULTIPLA)
+        self.assertIn('5 falhas', alerta.descricao_detalhada)
+
+    @override_settings(UEBAX_JANELA_FALHAS={'LIMITE': 2, 'JANELA_MINUTOS': 1})
+    def test_limite_configuravel(self):
+        usuario = _criar_usuario('limite@uebax.com')
+        log_event(usuario, Evento.TipoEvento.FALHA_LOGIN)
+        log_event(usuario, Evento.TipoEvento.FALHA_LOGIN)
+
+        alerta = Alerta.objects.get(tipo_alerta=Alerta.TipoAlerta.FALHA_LOGIN_MULTIPLA)
+        self.assertIn('em 1 minutos', alerta.descricao_detalhada)
+
+
+class MotorDeRegrasTests(UebaxTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.usuario = _criar_usuario('regras@uebax.com')
+
+    def _evento(self, tipo, quando):
+        return Evento.objects.create(usuario=self.usuario, tipo_evento=tipo, timestamp=quando)
+
+    def test_despacho_por_tipo_de_evento(self):
+        motor = regras.obter_motor()
+        self.assertEqual([r.nome for r in motor.despacho[Evento.TipoEvento.LOGIN]], ['fora_do_horario', 'comportamento'])
+        self.assertEqual([r.nome for r in motor.despacho[Evento.TipoEvento.FALHA_LOGIN]], ['falhas_de_login', 'comportamento'])
+        self.assertEqual([r.nome for r in motor.despacho[Evento.TipoEvento.LOGOUT]], ['comportamento'])
+
+    def test_horario_comercial_usa_fuso_local(self):
+        motor = regras.obter_motor()
+        motor.analisar([self._evento(Evento.TipoEvento.LOGIN, _hoje_as(10))])
+        self.assertFalse(Alerta.objects.exists())
+
+        motor.analisar([self._evento(Evento.TipoEvento.LOGIN, _hoje_as(22))])
+        alerta = Alerta.objects.get()
+        self.assertEqual(alerta.tipo_alerta, Alerta.TipoAlerta.FORA_DO_HORARIO)
+        self.assertIn('às 22h', alerta.descricao_detalhada)
+
+    @override_settings(UEBAX_REGRAS=[{
+        'NOME': 'acessos_em_massa',
+        'TIPO': 'limite_janela',
+        'TIPOS_EVENTO': ['ACESSO_ARQUIVO'],
+        'TIPO_ALERTA': 'ACESSO_NEGADO',
+        'JANELA_MINUTOS': 1,
+        'LIMITE': 3,
+    }])
+    def test_regra_declarada_nas_settings(self):
+        for _ in range(3):
+            log_event(self.usuario, Evento.TipoEvento.ACESSO_ARQUIVO)
+        log_event(self.usuario, Evento.TipoEvento.LOGIN)
+
+        self.assertEqual(
+            list(Alerta.objects.values_list('tipo_alerta', flat=True)),
+            [Alerta.TipoAlerta.ACESSO_NEGADO]
+        )
+        estatisticas = regras.estatisticas()['acessos_em_massa']
+        self.assertEqual(estatisticas['eventos'], 3)
+        self.assertEqual(estatisticas['alertas'], 1)
+        self.assertGreater(estatisticas['tempo_total'], 0)
+
+    @override_settings(UEBAX_REGRAS=[{'NOME': 'x', 'TIPO': 'horario', 'TIPOS_EVENTO': ['NAO_EXISTE'], 'TIPO_ALERTA': 'ACESSO_NEGADO'}])
+    def test_declaracao_invalida(self):
+        with self.assertRaises(ImproperlyConfigured):
+            regras.obter_motor()
+
+    def test_recarrega_quando_o_arquivo_muda(self):
+        descritor, caminho = tempfile.mkstemp(suffix='.json')
+        os.close(descritor)
+        self.addCleanup(os.remove, caminho)
+
+        def escrever(hora_fim, mtime):
+            with open(caminho, 'w', encoding='utf-8') as f:
+                json.dump([{**regras.REGRAS_PADRAO[0], 'HORA_FIM': hora_fim}], f)
+            os.utime(caminho, (mtime, mtime))
+
+        escrever(18, 1000)
+        with override_settings(UEBAX_REGRAS_ARQUIVO=caminho):
+            self.assertEqual(regras.obter_motor().regras[0].hora_fim, 18)
+
+            escrever(23, 2000)
+            regras._ultima_verificacao = 0.0  # pula o intervalo mínimo entre verificações
+            self.assertEqual(regras.obter_motor().regras[0].hora_fim, 23)
+
+
+class LinhaDeBaseTests(UebaxTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.usuario = _criar_usuario('baseline@uebax.com')
+
+    def _treinar(self, dias, horas, tipo=Evento.TipoEvento.LOGIN):
+        # Um evento por hora/dia, nos dias anteriores a hoje.
+        eventos = [
+            Evento(usuario=self.usuario, tipo_evento=tipo, timestamp=_hoje_as(hora) - timedelta(days=dia))
+            for dia in range(dias, 0, -1) for hora in horas
+        ]
+        baseline.processar_lote(Evento.objects.bulk_create(eventos))
+        return PerfilComportamental.objects.get(usuario=self.usuario)
+
+    def test_atualizacao_incremental_do_perfil(self):
+        perfil = self._treinar(3, [9, 13])
+
+        self.assertEqual(perfil.total_eventos, 6)
+        self.assertEqual(perfil.histograma_horas[9], 3)
+        self.assertEqual(perfil.histograma_horas[13], 3)
+        self.assertEqual(perfil.frequencia_tipos, {Evento.TipoEvento.LOGIN: 6})
+        self.assertEqual(perfil.ultimo_evento_em, _hoje_as(13) - timedelta(days=1))
+
+        # Welford bate com a média/variância calculadas de uma vez
+        valores = [math.log1p(4 * 3600), math.log1p(20 * 3600)] * 2 + [math.log1p(4 * 3600)]
+        media = sum(valores) / len(valores)
+        variancia = sum((v - media) ** 2 for v in valores) / (len(valores) - 1)
+        self.assertEqual(perfil.intervalos, 5)
+        self.assertAlmostEqual(perfil.intervalo_media, media)
+        self.assertAlmostEqual(baseline.desvio_padrao_intervalo(perfil), math.sqrt(variancia))
+
+    def test_perfil_imaturo_nao_gera_alerta(self):
+        self._treinar(2, [9])
+        log_event(self.usuario, Evento.TipoEvento.ACESSO_ARQUIVO)
+        self.assertFalse(Alerta.objects.filter(tipo_alerta=Alerta.TipoAlerta.COMPORTAMENTO_ANOMALO).exists())
+        self.assertEqual(PerfilComportamental.objects.get(usuario=self.usuario).total_eventos, 3)
+
+    def test_tipo_incomum_gera_alerta_comportamento_anomalo(self):
+        self._treinar(60, [9, 10, 14])
+        evento = Evento.objects.create(
+            usuario=self.usuario, tipo_evento=Evento.TipoEvento.ACESSO_ARQUIVO, timestamp=_hoje_as(10)
+        )
+        regras.obter_motor().analisar([evento])
+
+        alerta = Alerta.objects.get()
+        self.assertEqual(alerta.tipo_alerta, Alerta.TipoAlerta.COMPORTAMENTO_ANOMALO)
+        self.assertIn('tipo de evento incomum', alerta.descricao_detalhada)
+
+    def test_horario_aprendido_substitui_janela_fixa(self):
+        # Usuário que sempre entra às 20h e 21h (fora do 8h-18h fixo)
+        self._treinar(30, [20, 21])
+        motor = regras.obter_motor()
+
+        motor.analisar([Evento.objects.create(usuario=self.usuario, tipo_evento=Evento.TipoEvento.LOGIN, timestamp=_hoje_as(20))])
+        self.assertFalse(Alerta.objects.exists())
+
+        motor.analisar([Evento.objects.create(usuario=self.usuario, tipo_evento=Evento.TipoEvento.LOGIN, timestamp=_hoje_as(10))])
+        alerta = Alerta.objects.get()
+        self.assertEqual(alerta.tipo_alerta, Alerta.TipoAlerta.FORA_DO_HORARIO)
+        self.assertIn('horário habitual', alerta.descricao_detalhada)
+
+
+@skipUnless(numpy, 'requer numpy')
+class AnaliseHistoricaTests(UebaxTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.ana = _criar_usuario('ana@uebax.com')
+        self.bruno = _criar_usuario('bruno@uebax.com')
+
+        eventos = []
+        for dia in range(40, 0, -1):
+            for hora in (9, 11, 15):
+                eventos.append(Evento(usuario=self.ana, tipo_evento=Evento.TipoEvento.LOGIN, timestamp=_hoje_as(hora) - timedelta(days=dia)))
+            eventos.append(Evento(usuario=self.bruno, tipo_evento=Evento.TipoEvento.LOGOUT, timestamp=_hoje_as(19) - timedelta(days=dia)))
+        eventos += [
+            Evento(usuario=self.ana, tipo_evento=Evento.TipoEvento.ACESSO_ARQUIVO, timestamp=_hoje_as(10)),
+            Evento(usuario=self.ana, tipo_evento=Evento.TipoEvento.LOGIN, timestamp=_hoje_as(3)),
+            Evento(usuario=self.bruno, tipo_evento=Evento.TipoEvento.LOGIN, timestamp=_hoje_as(23)),
+        ]
+        eventos += [
+            Evento(usuario=self.bruno, tipo_evento=Evento.TipoEvento.FALHA_LOGIN, timestamp=_hoje_as(12, minuto))
+            for minuto in range(7)
+        ]
+        Evento.objects.bulk_create(sorted(eventos, key=lambda e: e.timestamp))
+
+    def _alertas(self):
+        return sorted(Alerta.objects.values_list('usuario_id', 'tipo_alerta', 'descricao_detalhada', 'ocorrencias'))
+
+    def test_mesmos_alertas_do_motor(self):
+        # Motor evento a evento (modo síncrono)
+        motor = regras.obter_motor()
+        for evento in Evento.objects.order_by('timestamp', 'id'):
+            motor.analisar([evento])
+        esperados = self._alertas()
+        self.assertTrue(esperados)
+
+        Alerta.objects.all().delete()
+        call_command('analisar_historico', '--gravar', '--tamanho-bloco', '37', stdout=StringIO())
+        self.assertEqual(self._alertas(), esperados)
+
+    def test_regravar_nao_conta_de_novo(self):
+        # Alertas já gravados pelo motor e por execuções anteriores cobrem
+        # as mesmas ocorrências: regravar o intervalo não muda nada.
+        motor = regras.obter_motor()
+        for evento in Evento.objects.order_by('timestamp', 'id'):
+            motor.analisar([evento])
+        esperados = self._alertas()
+
+        for _ in range(2):
+            call_command('analisar_historico', '--gravar', stdout=StringIO())
+            self.assertEqual(self._alertas(), esperados)
+
+        Alerta.objects.all().delete()
+        for _ in range(2):
+            call_command('analisar_historico', '--gravar', '--tamanho-bloco', '37', stdout=StringIO())
+            self.assertEqual(self._alertas(), esperados)
+
+    def test_usuario_criado_durante_a_analise_fica_de_fora(self):
+        inicio, fim = _hoje_as(0) - timedelta(days=41), timezone.now() + timedelta(days=1)
+        blocos = analise_vetorizada.carregar_blocos(inicio, fim, 37)
+        ids_usuarios, primeiro = next(blocos)
+
+        novo = _criar_usuario('novo@uebax.com')
+        _criar_evento(novo, Evento.TipoEvento.LOGIN, _hoje_as(23, 30))
+        restantes = [bloco for _, bloco in blocos]
+
+        self.assertEqual(len(primeiro) + sum(map(len, restantes)), Evento.objects.count() - 1)
+        self.assertTrue(all((ids_usuarios[bloco.usuarios] != novo.id).all() for bloco in restantes))
+
+    def test_simular_nao_grava(self):
+        for argumentos in ([], ['--simular']):
+            saida = StringIO()
+            call_command('analisar_historico', *argumentos, stdout=saida)
+            self.assertFalse(Alerta.objects.exists())
+            self.assertIn('falhas_de_login: 3', saida.getvalue())
+
+
+class AgregacaoDeAlertasTests(UebaxTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.usuario = _criar_usuario('agregacao@uebax.com')
+
+    def _alerta(self, minutos, tipo=Alerta.TipoAlerta.FORA_DO_HORARIO):
+        return Alerta(
+            usuario=self.usuario, tipo_alerta=tipo, descricao_detalhada=f'aos {minutos} min',
+            timestamp=_hoje_as(22) + timedelta(minutes=minutos)
+        )
+
+    def test_repeticoes_na_janela_incrementam_o_contador(self):
+        criados = alertas.gravar([self._alerta(0), self._alerta(10)])
+        self.assertEqual(len(criados), 1)
+
+        # Segunda escrita: o alerta aberto vem do cache, sem SELECT
+        with CaptureQueriesContext(connection) as consultas:
+            self.assertEqual(alertas.gravar([self._alerta(30)]), [])
+        self.assertFalse([q for q in consultas.captured_queries if q['sql'].startswith('SELECT')])
+
+        alerta = Alerta.objects.get()
+        self.assertEqual(alerta.ocorrencias, 3)
+        self.assertEqual(alerta.timestamp, _hoje_as(22))
+        self.assertEqual(alerta.ultima_ocorrencia, _hoje_as(22, 30))
+        self.assertEqual(alerta.descricao_detalhada, 'aos 0 min')
+
+    def test_nova_janela_abre_novo_alerta(self):
+        alertas.gravar([self._alerta(0), self._alerta(59), self._alerta(61)])
+        self.assertEqual(
+            list(Alerta.objects.order_by('timestamp').values_list('ocorrencias', flat=True)), [2, 1]
+        )
+
+    def test_cache_vazio_consulta_o_banco(self):
+        alertas.gravar([self._alerta(0)])
+        alertas.reiniciar_cache()  # ex.: outro processo
+        self.assertEqual(alertas.gravar([self._alerta(5)]), [])
+        self.assertEqual(Alerta.objects.get().ocorrencias, 2)
+
+    def test_alerta_apagado_nao_perde_a_ocorrencia(self):
+        alertas.gravar([self._alerta(0)])
+        Alerta.objects.all().delete()
+        self.assertEqual(len(alertas.gravar([self._alerta(5)])), 1)
+
+    @override_settings(UEBAX_ALERTAS={'JANELA_SUPRESSAO_MINUTOS': 0})
+    def test_janela_zero_desliga_a_agregacao(self):
+        alertas.gravar([self._alerta(0), self._alerta(1)])
+        self.assertEqual(Alerta.objects.count(), 2)
+
+    def test_falhas_de_login_repetidas_viram_um_alerta(self):
+        for _ in range(8):
+            log_event(self.usuario, Evento.TipoEvento.FALHA_LOGIN)
+
+        alerta = Alerta.objects.get(tipo_alerta=Alerta.TipoAlerta.FALHA_LOGIN_MULTIPLA)
+        self.assertEqual(alerta.ocorrencias, 4)
+        self.assertEqual(AlertaRollupHora.objects.get(tipo_alerta=Alerta.TipoAlerta.FALHA_LOGIN_MULTIPLA).total, 1)
+
+
+class ListagemPaginadaTests(UebaxTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.usuario = _criar_usuario('lista@uebax.com')
+        self.outro = _criar_usuario('outro-lista@uebax.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+        momento = _hoje_as(12)
+        # Vários eventos com o mesmo timestamp, para exercitar o desempate por id
+        Evento.objects.bulk_create(
+            Evento(usuario=self.usuario if i % 2 else self.outro,
+                   tipo_evento=Evento.TipoEvento.LOGIN if i % 3 else Evento.TipoEvento.LOGOUT,
+                   timestamp=momento - timedelta(minutes=i // 4))
+            for i in range(30)
+        )
+
+    def _percorrer(self, url):
+        resultados, paginas = [], 0
+        while url:
+            resposta = self.client.get(url)
+            self.assertEqual(resposta.status_code, 200)
+            resultados.extend(resposta.data['results'])
+            url = resposta.data['next']
+            paginas += 1
+        return resultados, paginas
+
+    def test_cursor_percorre_tudo_sem_repetir(self):
+        resultados, paginas = self._percorrer(reverse('event-list') + '?tamanho=7')
+        self.assertEqual(len(resultados), 30)
+        self.assertEqual(paginas, 5)
+
+        esperado = list(Evento.objects.order_by('-timestamp', '-id').values_list('usuario__email', flat=True))
+        self.assertEqual([r['usuario_email'] for r in resultados], esperado)
+
+    def test_filtros(self):
+        url = reverse('event-list')
+        resposta = self.client.get(url, {'tipo': 'LOGOUT', 'usuario': self.outro.id, 'tamanho': 100})
+        esperado = Evento.objects.filter(tipo_evento='LOGOUT', usuario=self.outro).count()
+        self.assertEqual(len(resposta.data['results']), esperado)
+
+        self.assertEqual(self.client.get(url, {'tipo': 'XYZ'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'cursor': '!!!'}).status_code, 400)
+
+        amanha = (timezone.localdate() + timedelta(days=1)).isoformat()
+        self.assertEqual(self.client.get(url, {'inicio': amanha}).data['results'], [])
+
+    def test_numero_de_queries_nao_depende_do_tamanho_da_pagina(self):
+        Alerta.objects.bulk_create(
+            Alerta(usuario=self.outro, tipo_alerta=Alerta.TipoAlerta.ACESSO_NEGADO, descricao_detalhada='x')
+            for _ in range(20)
+        )
+        for nome in ('event-list', 'alert-list'):
+            for tamanho in (1, 20):
+                with self.assertNumQueries(1):
+                    resposta = self.client.get(reverse(nome), {'tamanho': tamanho})
+                self.assertEqual(len(resposta.data['results']), tamanho)
+
+
+class ExportacaoTests(UebaxTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.usuario = _criar_usuario('siem@uebax.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+        self.eventos = Evento.objects.bulk_create(
+            Evento(usuario=self.usuario, tipo_evento=Evento.TipoEvento.LOGIN, descricao=f'e{i}')
+            for i in range(5)
+        )
+
+    def _ler(self, resposta):
+        return b''.join(resposta.streaming_content).decode()
+
+    def test_ndjson_retomavel_por_since_id(self):
+        resposta = self.client.get(reverse('event-export'))
+        self.assertEqual(resposta['Content-Type'], 'application/x-ndjson')
+        linhas = [json.loads(linha) for linha in self._ler(resposta).splitlines()]
+        self.assertEqual([l['descricao'] for l in linhas], [f'e{i}' for i in range(5)])
+        self.assertEqual(linhas[0]['usuario_email'], 'siem@uebax.com')
+
+        resposta = self.client.get(reverse('event-export'), {'since_id': linhas[2]['id']})
+        restantes = [json.loads(linha)['descricao'] for linha in self._ler(resposta).splitlines()]
+        self.assertEqual(restantes, ['e3', 'e4'])
+
+    def test_csv_com_filtro_de_tipo(self):
+        Alerta.objects.create(usuario=self.usuario, tipo_alerta=Alerta.TipoAlerta.ACESSO_NEGADO, descricao_detalhada='a')
+        Alerta.objects.create(usuario=self.usuario, tipo_alerta=Alerta.TipoAlerta.FORA_DO_HORARIO, descricao_detalhada='b')
+
+        resposta = self.client.get(reverse('alert-export'), {'formato': 'csv', 'tipo': 'ACESSO_NEGADO'})
+        linhas = self._ler(resposta).splitlines()
+        self.assertEqual(
+            linhas[0], 'id,timestamp,ultima_ocorrencia,ocorrencias,tipo_alerta,usuario_id,usuario_email,descricao_detalhada'
+        )
+        self.assertEqual(len(linhas), 2)
+        self.assertTrue(linhas[1].endswith(',a'))
+
+    def test_parametros_invalidos(self):
+        self.assertEqual(self.client.get(reverse('event-export'), {'formato': 'xml'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('event-export'), {'since_id': 'abc'}).status_code, 400)
+
+
+class RetencaoTests(UebaxTestCase):
+
+    def setUp(self):
+        super().setUp()
+        pasta = tempfile.TemporaryDirectory()
+        self.addCleanup(pasta.cleanup)
+        self.pasta = pasta.name
+        configuracao = override_settings(UEBAX_RETENCAO={'DIAS': 30, 'DIRETORIO': self.pasta, 'TAMANHO_LOTE': 2})
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+
+        self.usuario = _criar_usuario('retencao@uebax.com')
+        # Meio-dia UTC: os cinco caem no mesmo arquivo diário
+        antigo = datetime.combine(timezone.now().date() - timedelta(days=40), time(12), tzinfo=dt_timezone.utc)
+        self.antigos = Evento.objects.bulk_create(
+            Evento(usuario=self.usuario, tipo_evento=Evento.TipoEvento.LOGIN, descricao=f'a{i}', timestamp=antigo + timedelta(minutes=i))
+            for i in range(5)
+        )
+        self.recente = Evento.objects.create(usuario=self.usuario, tipo_evento=Evento.TipoEvento.LOGOUT, descricao='r')
+
+    def test_arquiva_em_lotes_e_registra_no_manifesto(self):
+        saida = StringIO()
+        call_command('arquivar_eventos', stdout=saida)
+        self.assertIn('5 eventos arquivados', saida.getvalue())
+        self.assertEqual(list(Evento.objects.values_list('descricao', flat=True)), ['r'])
+
+        nome = f'eventos-{self.antigos[0].timestamp.astimezone(dt_timezone.utc).date().isoformat()}.ndjson.gz'
+        entrada = retencao.ler_manifesto()['arquivos'][nome]
+        self.assertEqual(entrada['eventos'], 5)
+        self.assertEqual((entrada['id_min'], entrada['id_max']), (self.antigos[0].id, self.antigos[-1].id))
+        self.assertEqual([r['descricao'] for r in retencao.ler()], [f'a{i}' for i in range(5)])
+
+        # Nada mais a arquivar
+        call_command('arquivar_eventos', stdout=StringIO())
+        self.assertEqual(retencao.ler_manifesto()['arquivos'][nome]['eventos'], 5)
+
+    def test_nao_duplica_lote_escrito_antes_de_cair(self):
+        # Cai no DELETE do primeiro lote, já escrito no arquivo
+        with mock.patch.object(retencao.transaction, 'atomic', side_effect=RuntimeError('queda')):
+            with self.assertRaises(RuntimeError):
+                retencao.arquivar()
+        self.assertEqual(Evento.objects.count(), 6)
+        self.assertEqual(len(list(retencao.ler())), 2)
+
+        retencao.arquivar()
+        self.assertEqual([r['descricao'] for r in retencao.ler()], [f'a{i}' for i in range(5)])
+        self.assertEqual(list(Evento.objects.values_list('descricao', flat=True)), ['r'])
+        self.assertTrue(all('pendentes' not in e for e in retencao.ler_manifesto()['arquivos'].values()))
+
+    def test_arquiva_evento_com_id_menor_que_o_ja_arquivado(self):
+        # Ids não seguem o timestamp: A (20h) tem id menor que B (8h), do
+        # mesmo dia, e o primeiro corte passa entre os dois.
+        dia = datetime.combine(timezone.now().date() - timedelta(days=50), time(), tzinfo=dt_timezone.utc)
+        Evento.objects.create(usuario=self.usuario, tipo_evento=Evento.TipoEvento.LOGIN, descricao='A', timestamp=dia + timedelta(hours=20))
+        Evento.objects.create(usuario=self.usuario, tipo_evento=Evento.TipoEvento.LOGIN, descricao='B', timestamp=dia + timedelta(hours=8))
+
+        with mock.patch('core.retencao._corte', return_value=dia + timedelta(hours=12)):
+            self.assertEqual(sum(retencao.arquivar().values()), 1)
+        retencao.arquivar()
+
+        self.assertEqual(list(Evento.objects.values_list('descricao', flat=True)), ['r'])
+        self.assertEqual(
+            [r['descricao'] for r in retencao.ler(fim=dia + timedelta(days=1))], ['B', 'A']
+        )
+
+    def test_reconstruir_rollups_depois_de_arquivar_preserva_o_historico(self):
+        rollups.reconstruir(rollups.inicio_da_hora(self.antigos[0].timestamp), timezone.now() + timedelta(hours=1))
+        retencao.arquivar()
+        marca = retencao.arquivado_ate()
+        self.assertAlmostEqual(marca.timestamp(), (timezone.now() - timedelta(days=30)).timestamp(), delta=60)
+
+        saida = StringIO()
+        # Começando antes do corte (como quando há alertas mais antigos)
+        dia = timezone.localdate(self.antigos[0].timestamp) - timedelta(days=1)
+        call_command('reconstruir_rollups', inicio=dia.isoformat(), stdout=saida)
+        self.assertIn('os rollups de eventos até ali foram mantidos', saida.getvalue())
+        antigos = EventoRollupHora.objects.filter(hora__lt=timezone.now() - timedelta(days=30))
+        self.assertEqual(antigos.aggregate(total=Sum('total'))['total'], 5)
+        self.assertEqual(EventoRollupHora.objects.aggregate(total=Sum('total'))['total'], 6)
+
+    def test_simular_nao_altera_nada(self):
+        call_command('arquivar_eventos', '--simular', stdout=StringIO())
+        self.assertEqual(Evento.objects.count(), 6)
+        self.assertEqual(retencao.ler_manifesto(), {'arquivos': {}})
+
+    def test_exportacao_inclui_arquivados(self):
+        retencao.arquivar()
+        client = APIClient()
+        client.force_authenticate(self.usuario)
+
+        resposta = client.get(reverse('event-export'), {'arquivo': '1', 'inicio': self.antigos[2].timestamp.isoformat()})
+        linhas = [json.loads(linha) for linha in b''.join(resposta.streaming_content).decode().splitlines()]
+        self.assertEqual([l['descricao'] for l in linhas], ['a2', 'a3', 'a4', 'r'])
+
+        resposta = client.get(reverse('event-export'))
+        self.assertEqual(len(b''.join(resposta.streaming_content).decode().splitlines()), 1)
+
+
+class BenchmarkTests(UebaxTestCase):
+
+    def test_percentil_nearest_rank(self):
+        valores = list(range(1, 101))
+        self.assertEqual(benchmark.percentil(valores, 50), 50)
+        self.assertEqual(benchmark.percentil(valores, 99), 99)
+        self.assertEqual(benchmark.percentil([7], 95), 7)
+
+    def test_comparar_com_a_base(self):
+        base = {'casos': {'events': {'p95_ms': 10.0, 'consultas': 2}}}
+        self.assertEqual(benchmark.comparar({'events': {'p95_ms': 12.0, 'consultas': 2}}, base, 0.25), [])
+        regressoes = benchmark.comparar({'events': {'p95_ms': 13.0, 'consultas': 3}}, base, 0.25)
+        self.assertEqual(len(regressoes), 2)
+
+    def test_comando_grava_e_compara_a_base(self):
+        descritor, caminho = tempfile.mkstemp(suffix='.json')
+        os.close(descritor)
+        self.addCleanup(os.remove, caminho)
+
+        argumentos = ['--usar-banco-atual', '--amostras', '3', '--casos', 'events', 'dashboard_quente']
+        call_command('benchmark_uebax', *argumentos, '--base-salvar', caminho, stdout=StringIO())
+        base = benchmark.ler_base(caminho)
+        self.assertEqual(set(base['casos']), {'events', 'dashboard_quente'})
+        # Dashboard e usuário (JWTEmCache) vêm do cache: nenhuma consulta
+        self.assertEqual(base['casos']['dashboard_quente']['consultas'], 0)
+
+        # Uma base "impossível" de bater faz o comando falhar
+        base['casos']['events']['consultas'] = 0
+        with open(caminho, 'w', encoding='utf-8') as f:
+            json.dump(base, f)
+        with self.assertRaisesMessage(CommandError, 'events:'):
+            call_command('benchmark_uebax', *argumentos, '--base-comparar', caminho, stdout=StringIO())
+
+
+class DadosSinteticosTests(UebaxTestCase):
+
+    def test_seed_compartilha_o_hash_da_senha(self):
+        saida = StringIO()
+        call_command('seed_uebax', '--usuarios', '5', '--dias', '3', '--tamanho-lote', '50', stdout=saida)
+        self.assertIn('5 usuários', saida.getvalue())
+
+        usuarios = Usuario.objects.filter(email__endswith=f'@{sintetico.DOMINIO_EMAIL}')
+        self.assertEqual(usuarios.values('password').distinct().count(), 1)
+        self.assertTrue(usuarios.first().check_password(sintetico.SENHA_PADRAO))
+        self.assertEqual(
+            EventoRollupHora.objects.aggregate(total=Sum('total'))['total'], Evento.objects.count()
+        )
+
+        # Segunda execução continua a numeração
+        call_command('seed_uebax', '--usuarios', '2', '--dias', '1', stdout=StringIO())
+        self.assertTrue(Usuario.objects.filter(email=sintetico.email(6)).exists())
+
+    def test_fluxo_realista_e_deterministico(self):
+        probabilidades = {**sintetico.PROBABILIDADES_PADRAO, 'TEMPESTADE': 1, 'FORA_DO_HORARIO': 1}
+        segunda = timezone.localdate() - timedelta(days=timezone.localdate().weekday() + 7)
+
+        def gerar():
+            return list(sintetico.fluxo_do_usuario(random.Random(1), 1, segunda, 1, probabilidades))
+
+        eventos = gerar()
+        tipos = [evento.tipo_evento for evento in eventos]
+        self.assertGreaterEqual(tipos.count(Evento.TipoEvento.FALHA_LOGIN), 6)
+        self.assertEqual(tipos.count(Evento.TipoEvento.LOGIN), 2)  # jornada + sessão noturna
+        self.assertTrue(any(timezone.localtime(e.timestamp).hour >= 22 or timezone.localtime(e.timestamp).hour < 5 for e in eventos))
+        self.assertEqual([(e.tipo_evento, e.timestamp) for e in gerar()], [(e.tipo_evento, e.timestamp) for e in eventos])
+
+
+class MetricasTests(UebaxTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.usuario = _criar_usuario('metricas@uebax.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def test_latencia_consultas_e_serializacao_por_view(self):
+        self.client.get(reverse('event-list'))
+        self.client.get(reverse('event-list'))
+
+        self.assertEqual(metricas.REQUISICOES.valor(view='event-list', metodo='GET', status=200), 2)
+        self.assertEqual(metricas.DURACAO.contagem(view='event-list'), 2)
+        self.assertEqual(metricas.CONSULTAS.contagem(view='event-list'), 2)
+        self.assertGreater(metricas.TEMPO_SQL.valor(view='event-list'), 0)
+        self.assertEqual(metricas.SERIALIZACAO.contagem(view='event-list'), 2)
+
+    def test_motor_de_regras_no_log_event(self):
+        log_event(self.usuario, Evento.TipoEvento.FALHA_LOGIN)
+        self.assertEqual(metricas.MOTOR.contagem(), 1)
+        self.assertEqual(metricas.REGRAS_EVENTOS.valor(regra='falhas_de_login'), 1)
+        self.assertEqual(metricas.REGRAS.contagem(regra='falhas_de_login'), 1)
+
+    @override_settings(UEBAX_METRICAS={'TOKEN': 'segredo'})
+    def test_endpoint_prometheus(self):
+        self.client.get(reverse('event-list'))
+        resposta = self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer segredo')
+        self.assertEqual(resposta.status_code, 200)
+        texto = resposta.content.decode()
+        self.assertIn('# TYPE uebax_http_duracao_segundos histogram', texto)
+        self.assertIn('uebax_http_duracao_segundos_bucket{view="event-list",le="+Inf"} 1', texto)
+        self.assertIn('uebax_http_requisicoes_total{view="event-list",metodo="GET",status="200"} 1', texto)
+
+        self.assertEqual(self.client.get('/metrics/').status_code, 403)
+        self.assertEqual(self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer outro').status_code, 403)
+
+    def test_endpoint_sem_token_so_para_staff(self):
+        with override_settings(UEBAX_METRICAS={'TOKEN': None}):
+            self.assertEqual(self.client.get('/metrics/').status_code, 403)
+            self.assertEqual(self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer None').status_code, 403)
+            self.client.force_login(self.usuario)
+            self.assertEqual(self.client.get('/metrics/').status_code, 403)
+
+            Usuario.objects.filter(pk=self.usuario.pk).update(is_staff=True)
+            self.assertEqual(self.client.get('/metrics/').status_code, 200)
+
+    def test_requisicao_lenta_vai_para_o_log_com_o_sql(self):
+        with override_settings(UEBAX_METRICAS={'LIMITE_LENTO_MS': 0}):
+            with self.assertLogs('core.metricas', level='WARNING') as registros:
+                self.client.get(reverse('event-list'))
+        self.assertIn('event-list', registros.output[0])
+        self.assertIn('SELECT', registros.output[0])
+
+    def test_login_nao_entra_no_log_de_lentas(self):
+        # O PBKDF2 sozinho passa do limite; o login não é "lento" por isso.
+        with override_settings(UEBAX_METRICAS={'LIMITE_LENTO_MS': 0}):
+            with self.assertNoLogs('core.metricas', level='WARNING'):
+                resposta = APIClient().post(
+                    reverse('token_obtain_pair'), {'email': 'metricas@uebax.com', 'password': 'SenhaForte#123'}
+                )
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(metricas.DURACAO.contagem(view='token_obtain_pair'), 1)
+
+
+class ConfiguracaoDeBancoTests(SimpleTestCase):
+
+    def test_postgres_com_pool_e_replicas(self):
+        ambiente = {
+            'UEBAX_DB_URL': 'postgres://uebax:s%40nha@db:5433/uebax?sslmode=require',
+            'UEBAX_DB_REPLICAS': 'postgres://uebax:x@leitura1/uebax, postgres://uebax:x@leitura2/uebax',
+            'UEBAX_DB_POOL_MAX': '20',
+        }
+        configurados = bancos.a_partir_do_ambiente(ambiente, '/srv')
+        default = configurados['default']
+        self.assertEqual(default['ENGINE'], 'django.db.backends.postgresql')
+        self.assertEqual((default['HOST'], default['PORT'], default['PASSWORD']), ('db', '5433', 's@nha'))
+        self.assertEqual(default['CONN_MAX_AGE'], 0)
+        self.assertEqual(default['OPTIONS'], {'sslmode': 'require', 'pool': {'min_size': 2, 'max_size': 20, 'timeout': 10}})
+        self.assertEqual(configurados['replica2']['HOST'], 'leitura2')
+        self.assertEqual(configurados['replica1']['TEST'], {'MIRROR': 'default'})
+
+        sem_pool = bancos.a_partir_do_ambiente({'UEBAX_DB_URL': 'postgres://u@db/uebax'}, '/srv')
+        self.assertEqual(sem_pool['default']['CONN_MAX_AGE'], 60)
+
+    def test_sqlite_padrao(self):
+        default = bancos.a_partir_do_ambiente({}, '/srv')['default']
+        self.assertEqual(str(default['NAME']), '/srv/db.sqlite3')
+        self.assertEqual(default['OPTIONS'], {'transaction_mode': 'IMMEDIATE'})
+        absoluto = bancos.banco_da_url('sqlite:////var/lib/uebax.sqlite3', '/srv')
+        self.assertEqual(str(absoluto['NAME']), '/var/lib/uebax.sqlite3')
+
+    def test_roteador_so_usa_replica_quando_pedido(self):
+        roteador = banco.RoteadorDeReplicas()
+        self.assertEqual(banco.replicas(), [])
+        with mock.patch.object(banco, 'replicas', return_value=['replica1']):
+            self.assertIsNone(roteador.db_for_read(Evento))
+            with banco.em_replica():
+                self.assertEqual(roteador.db_for_read(Evento), 'replica1')
+            self.assertIsNone(roteador.db_for_write(Evento))
+            self.assertFalse(roteador.allow_migrate('replica1', 'core'))
+            self.assertIsNone(roteador.allow_migrate('default', 'core'))
+
+
+class PragmasSqliteTests(UebaxTestCase):
+
+    def test_pragmas_aplicados_na_conexao(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('Só para SQLite.')
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+
+
+class BrokerTests(UebaxTestCase):
+
+    def setUp(self):
+        super().setUp()
+        broker.reiniciar_broker()
+        self.addCleanup(broker.reiniciar_broker)
+
+    def test_fan_out_e_descarte_para_consumidor_lento(self):
+        memoria = broker.BrokerEmMemoria(tamanho_fila=2)
+        todos = memoria.assinar()
+        so_alertas = memoria.assinar(['alertas'])
+
+        memoria.publicar('eventos', [{'id': 1}, {'id': 2}, {'id': 3}])
+        memoria.publicar('alertas', [{'id': 9}])
+
+        # A fila de "todos" só guarda as 2 últimas; a mais antiga foi descartada
+        self.assertEqual(todos.aguardar_sync(0), [('eventos', {'id': 3}), ('alertas', {'id': 9})])
+        self.assertEqual(todos.descartadas, 2)
+        self.assertEqual(so_alertas.aguardar_sync(0), [('alertas', {'id': 9})])
+
+        todos.cancelar()
+        memoria.publicar('eventos', [{'id': 4}])
+        self.assertEqual(todos.aguardar_sync(0), [])
+
+    def test_log_event_publica_apos_o_commit(self):
+        usuario = _criar_usuario('push@uebax.com')
+        assinatura = broker.obter_broker().assinar()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            log_event(usuario, Evento.TipoEvento.LOGOUT)
+
+        [(canal, mensagem)] = assinatura.aguardar_sync(0)
+        self.assertEqual(canal, 'eventos')
+        self.assertEqual(mensagem['tipo_evento'], 'LOGOUT')
+        self.assertEqual(mensagem['usuario_id'], usuario.id)
+
+    async def test_stream_sse(self):
+        usuario = await sync_to_async(_criar_usuario)('sse@uebax.com')
+        url = reverse('stream')
+        token = str(AccessToken.for_user(usuario))
+
+        self.assertEqual((await self.async_client.get(url)).status_code, 401)
+        # O access token não é mais aceito na URL (vai parar nos logs)
+        self.assertEqual((await self.async_client.get(url, {'token': token})).status_code, 401)
+
+        resposta = await self.async_client.post(reverse('stream-ticket'), headers={'Authorization': f'Bearer {token}'})
+        ticket = resposta.json()['ticket']
+        resposta = await self.async_client.get(url, {'ticket': ticket, 'canais': 'alertas'})
+        self.assertEqual(resposta['Content-Type'], 'text/event-stream')
+
+        conteudo = resposta.streaming_content
+        self.assertEqual(await anext(conteudo), b'retry: 5000\n\n')
+
+        broker.obter_broker().publicar('alertas', [{'descricao': 'Teste'}])
+        self.assertEqual(await anext(conteudo), b'event: alertas\ndata: {"descricao": "Teste"}\n\n')
+        await conteudo.aclose()
+
+        with mock.patch('django.core.signing.time.time', return_value=time_module.time() + 3600):
+            self.assertEqual((await self.async_client.get(url, {'ticket': ticket})).status_code, 401)
+
+    def test_stream_sob_wsgi_responde_503(self):
+        usuario = _criar_usuario('wsgi@uebax.com')
+        cabecalho = {'Authorization': f'Bearer {AccessToken.for_user(usuario)}'}
+        self.assertEqual(self.client.post(reverse('stream-ticket'), headers=cabecalho).status_code, 503)
+        self.assertEqual(self.client.get(reverse('stream'), headers=cabecalho).status_code, 503)
+
+
+class AutenticacaoEmCacheTests(UebaxTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.usuario = _criar_usuario('jwt@uebax.com')
+        self.client = APIClient()
+        self._autenticar()
+
+    def _autenticar(self):
+        token = CustomTokenObtainPairSerializer.get_token(self.usuario).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def _consultas(self):
+        with CaptureQueriesContext(connection) as consultas:
+            resposta = self.client.get(reverse('event-list'))
+        self.assertEqual(resposta.status_code, 200)
+        return len(consultas.captured_queries)
+
+    def test_usuario_vem_do_cache_a_partir_do_segundo_request(self):
+        primeira = self._consultas()
+        self.assertEqual(self._consultas(), primeira - 1)
+
+    def test_desativar_usuario_invalida_o_cache(self):
+        self._consultas()
+        self.usuario.is_active = False
+        self.usuario.save()
+        self.assertEqual(self.client.get(reverse('event-list')).status_code, 401)
+
+    def test_troca_de_senha_invalida_tokens_antigos(self):
+        self._consultas()
+        self.usuario.set_password('OutraSenha#456')
+        self.usuario.save()
+        self.assertEqual(self.client.get(reverse('event-list')).status_code, 401)
+
+        self._autenticar()
+        self.assertEqual(self.client.get(reverse('event-list')).status_code, 200)
+
+    @override_settings(UEBAX_AUTENTICACAO={'TTL_USUARIO': 0})
+    def test_ttl_zero_desliga_o_cache(self):
+        primeira = self._consultas()
+        self.assertEqual(self._consultas(), primeira)
+
+
+class IngestaoEmMassaTests(UebaxTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.agente = Usuario.objects.create_user(
+            email='agente@uebax.com', password='SenhaForte#123', nome_completo='Agente', is_staff=True
+        )
+        self.ana = _criar_usuario('ana@uebax.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.agente)
+
+    def _ndjson(self, registros):
+        corpo = '\n'.join(r if isinstance(r, str) else json.dumps(r) for r in registros)
+        return self.client.post(reverse('event-ingest'), corpo, content_type='application/x-ndjson')
+
+    def test_ndjson_aceita_e_rejeita_por_registro(self):
+        momento = (timezone.now() - timedelta(hours=1)).replace(microsecond=0)
+        resposta = self._ndjson([
+            {'email': 'ana@uebax.com', 'tipo_evento': 'ACESSO_ARQUIVO', 'timestamp': momento.isoformat(), 'descricao': '/rh/folha.xlsx'},
+            {'email': 'ana@uebax.com', 'tipo_evento': 'ACESSO_ARQUIVO'},
+            '',
+            {'email': 'ana@uebax.com', 'tipo_evento': 'INEXISTENTE'},
+            {'email': 'ninguem@uebax.com', 'tipo_evento': 'LOGIN'},
+            '{quebrado',
+            {'email': 'ana@uebax.com', 'tipo_evento': 'LOGIN', 'timestamp': (timezone.now() + timedelta(days=1)).isoformat()},
+        ])
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual((resposta.data['aceitos'], resposta.data['rejeitados']), (2, 4))
+        self.assertEqual(sorted(erro['indice'] for erro in resposta.data['erros']), [2, 3, 4, 5])
+
+        evento = Evento.objects.get(descricao='/rh/folha.xlsx')
+        self.assertEqual((evento.usuario_id, evento.timestamp), (self.ana.id, momento))
+        self.assertEqual(EventoRollupHora.objects.aggregate(total=Sum('total'))['total'], 2)
+
+    def test_lote_fora_de_ordem_conta_pela_janela(self):
+        agora = timezone.now().replace(microsecond=0)
+        falhas = Alerta.objects.filter(tipo_alerta=Alerta.TipoAlerta.FALHA_LOGIN_MULTIPLA)
+
+        # Seis falhas com uma hora entre elas, da mais nova para a mais antiga
+        self._ndjson([
+            {'email': 'ana@uebax.com', 'tipo_evento': 'FALHA_LOGIN', 'timestamp': (agora - timedelta(hours=h + 1)).isoformat()}
+            for h in range(6)
+        ])
+        self.assertFalse(falhas.exists())
+
+        # Seis falhas em cinco minutos, embaralhadas, mais uma retroativa
+        # de um dia atrás (fora da janela de todas)
+        momentos = [agora - timedelta(minutes=m) for m in (3, 0, 5, 1, 4, 2)] + [agora - timedelta(days=1)]
+        self._ndjson([{'email': 'ana@uebax.com', 'tipo_evento': 'FALHA_LOGIN', 'timestamp': m.isoformat()} for m in momentos])
+        alerta = falhas.get()
+        self.assertIn('Detectadas 6 falhas', alerta.descricao_detalhada)
+        self.assertEqual(alerta.timestamp, agora)
+
+    def test_array_json_passa_pelo_motor_de_regras(self):
+        registros = [{'email': 'ana@uebax.com', 'tipo_evento': 'FALHA_LOGIN'}] * 6
+        resposta = self.client.post(reverse('event-ingest'), registros, format='json')
+        self.assertEqual(resposta.data['aceitos'], 6)
+        self.assertTrue(Alerta.objects.filter(usuario=self.ana, tipo_alerta=Alerta.TipoAlerta.FALHA_LOGIN_MULTIPLA).exists())
+
+    def test_mapa_de_emails_em_cache_e_invalidado(self):
+        registro = [{'email': 'ana@uebax.com', 'tipo_evento': 'ACESSO_ARQUIVO'}]
+        self._ndjson(registro)
+        with CaptureQueriesContext(connection) as consultas:
+            self._ndjson(registro)
+        self.assertFalse(any('FROM "core_usuario"' in c['sql'] for c in consultas.captured_queries))
+
+        self.ana.email = 'ana.souza@uebax.com'
+        self.ana.save()
+        self.assertEqual(self._ndjson(registro).data['rejeitados'], 1)
+
+    def test_permissao_e_tamanho_maximo(self):
+        self.client.force_authenticate(self.ana)
+        self.assertEqual(self._ndjson([]).status_code, 403)
+
+        self.client.force_authenticate(self.agente)
+        with override_settings(UEBAX_COLETA={'MAXIMO_POR_REQUISICAO': 2}):
+            resposta = self._ndjson([{'email': 'ana@uebax.com', 'tipo_evento': 'LOGIN'}] * 3)
+        self.assertEqual(resposta.status_code, 413)
+        self.assertFalse(Evento.objects.exists())
+
+    def test_rollups_e_perfis_somados_em_lote(self):
+        bruno = _criar_usuario('bruno@uebax.com')
+        hora = rollups.inicio_da_hora(timezone.now() - timedelta(hours=3))
+
+        def login(email, minutos):
+            return {'email': email, 'tipo_evento': 'LOGIN', 'timestamp': (hora + timedelta(minutes=minutos)).isoformat()}
+
+        self._ndjson([login('ana@uebax.com', 1)])  # linha de rollup e perfil já existentes
+        registros = [login(email, minutos) for email in ('ana@uebax.com', 'bruno@uebax.com') for minutos in (5, 70, 75)]
+        self.assertEqual(self._ndjson(registros).data['aceitos'], 6)
+
+        proxima = hora + timedelta(hours=1)
+        totais = {(r.usuario_id, r.hora): r.total for r in EventoRollupHora.objects.all()}
+        self.assertEqual(totais, {(self.ana.id, hora): 2, (self.ana.id, proxima): 2, (bruno.id, hora): 1, (bruno.id, proxima): 2})
+        self.assertEqual(PerfilComportamental.objects.get(usuario=self.ana).total_eventos, 4)
+        self.assertEqual(PerfilComportamental.objects.get(usuario=bruno).total_eventos, 3)
+
+class ListaNegraTests(UebaxTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.usuario = _criar_usuario('sair@uebax.com')
+        self.client = APIClient()
+
+    def _refresh(self):
+        return str(CustomTokenObtainPairSerializer.get_token(self.usuario))
+
+    def test_filtro_de_bloom(self):
+        filtro = lista_negra.FiltroDeBloom(1000, 0.01)
+        for i in range(1000):
+            filtro.adicionar(f'jti-{i}')
+        self.assertTrue(all(f'jti-{i}' in filtro for i in range(1000)))
+        falsos = sum(f'outro-{i}' in filtro for i in range(10000))
+        self.assertLess(falsos, 300)
+
+    def test_refresh_sem_consultar_a_lista_negra(self):
+        refresh = self._refresh()
+        self.client.post(reverse('token_refresh'), {'refresh': refresh}, format='json')  # monta o filtro
+
+        with CaptureQueriesContext(connection) as consultas:
+            resposta = self.client.post(reverse('token_refresh'), {'refresh': refresh}, format='json')
+        self.assertEqual(resposta.status_code, 200)
+        self.assertFalse(any('token_blacklist_blacklistedtoken' in c['sql'] for c in consultas.captured_queries))
+
+    def test_logout_bloqueia_o_refresh(self):
+        refresh = self._refresh()
+        self.client.force_authenticate(self.usuario)
+        self.client.post(reverse('token_refresh'), {'refresh': refresh}, format='json')
+        self.assertEqual(self.client.post(reverse('logout'), {'refresh': refresh}, format='json').status_code, 200)
+        self.assertEqual(self.client.post(reverse('token_refresh'), {'refresh': refresh}, format='json').status_code, 401)
+
+    def test_sincroniza_lista_negra_de_outros_processos(self):
+        refresh = self._refresh()
+        lista_negra.obter_lista_negra().pode_conter('qualquer')
+        # Outro worker coloca o token na lista negra (sem passar por este filtro)
+        RefreshToken(refresh).blacklist()
+        with override_settings(UEBAX_LISTA_NEGRA={'SINCRONIZAR_SEGUNDOS': 0}):
+            resposta = self.client.post(reverse('token_refresh'), {'refresh': refresh}, format='json')
+        self.assertEqual(resposta.status_code, 401)
+
+    def test_sincroniza_id_menor_commitado_depois(self):
+        antigo, novo = RefreshToken(self._refresh()), RefreshToken(self._refresh())
+        antigo.blacklist()
+        novo.blacklist()
+        # O id menor ainda não está visível quando o filtro lê o maior.
+        atrasado = BlacklistedToken.objects.get(token__jti=antigo['jti'])
+        id_atrasado = atrasado.id
+        atrasado.delete()
+        lista = lista_negra.ListaNegra(1000, 0.01, sincronizar_segundos=5, margem_sincronizacao=30)
+        with mock.patch('time.monotonic', return_value=1000.0):
+            self.assertTrue(lista.pode_conter(novo['jti']))
+
+        BlacklistedToken.objects.create(id=id_atrasado, token=atrasado.token)
+        with mock.patch('time.monotonic', return_value=1010.0):
+            self.assertTrue(lista.pode_conter(antigo['jti']))
+        quantidade = lista._filtro.quantidade
+        with mock.patch('time.monotonic', return_value=1020.0):
+            lista.pode_conter('qualquer')
+        self.assertEqual(lista._filtro.quantidade, quantidade)
+
+    def test_limpar_tokens_expirados_em_lotes(self):
+        for _ in range(5):
+            lista_negra.RefreshTokenComFiltro(self._refresh()).blacklist()
+        OutstandingToken.objects.filter(id__in=OutstandingToken.objects.order_by('id').values('id')[:4]).update(
+            expires_at=timezone.now() - timedelta(days=1)
+        )
+
+        saida = StringIO()
+        call_command('limpar_tokens', '--tamanho-lote', '3', stdout=saida)
+        self.assertIn('4 tokens expirados apagados', saida.getvalue())
+        self.assertEqual(OutstandingToken.objects.count(), 1)
+        self.assertEqual(BlacklistedToken.objects.count(), 1)
+
+
+@override_settings(UEBAX_LIMITE_LOGIN={'CAPACIDADE_EMAIL': 3, 'TAXA_EMAIL': 1})
+class LimiteDeLoginTests(UebaxTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.usuario = _criar_usuario('alvo@uebax.com')
+        self.client = APIClient()
+        self.addCleanup(limitacao.reiniciar_limitador)
+
+    def _login(self, senha='errada', rota='token_obtain_pair'):
+        return self.client.post(reverse(rota), {'email': 'alvo@uebax.com', 'password': senha}, format='json')
+
+    def test_bloqueia_antes_de_verificar_a_senha(self):
+        for _ in range(3):
+            self.assertEqual(self._login().status_code, 401)
+
+        with mock.patch('rest_framework_simplejwt.serializers.authenticate') as authenticate:
+            for _ in range(4):
+                resposta = self._login()
+                self.assertEqual(resposta.status_code, 429)
+            authenticate.assert_not_called()
+        self.assertGreaterEqual(int(resposta['Retry-After']), 1)
+
+        # 3 falhas reais + 1 FALHA_LOGIN agregado para as 4 recusas
+        falhas = Evento.objects.filter(usuario=self.usuario, tipo_evento=Evento.TipoEvento.FALHA_LOGIN)
+        self.assertEqual(falhas.count(), 4)
+        self.assertIn('1 tentativa(s)', falhas.order_by('-id').first().descricao)
+
+    def test_recusas_pendentes_sao_registradas_no_fim_do_intervalo(self):
+        with mock.patch.object(limitacao.threading, 'Timer') as temporizador:
+            for _ in range(3):
+                self._login()
+            for _ in range(4):
+                self.assertEqual(self._login().status_code, 429)
+        # A 1ª recusa vira evento na hora; as outras 3 esperam o temporizador
+        temporizador.assert_called_once()
+        self.assertAlmostEqual(temporizador.call_args.args[0], 60, delta=5)
+
+        falhas = Evento.objects.filter(usuario=self.usuario, tipo_evento=Evento.TipoEvento.FALHA_LOGIN)
+        self.assertEqual(falhas.count(), 4)
+        self.assertEqual(limitacao.descarregar_bloqueios(), 0)  # intervalo ainda aberto
+
+        self.assertEqual(limitacao.descarregar_bloqueios(agora=time_module.monotonic() + 61), 1)
+        self.assertEqual(falhas.count(), 5)
+        self.assertIn('3 tentativa(s)', falhas.order_by('-id').first().descricao)
+
+    def test_corpo_json_que_nao_e_objeto_responde_400(self):
+        for rota in ('token_obtain_pair', 'async-login'):
+            resposta = self.client.post(reverse(rota), [{'email': 'alvo@uebax.com'}], format='json')
+            self.assertEqual(resposta.status_code, 400, rota)
+
+    @override_settings(UEBAX_LIMITE_LOGIN={'CAPACIDADE_IP': 1, 'TAXA_IP': 1})
+    def test_spray_de_emails_sem_varredura_e_sem_acumular(self):
+        with mock.patch.object(limitacao.threading, 'Timer') as temporizador:
+            with CaptureQueriesContext(connection) as consultas:
+                for i in range(60):
+                    limitacao.tentar(f'aleatorio{i}@uebax.com', '10.0.0.1')
+            temporizador.assert_called_once()
+            self.assertEqual(len(limitacao._bloqueios), 59)  # a 1ª tentativa passou
+
+            # Busca exata no índice, nunca UPPER()/LIKE
+            usuarios = [q['sql'] for q in consultas.captured_queries if 'core_usuario' in q['sql']]
+            self.assertEqual(len(usuarios), 59)
+            self.assertFalse([sql for sql in usuarios if 'LIKE' in sql or 'UPPER' in sql])
+
+            # O temporizador apaga as entradas cujo intervalo acabou
+            self.assertEqual(limitacao.descarregar_bloqueios(agora=time_module.monotonic() + 61), 0)
+        self.assertEqual(limitacao._bloqueios, {})
+
+    def test_login_valido_devolve_as_fichas(self):
+        for _ in range(5):
+            self.assertEqual(self._login('SenhaForte#123').status_code, 200)
+
+    def test_login_assincrono_tambem_limita(self):
+        for _ in range(3):
+            self._login(rota='async-login')
+        resposta = self._login(rota='async-login')
+        self.assertEqual(resposta.status_code, 429)
+        self.assertIn('Retry-After', resposta)
+
+    def test_balde_em_cache(self):
+        balde = limitacao.BaldeEmCache()
+        baldes = [('email:x@y', 2, 1 / 60)]
+        self.assertEqual(balde.consumir(baldes, 1000.0), 0)
+        self.assertEqual(balde.consumir(baldes, 1000.0), 0)
+        self.assertAlmostEqual(balde.consumir(baldes, 1000.0), 60)
+        self.assertEqual(balde.consumir(baldes, 1060.0), 0)  # reabasteceu uma ficha
+
+
+@override_settings(UEBAX_CAIXA_SAIDA={'INTERVALO_ENVIO': 3600})
+class CaixaDeSaidaTests(UebaxTestCase):
+
+    def test_reset_de_senha_uma_consulta_uma_escrita_e_email_pela_fila(self):
+        usuario = _criar_usuario('esqueci@uebax.com')
+        ResetPasswordToken.emitir(usuario)
+
+        with self.assertNumQueries(2):
+            resposta = self.client.post(reverse('password_reset_request'), {'email': 'esqueci@uebax.com'})
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(ResetPasswordToken.objects.filter(usuario=usuario).count(), 1)
+
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(caixa_saida.obter_caixa().descarregar(), 1)
+        token = ResetPasswordToken.objects.get(usuario=usuario).token
+        self.assertEqual(mail.outbox[0].to, ['esqueci@uebax.com'])
+        self.assertIn(token, mail.outbox[0].body)
+
+    def test_lote_numa_conexao_e_novas_tentativas(self):
+        caixa = caixa_saida.obter_caixa()
+        for i in range(3):
+            caixa_saida.enviar('Assunto', 'Corpo', [f'd{i}@uebax.com'])
+
+        aberturas = []
+        original = caixa_saida.get_connection
+
+        def conexao_que_falha_uma_vez(*args, **kwargs):
+            conexao = original(*args, **kwargs)
+            aberturas.append(conexao)
+            if len(aberturas) == 1:
+                conexao.send_messages = mock.Mock(side_effect=[1, OSError('SMTP caiu'), 1])
+            return conexao
+
+        with mock.patch.object(caixa_saida, 'get_connection', conexao_que_falha_uma_vez):
+            self.assertEqual(caixa.descarregar(agora=0), 2)
+            self.assertEqual(len(aberturas), 1)
+            self.assertEqual(caixa.pendentes(), 1)
+            self.assertEqual(caixa.descarregar(agora=1), 0)   # ainda esperando
+            self.assertEqual(caixa.descarregar(agora=10), 1)
+        self.assertEqual([m.to for m in mail.outbox], [['d1@uebax.com']])
+
+
+class ViewsAssincronasTests(UebaxTestCase):
+
+    async def _preparar(self):
+        self.usuario = await sync_to_async(_criar_usuario)('async@uebax.com')
+        self.cabecalho = {'Authorization': f'Bearer {AccessToken.for_user(self.usuario)}'}
+
+    async def _login(self, senha):
+        return await self.async_client.post(
+            reverse('async-login'), {'email': 'async@uebax.com', 'password': senha},
+            content_type='application/json'
+        )
+
+    async def test_login(self):
+        await self._preparar()
+        resposta = await self._login('SenhaForte#123')
+        self.assertEqual(resposta.status_code, 200)
+        self.assertIn('access', resposta.json())
+        self.assertTrue(await Evento.objects.filter(tipo_evento=Evento.TipoEvento.LOGIN).aexists())
+
+        resposta = await self._login('errada')
+        self.assertEqual(resposta.status_code, 401)
+        self.assertTrue(await Evento.objects.filter(tipo_evento=Evento.TipoEvento.FALHA_LOGIN).aexists())
+
+        resposta = await self.async_client.post(reverse('async-login'), {}, content_type='application/json')
+        self.assertEqual(set(resposta.json()), {'email', 'password'})
+
+    async def test_eventos_e_dashboard(self):
+        await self._preparar()
+        self.assertEqual((await self.async_client.get(reverse('async-event-list'))).status_code, 401)
+
+        await Evento.objects.acreate(usuario=self.usuario, tipo_evento=Evento.TipoEvento.LOGOUT)
+        resposta = await self.async_client.get(reverse('async-event-list'), headers=self.cabecalho)
+        self.assertEqual(resposta.json()['results'][0]['usuario_email'], 'async@uebax.com')
+
+        resposta = await self.async_client.get(reverse('async-dashboard-stats'), headers=self.cabecalho)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertIn('cards', resposta.json())
+
+        resposta = await self.async_client.get(
+            reverse('async-dashboard-stats'), headers={**self.cabecalho, 'If-None-Match': resposta['ETag']}
+        )
+        self.assertEqual(resposta.status_code, 304)
+
+
+@override_settings(UEBAX_COLETOR={'INTERVALO_LOTE': 0.05, 'INTERVALO_LEITURA': 0.05, 'DOMINIO_PADRAO': 'uebax.com'})
+class ColetorTests(UebaxTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.ana = _criar_usuario('ana@uebax.com')
+        self.pasta = tempfile.TemporaryDirectory()
+        self.addCleanup(self.pasta.cleanup)
+        self.log = os.path.join(self.pasta.name, 'auth.log')
+
+    def _escrever(self, texto, modo='a'):
+        with open(self.log, modo) as arquivo:
+            arquivo.write(texto)
+
+    def test_parser_sshd(self):
+        parser = coletor.obter_parser('sshd')
+        aceito = parser.analisar('Jan 31 14:02:11 srv sshd[812]: Accepted publickey for ana from 10.0.0.5 port 5122 ssh2')
+        self.assertEqual(aceito, {'email': 'ana@uebax.com', 'tipo_evento': 'LOGIN', 'descricao': 'ssh publickey de 10.0.0.5'})
+        falha = parser.analisar('<38>Jan 31 14:02:12 srv sshd[813]: Failed password for invalid user bob@corp.com from 10.0.0.9 port 1 ssh2')
+        self.assertEqual((falha['email'], falha['tipo_evento']), ('bob@corp.com', 'FALHA_LOGIN'))
+        saida = parser.analisar('srv sshd[812]: pam_unix(sshd:session): session closed for user ana')
+        self.assertEqual(saida['tipo_evento'], 'LOGOUT')
+        self.assertIsNone(parser.analisar('srv CRON[99]: pam_unix(cron:session): session opened for user root'))
+        with self.assertRaises(ValueError):
+            coletor.obter_parser('ndjson').analisar('sem json')
+        with self.assertRaises(ValueError):
+            coletor.obter_parser('inexistente')
+
+    def test_seguidor_retoma_rotacao_e_truncamento(self):
+        self._escrever('um\ndois\ntr', 'w')
+        seguidor = coletor.SeguidorDeArquivo(self.log, do_inicio=True)
+        self.assertEqual([texto for texto, _ in seguidor.ler(10)], ['um', 'dois'])
+        self._escrever('es\n')
+        [(texto, marca)] = seguidor.ler(10)
+        self.assertEqual((texto, marca[2]), ('tres', os.path.getsize(self.log)))
+        seguidor.fechar()
+
+        # Retoma do offset gravado.
+        self._escrever('quatro\n')
+        seguidor = coletor.SeguidorDeArquivo(self.log, estado={'inode': marca[1], 'offset': marca[2]})
+        self.assertEqual([texto for texto, _ in seguidor.ler(10)], ['quatro'])
+
+        # Rotação: termina o arquivo antigo e lê o novo desde o início.
+        self._escrever('cinco\n')
+        os.rename(self.log, self.log + '.1')
+        self._escrever('seis\n', 'w')
+        self.assertEqual([texto for texto, _ in seguidor.ler(10) + seguidor.ler(10)], ['cinco', 'seis'])
+
+        # Truncamento (copytruncate): volta ao início.
+        self._escrever('7\n', 'w')
+        self.assertEqual([texto for texto, _ in seguidor.ler(10)], ['7'])
+        seguidor.fechar()
+
+    def test_fila_cheia_descarta_udp(self):
+        instancia = coletor.Coletor(arquivo_estado='', tamanho_fila=1)
+        instancia.oferecer(None, 'a')
+        instancia.oferecer(None, 'b')
+        self.assertEqual(instancia.contadores['descartadas'], 1)
+
+    async def test_arquivo_e_udp_ate_o_banco(self):
+        self._escrever(
+            'srv sshd[1]: Failed password for ana from 10.0.0.5 port 1 ssh2\n'
+            'srv sshd[1]: Accepted password for ana from 10.0.0.5 port 1 ssh2\n'
+            'srv sshd[1]: Accepted password for ninguem from 10.0.0.5 port 1 ssh2\n'
+            'srv kernel: qualquer coisa\n', 'w',
+        )
+        estado = os.path.join(self.pasta.name, 'estado.json')
+        instancia = coletor.Coletor(arquivo_estado=estado)
+        instancia.seguir_arquivo(self.log, coletor.obter_parser('sshd'), do_inicio=True)
+        instancia.ouvir_udp('127.0.0.1', 0, coletor.obter_parser('ndjson'))
+        tarefa = asyncio.create_task(instancia.executar())
+        while not instancia.enderecos:
+            await asyncio.sleep(0.01)
+
+        _, host, porta = instancia.enderecos[0]
+        transporte, _ = await asyncio.get_running_loop().create_datagram_endpoint(asyncio.DatagramProtocol, remote_addr=(host, porta))
+        transporte.sendto(b'{"email": "ana@uebax.com", "tipo_evento": "ACESSO_ARQUIVO"}\n<14>app: {quebrado\n')
+        transporte.close()
+
+        for _ in range(200):
+            if instancia.contadores['linhas'] == 6:
+                break
+            await asyncio.sleep(0.02)
+        instancia.parar()
+        contadores = await tarefa
+
+        self.assertEqual(contadores, {'linhas': 6, 'aceitos': 3, 'rejeitados': 1, 'ignoradas': 1, 'erros_parse': 1, 'descartadas': 0, 'perdidos': 0})
+        tipos = await sync_to_async(lambda: sorted(Evento.objects.filter(usuario=self.ana).values_list('tipo_evento', flat=True)))()
+        self.assertEqual(tipos, ['ACESSO_ARQUIVO', 'FALHA_LOGIN', 'LOGIN'])
+        self.assertEqual(coletor.carregar_estado(estado)[self.log]['offset'], os.path.getsize(self.log))
+
+    def _gravar(self, instancia, quantidade):
+        parser = coletor.obter_parser('ndjson')
+        lote = [(parser, '{"email": "ana@uebax.com", "tipo_evento": "LOGOUT"}', None)] * quantidade
+        with mock.patch.object(coletor.asyncio, 'sleep', mock.AsyncMock()):
+            async_to_sync(instancia._gravar)(lote)
+
+    @override_settings(UEBAX_COLETA={'TAMANHO_LOTE': 2})
+    def test_so_a_parte_que_falhou_e_tentada_de_novo(self):
+        instancia = coletor.Coletor(arquivo_estado='')
+        original = ingestao.gravar_lote
+        chamadas = []
+
+        def cai_na_segunda_parte_uma_vez(eventos):
+            chamadas.append(len(eventos))
+            if len(chamadas) == 2:
+                raise OperationalError('database is locked')
+            return original(eventos)
+
+        with mock.patch.object(ingestao, 'gravar_lote', cai_na_segunda_parte_uma_vez):
+            with self.assertLogs('core.coletor', 'ERROR'):
+                self._gravar(instancia, 3)
+        self.assertEqual(chamadas, [2, 1, 1])
+        self.assertEqual(Evento.objects.count(), 3)
+        self.assertEqual((instancia.contadores['aceitos'], instancia.contadores['perdidos']), (3, 0))
+
+    def test_falha_das_regras_depois_do_commit_nao_regrava(self):
+        instancia = coletor.Coletor(arquivo_estado='')
+        with mock.patch('core.utils._analisar_lote', side_effect=RuntimeError('regra quebrada')):
+            with self.assertLogs('core.ingestao', 'ERROR'):
+                self._gravar(instancia, 2)
+        self.assertEqual(Evento.objects.count(), 2)
+        self.assertEqual(instancia.contadores['aceitos'], 2)
+
+    def test_erro_que_nao_e_transitorio_descarta_sem_repetir(self):
+        instancia = coletor.Coletor(arquivo_estado='')
+        with mock.patch.object(ingestao, 'gravar_lote', side_effect=IntegrityError('FOREIGN KEY')) as gravar:
+            with self.assertLogs('core.coletor', 'ERROR'):
+                self._gravar(instancia, 2)
+        gravar.assert_called_once()
+        self.assertEqual((instancia.contadores['aceitos'], instancia.contadores['perdidos']), (0, 2))
+        self.assertFalse(Evento.objects.exists())
+
+    def test_comando_exige_fonte(self):
+        with self.assertRaises(CommandError):
+            call_command('coletar_eventos', stdout=StringIO())
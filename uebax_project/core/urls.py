@@ -1,17 +1,29 @@
 from django.urls import path
-from .views import UserRegistrationView, PasswordResetRequestView, PasswordResetVerifyView, PasswordResetConfirmView, LogoutView, CustomTokenObtainPairView, EventoListView, AlertaListView, DashboardStatsView
+from .views import UserRegistrationView, PasswordResetRequestView, PasswordResetVerifyView, PasswordResetConfirmView, LogoutView, CustomTokenObtainPairView, EventoListView, AlertaListView, DashboardStatsView, EventoExportView, EventoIngestaoView, AlertaExportView
+from . import views_async
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+from .lista_negra import TokenRefreshComFiltroSerializer
 
 
 urlpatterns = [
     path('register/', UserRegistrationView.as_view(), name='register'),
     path('login/', CustomTokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('logout/', LogoutView.as_view(), name='logout'),
-    path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('token/refresh/', TokenRefreshView.as_view(serializer_class=TokenRefreshComFiltroSerializer), name='token_refresh'),
     path('password-reset/request/', PasswordResetRequestView.as_view(), name='password_reset_request'),
     path('password-reset/verify/', PasswordResetVerifyView.as_view(), name='password_reset_verify'),
     path('password-reset/confirm/', PasswordResetConfirmView.as_view(), name='password_reset_confirm'),
     path('events/', EventoListView.as_view(), name='event-list'),
+    path('events/export/', EventoExportView.as_view(), name='event-export'),
+    path('events/ingest/', EventoIngestaoView.as_view(), name='event-ingest'),
     path('alerts/', AlertaListView.as_view(), name='alert-list'),
+    path('alerts/export/', AlertaExportView.as_view(), name='alert-export'),
     path('dashboard/stats/', DashboardStatsView.as_view(), name='dashboard-stats'),
+    path('stream/', views_async.stream_view, name='stream'),
+    path('stream/ticket/', views_async.stream_ticket_view, name='stream-ticket'),
+
+    # Versões assíncronas (ASGI) dos endpoints mais acessados
+    path('async/login/', views_async.login_view, name='async-login'),
+    path('async/events/', views_async.eventos_view, name='async-event-list'),
+    path('async/dashboard/stats/', views_async.dashboard_view, name='async-dashboard-stats'),
 ]
\ No newline at end of file
@@ -1,57 +1,93 @@
-from .models import Usuario, Evento, Alerta
+import time
+
+from .models import Usuario, Evento
 from django.utils import timezone
+from asgiref.sync import sync_to_async
+from . import rollups, ingestao, regras, broker, metricas
 
-def _analisar_evento(evento: Evento):
+def _analisar_lote(eventos):
     """
     Motor de Regras Interno.
-    Esta função é chamada pelo log_event para analisar
-    um evento recém-criado e decidir se gera um alerta.
+    Envia um lote de eventos recém-gravados para o motor de regras
+    declarativo (core/regras.py), que decide quais geram alertas.
+    O tempo gasto entra na métrica uebax_motor_regras_segundos.
+    """
+    inicio = time.perf_counter()
+    try:
+        return regras.obter_motor().analisar(eventos)
+    finally:
+        metricas.registro.observar(metricas.MOTOR, time.perf_counter() - inicio)
+
+
+def _analisar_evento(evento: Evento):
+    """
+    Analisa um único evento recém-criado (atalho para _analisar_lote).
     """
-    
-    # REGRA 1: Acesso fora do horário comercial
-    if evento.tipo_evento == Evento.TipoEvento.LOGIN:
-        hora_do_evento = evento.timestamp.hour
-        
-        #"horário comercial" como 8h às 18h
-        if hora_do_evento < 8 or hora_do_evento > 18:
-            
-            Alerta.objects.create(
-                usuario=evento.usuario,
-                tipo_alerta=Alerta.TipoAlerta.FORA_DO_HORARIO,
-                descricao_detalhada=f"Usuário fez login fora do horário comercial (às {hora_do_evento}h)."
-            )
-    
-    # REGRA 2: Múltiplas Falhas de Login
-    if evento.tipo_evento == Evento.TipoEvento.FALHA_LOGIN:
-        dez_minutos_atras = timezone.now() - timezone.timedelta(minutes=10)
-        falhas_recentes = Evento.objects.filter(
-            usuario=evento.usuario,
-            tipo_evento=Evento.TipoEvento.FALHA_LOGIN,
-            timestamp__gte=dez_minutos_atras
-        ).count()
-        
-        # limite (5 falhas)
-        if falhas_recentes >= 5:
-            Alerta.objects.get_or_create(
-                usuario=evento.usuario,
-                tipo_alerta=Alerta.TipoAlerta.FALHA_LOGIN_MULTIPLA,
-                defaults={'descricao_detalhada': f"Detectadas {falhas_recentes} falhas de login em 10 minutos."}
-            )
+    _analisar_lote([evento])
 
 
 def log_event(usuario: Usuario, tipo_evento: Evento.TipoEvento, descricao: str = None):
 
     # MOTOR DE EVENTOS (UEBAX)
     # Esta é a função central para registrar qualquer atividade no sistema.
-    
+
+    # Modo "buffer": o evento entra na fila e é gravado/analisado em lote
+    # pela thread de ingestão (ver core/ingestao.py). O objeto retornado
+    # só recebe pk depois da descarga.
+    if ingestao.modo_buffer():
+        evento = _evento_para_buffer(usuario, tipo_evento, descricao)
+        if not ingestao.obter_buffer().adicionar(evento):
+            # Fila cheia: grava este na hora (backpressure).
+            ingestao.gravar_lote([evento])
+        return evento
+
     #Cria o evento no banco de dados
     evento = Evento.objects.create(
         usuario=usuario,
         tipo_evento=tipo_evento,
         descricao=descricao
     )
-    
+
+    _processar_evento_gravado(evento)
+
+    return evento
+
+
+def _evento_para_buffer(usuario, tipo_evento, descricao):
+    return Evento(
+        usuario=usuario,
+        tipo_evento=tipo_evento,
+        descricao=descricao,
+        timestamp=timezone.now()
+    )
+
+
+def _processar_evento_gravado(evento: Evento):
+    # Atualiza as contagens pré-agregadas (rollups por hora)
+    rollups.registrar_eventos([evento])
+    broker.publicar_eventos([evento])
+
     #Imediatamente, envia o evento para análise do motor de regras
     _analisar_evento(evento)
-    
-    return evento
\ No newline at end of file
+
+
+async def alog_event(usuario: Usuario, tipo_evento: Evento.TipoEvento, descricao: str = None):
+
+    # Versão assíncrona do log_event, para as views ASGI (core/views_async.py).
+    # O INSERT usa o ORM assíncrono; rollups e regras rodam em seguida via
+    # sync_to_async. No modo "buffer" só enfileira, sem I/O; com a fila
+    # cheia, a gravação do evento sai do event loop (sync_to_async).
+
+    if ingestao.modo_buffer():
+        evento = _evento_para_buffer(usuario, tipo_evento, descricao)
+        if not ingestao.obter_buffer().adicionar(evento):
+            await sync_to_async(ingestao.gravar_lote)([evento])
+        return evento
+
+    evento = await Evento.objects.acreate(
+        usuario=usuario,
+        tipo_evento=tipo_evento,
+        descricao=descricao
+    )
+    await sync_to_async(_processar_evento_gravado)(evento)
+    return evento
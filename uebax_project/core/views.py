@@ -2,16 +2,23 @@ from django.shortcuts import render
 from rest_framework.views import APIView
 from rest_framework import generics, status
 from rest_framework.response import Response
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from .serializers import UserRegistrationSerializer, PasswordResetRequestSerializer, PasswordResetVerifySerializer, PasswordResetConfirmSerializer, LogoutSerializer, CustomTokenObtainPairSerializer, AlertaSerializer, EventoSerializer
-from .models import Usuario, ResetPasswordToken, Evento, Alerta
-from django.core.mail import send_mail
-from django.conf import settings
+from .models import Usuario, ResetPasswordToken, Evento, Alerta, EventoRollupHora, AlertaRollupHora
 from rest_framework_simplejwt.views import TokenObtainPairView
 from django.utils import timezone
-from django.db.models import Count
-from django.db.models.functions import ExtractHour
+from django.db.models import BooleanField, Count, Exists, ExpressionWrapper, OuterRef, Q, Sum
 from .utils import log_event
+from .paginacao import PaginacaoPorCursor
+from . import caixa_saida, cache_dashboard, coleta, limitacao, retencao, rollups
+from .banco import LeituraEmReplicaMixin
+from rest_framework.exceptions import ValidationError
+from django.utils.dateparse import parse_date, parse_datetime
+from django.http import StreamingHttpResponse
+from datetime import datetime, time, timedelta
+import csv
+import itertools
+import json
 
 class UserRegistrationView(generics.CreateAPIView):
     
@@ -29,6 +36,8 @@ class UserRegistrationView(generics.CreateAPIView):
         
         if serializer.is_valid():
             self.perform_create(serializer)
+            # Novo usuário aparece na tabela de status do dashboard
+            cache_dashboard.invalidar()
 
             return Response(
                 {"message": "Cadastro realizado com sucesso!"}, 
@@ -49,12 +58,10 @@ class PasswordResetRequestView(generics.GenericAPIView):
         serializer = self.get_serializer(data=request.data)
         
         if serializer.is_valid():
-            email = serializer.validated_data['email']
-            usuario = Usuario.objects.get(email=email)
-            
-            token, created = ResetPasswordToken.objects.get_or_create(usuario=usuario)
-            
-            token.save()
+            # O serializer já buscou o usuário; o token é uma única escrita
+            # e o e-mail sai pela caixa de saída (core/caixa_saida.py).
+            usuario = serializer.validated_data['usuario']
+            token = ResetPasswordToken.emitir(usuario)
 
             subject = 'Seu código de redefinição de senha do UEBAX'
             message = f'Olá, {usuario.nome_completo}!\n\n' \
@@ -62,10 +69,7 @@ class PasswordResetRequestView(generics.GenericAPIView):
                       f'Este token expira em 5 minutos.\n' \
                       f'Se você não solicitou isso, ignore este e-mail.'
             
-            from_email = settings.DEFAULT_FROM_EMAIL
-            recipient_list = [usuario.email]
-            
-            send_mail(subject, message, from_email, recipient_list)
+            caixa_saida.enviar(subject, message, [usuario.email])
             
             return Response(
                 {"message": "Token enviado para o seu e-mail com sucesso!"},
@@ -143,56 +147,345 @@ class LogoutView(generics.GenericAPIView):
 class CustomTokenObtainPairView(TokenObtainPairView):
     
     # View de Login customizada.
-    # A única mudança é dizer ao simple-jwt para usar nosso
-    # serializer customizado (que registra o log).
+    # Usa o nosso serializer (que registra o log) e limita as tentativas
+    # por e-mail e IP antes de verificar a senha (ver core/limitacao.py).
     
     serializer_class = CustomTokenObtainPairSerializer
+    throttle_classes = [limitacao.LimiteDeLogin]
 
-class EventoListView(generics.ListAPIView):
+    def post(self, request, *args, **kwargs):
+        resposta = super().post(request, *args, **kwargs)
+        limitacao.sucesso(limitacao.email_da_requisicao(request), limitacao.ip_do_cliente(request))
+        return resposta
+
+def _parse_momento(valor, nome):
+    # Aceita data (AAAA-MM-DD) ou data/hora ISO; sem fuso, usa o fuso local.
+    momento = parse_datetime(valor)
+    if momento is None:
+        dia = parse_date(valor)
+        if dia is None:
+            raise ValidationError({nome: 'Use AAAA-MM-DD ou data/hora ISO 8601.'})
+        momento = datetime.combine(dia, time.min)
+    if timezone.is_naive(momento):
+        momento = timezone.make_aware(momento)
+    return momento
+
+
+def filtrar_por_parametros(queryset, params, campo_tipo, tipos_validos):
+    # Filtros comuns das listagens e exportações:
+    #   ?tipo=  ?usuario=<id>  ?usuario_email=  ?inicio=  ?fim=
+    # Todos casam com os índices (usuario, tipo, timestamp) e (tipo, timestamp).
+    tipo = params.get('tipo')
+    if tipo:
+        if tipo not in tipos_validos:
+            raise ValidationError({'tipo': f'Tipo inválido: {tipo}'})
+        queryset = queryset.filter(**{campo_tipo: tipo})
+
+    usuario = params.get('usuario')
+    if usuario:
+        if not usuario.isdigit():
+            raise ValidationError({'usuario': 'Deve ser o id numérico do usuário.'})
+        queryset = queryset.filter(usuario_id=int(usuario))
+
+    usuario_email = params.get('usuario_email')
+    if usuario_email:
+        queryset = queryset.filter(usuario__email=usuario_email)
+
+    if params.get('inicio'):
+        queryset = queryset.filter(timestamp__gte=_parse_momento(params['inicio'], 'inicio'))
+    if params.get('fim'):
+        queryset = queryset.filter(timestamp__lt=_parse_momento(params['fim'], 'fim'))
+
+    return queryset
+
+
+class EventoListView(LeituraEmReplicaMixin, generics.ListAPIView):
     
     # Endpoint para a "Tabela de Eventos" (Tela 6).
-    # Retorna uma lista de todos os eventos.
+    # Retorna os eventos paginados por cursor, do mais recente para o mais
+    # antigo, com filtros opcionais (ver filtrar_por_parametros).
     
-    queryset = Evento.objects.all() 
     serializer_class = EventoSerializer
+    pagination_class = PaginacaoPorCursor
 
     permission_classes = [IsAuthenticated]
 
+    def get_queryset(self):
+        queryset = Evento.objects.select_related('usuario').only(
+            'id', 'tipo_evento', 'timestamp', 'usuario__email'
+        )
+        return filtrar_por_parametros(
+            queryset, self.request.query_params, 'tipo_evento', Evento.TipoEvento.values
+        )
+
 
-class AlertaListView(generics.ListAPIView):
+class AlertaListView(LeituraEmReplicaMixin, generics.ListAPIView):
     
     # Endpoint para a "Tabela de Alertas" (Tela 6).
-    # Retorna uma lista de todos os alertas.
+    # Retorna os alertas paginados por cursor, com os mesmos filtros.
     
-    queryset = Alerta.objects.all() 
     serializer_class = AlertaSerializer
+    pagination_class = PaginacaoPorCursor
     permission_classes = [IsAuthenticated]
 
-class DashboardStatsView(APIView):
-    
-    # Endpoint mestre para a tela principal do Dashboard.
-    # (VERSÃO CORRIGIDA PARA FUSO HORÁRIO)
-    
+    def get_queryset(self):
+        queryset = Alerta.objects.select_related('usuario').only(
+            'id', 'tipo_alerta', 'timestamp', 'ocorrencias', 'usuario__email'
+        )
+        return filtrar_por_parametros(
+            queryset, self.request.query_params, 'tipo_alerta', Alerta.TipoAlerta.values
+        )
+
+class EventoIngestaoView(APIView):
+
+    # Ingestão em massa para agentes externos (ver core/coleta.py).
+    # Corpo em NDJSON (Content-Type: application/x-ndjson, lido linha a
+    # linha) ou um array JSON. Só para contas de serviço (is_staff).
+    # Responde com as contagens de aceitos/rejeitados do lote.
+
+    permission_classes = [IsAdminUser]
+
+    def post(self, request, *args, **kwargs):
+        if request.content_type.split(';')[0].strip() == 'application/x-ndjson':
+            itens = coleta.ler_ndjson(request.stream or [])
+        else:
+            try:
+                registros = json.load(request.stream) if request.stream else []
+            except ValueError:
+                raise ValidationError({'detail': 'JSON inválido.'})
+            if not isinstance(registros, list):
+                raise ValidationError({'detail': 'Envie um array JSON de eventos ou NDJSON.'})
+            itens = ((registro, None) for registro in registros)
+
+        try:
+            resumo = coleta.ingerir(itens)
+        except OverflowError as erro:
+            return Response({'detail': str(erro)}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        return Response(resumo, status=status.HTTP_200_OK)
+
+
+class _Eco:
+    # "Arquivo" que só devolve o que recebe; permite usar csv.writer linha
+    # a linha dentro de um gerador (padrão da documentação do Django).
+    def write(self, valor):
+        return valor
+
+
+class ExportacaoView(LeituraEmReplicaMixin, APIView):
+
+    # Base das exportações para SIEM (/events/export/ e /alerts/export/).
+    # Transmite as linhas em NDJSON (padrão) ou CSV, lendo o banco em blocos
+    # com iterator(), então a memória não cresce com o tamanho do histórico.
+    # Aceita os filtros de filtrar_por_parametros e ?since_id=<id> para
+    # retomar a exportação de onde parou (a saída é ordenada por id).
+
     permission_classes = [IsAuthenticated]
 
+    modelo = None
+    campo_tipo = None
+    tipos_validos = ()
+    colunas = ()
+    nome_arquivo = None
+    tamanho_bloco = 2000
+
     def get(self, request, *args, **kwargs):
-        agora = timezone.localtime(timezone.now())
-        hoje = agora.date()
-        
-        # Cálculo dos 4 Cards 
+        formato = request.query_params.get('formato', 'ndjson')
+        if formato not in ('ndjson', 'csv'):
+            raise ValidationError({'formato': 'Use ndjson ou csv.'})
 
-        eventos_hoje = Evento.objects.filter(timestamp__date=hoje)
-        alertas_hoje = Alerta.objects.filter(timestamp__date=hoje)
+        queryset = filtrar_por_parametros(
+            self.modelo.objects.all(), request.query_params, self.campo_tipo, self.tipos_validos
+        )
+        since_id = request.query_params.get('since_id')
+        if since_id:
+            if not since_id.isdigit():
+                raise ValidationError({'since_id': 'Deve ser um id numérico.'})
+            queryset = queryset.filter(id__gt=int(since_id))
+
+        # A resposta é lida depois do dispatch (fora de em_replica()): fixa
+        # o banco escolhido agora.
+        queryset = queryset.using(queryset.db)
+        linhas = (
+            queryset.order_by('id')
+            .values_list(*self.colunas)
+            .iterator(chunk_size=self.tamanho_bloco)
+        )
+        if request.query_params.get('arquivo') == '1':
+            linhas = itertools.chain(self._arquivados(request.query_params), linhas)
+
+        if formato == 'csv':
+            corpo = self._csv(linhas)
+            content_type = 'text/csv; charset=utf-8'
+        else:
+            corpo = self._ndjson(linhas)
+            content_type = 'application/x-ndjson'
+
+        resposta = StreamingHttpResponse(corpo, content_type=content_type)
+        resposta['Content-Disposition'] = f'attachment; filename="{self.nome_arquivo}.{formato}"'
+        return resposta
+
+    def _nomes(self):
+        return [coluna.replace('__', '_') for coluna in self.colunas]
+
+    def _arquivados(self, params):
+        # Linhas que já saíram da tabela viva (?arquivo=1); ver EventoExportView.
+        return iter(())
+
+    def _ndjson(self, linhas):
+        nomes = self._nomes()
+        for linha in linhas:
+            registro = {
+                nome: valor.isoformat() if isinstance(valor, datetime) else valor
+                for nome, valor in zip(nomes, linha)
+            }
+            yield json.dumps(registro, ensure_ascii=False) + '\n'
+
+    def _csv(self, linhas):
+        escritor = csv.writer(_Eco())
+        yield escritor.writerow(self._nomes())
+        for linha in linhas:
+            yield escritor.writerow(
+                valor.isoformat() if isinstance(valor, datetime) else valor for valor in linha
+            )
+
+
+class EventoExportView(ExportacaoView):
+    modelo = Evento
+    campo_tipo = 'tipo_evento'
+    tipos_validos = Evento.TipoEvento.values
+    colunas = retencao.COLUNAS
+    nome_arquivo = 'eventos'
+
+    def _arquivados(self, params):
+        # Eventos arquivados pela retenção (core/retencao.py), antes dos vivos.
+        nomes = self._nomes()
+        registros = retencao.ler(
+            inicio=_parse_momento(params['inicio'], 'inicio') if params.get('inicio') else None,
+            fim=_parse_momento(params['fim'], 'fim') if params.get('fim') else None,
+            tipo=params.get('tipo'),
+            usuario_id=int(params['usuario']) if params.get('usuario') else None,
+            usuario_email=params.get('usuario_email'),
+            desde_id=int(params['since_id']) if params.get('since_id') else None,
+        )
+        return (tuple(registro[nome] for nome in nomes) for registro in registros)
+
+
+class AlertaExportView(ExportacaoView):
+    modelo = Alerta
+    campo_tipo = 'tipo_alerta'
+    tipos_validos = Alerta.TipoAlerta.values
+    colunas = (
+        'id', 'timestamp', 'ultima_ocorrencia', 'ocorrencias', 'tipo_alerta',
+        'usuario_id', 'usuario__email', 'descricao_detalhada',
+    )
+    nome_arquivo = 'alertas'
 
-        logins_hoje = eventos_hoje.filter(tipo_evento=Evento.TipoEvento.LOGIN).count()
-        
-        alertas_ativos = alertas_hoje.count()
 
-        dispositivos_hoje = eventos_hoje.filter(
-            tipo_evento=Evento.TipoEvento.LOGIN
-        ).values('usuario').distinct().count()
+def _etags_do_cliente(request):
+    cabecalho = request.headers.get('If-None-Match', '')
+    return {etag.strip() for etag in cabecalho.split(',') if etag.strip()}
 
-        ultimo_evento_obj = eventos_hoje.order_by('-timestamp').first()
+
+class DashboardStatsView(LeituraEmReplicaMixin, APIView):
+    
+    # Endpoint mestre para a tela principal do Dashboard.
+    # (VERSÃO CORRIGIDA PARA FUSO HORÁRIO)
+    
+    permission_classes = [IsAuthenticated]
+
+    STATUS_LIMITE_PADRAO = 50
+    STATUS_LIMITE_MAXIMO = 500
+
+    def get(self, request, *args, **kwargs):
+        hoje = timezone.localdate()
+
+        # O payload fica no cache (ver core/cache_dashboard.py). Se o cliente
+        # já tem a versão atual (If-None-Match), responde 304 sem serializar.
+        status_limite, status_pagina, apenas_ativos = self._parametros_status(request.query_params)
+        variante = f'{status_limite}:{status_pagina}:{int(apenas_ativos)}'
+
+        em_cache = cache_dashboard.obter(hoje, variante)
+        if em_cache is None:
+            dados = self._calcular(hoje, status_limite, status_pagina, apenas_ativos)
+            etag = cache_dashboard.guardar(hoje, dados, variante)
+        else:
+            etag, dados = em_cache
+
+        if etag in _etags_do_cliente(request):
+            resposta = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            resposta = Response(dados, status=status.HTTP_200_OK)
+        resposta['ETag'] = etag
+        resposta['Cache-Control'] = 'private, no-cache'
+        return resposta
+
+    def _parametros_status(self, params):
+        # Tabela de status: ?status_limite= (padrão 50, máx. 500),
+        # ?status_pagina= (a partir de 1) e ?apenas_ativos=1.
+        try:
+            status_limite = int(params.get('status_limite', self.STATUS_LIMITE_PADRAO))
+            status_pagina = int(params.get('status_pagina', 1))
+        except ValueError:
+            raise ValidationError('status_limite e status_pagina devem ser inteiros.')
+        status_limite = max(1, min(status_limite, self.STATUS_LIMITE_MAXIMO))
+        status_pagina = max(1, status_pagina)
+        apenas_ativos = params.get('apenas_ativos', '').lower() in ('1', 'true', 'sim')
+        return status_limite, status_pagina, apenas_ativos
+
+    def _calcular(self, hoje, status_limite, status_pagina, apenas_ativos):
+
+        # Intervalo [00:00, 00:00 do dia seguinte) no fuso local. Filtrar por
+        # intervalo (e não por timestamp__date) permite usar os índices.
+        inicio_dia = timezone.make_aware(datetime.combine(hoje, time.min))
+        fim_dia = timezone.make_aware(datetime.combine(hoje + timedelta(days=1), time.min))
+
+        # Contagens vêm dos rollups por hora (O(horas), não O(eventos)).
+        # Os rollups cobrem horas UTC inteiras. Num fuso de deslocamento
+        # fracionário (ex.: Asia/Kolkata, +05:30) o dia local começa e
+        # termina no meio de uma hora UTC: esses dois pedaços, menores que
+        # uma hora, são contados nos eventos e alertas brutos.
+        primeira_hora = rollups.primeira_hora_completa(inicio_dia)
+        ultima_hora = rollups.inicio_da_hora(fim_dia)
+        pedacos = [(a, b) for a, b in ((inicio_dia, primeira_hora), (ultima_hora, fim_dia)) if a < b]
+        no_pedaco = Q()
+        for a, b in pedacos:
+            no_pedaco |= Q(timestamp__gte=a, timestamp__lt=b)
+
+        rollups_hoje = EventoRollupHora.objects.filter(hora__gte=primeira_hora, hora__lt=ultima_hora)
+        logins_rollup = rollups_hoje.filter(tipo_evento=Evento.TipoEvento.LOGIN)
+        logins_brutos = Evento.objects.filter(no_pedaco, tipo_evento=Evento.TipoEvento.LOGIN)
+
+        # Cálculo dos 4 Cards
+
+        totais = logins_rollup.aggregate(
+            logins=Sum('total'),
+            dispositivos=Count('usuario', distinct=True),
+        )
+        logins_hoje = totais['logins'] or 0
+        dispositivos_hoje = totais['dispositivos']
+
+        alertas_ativos = AlertaRollupHora.objects.filter(
+            hora__gte=primeira_hora, hora__lt=ultima_hora
+        ).aggregate(total=Sum('total'))['total'] or 0
+
+        # Logins de cada pedaço (cada um cabe numa hora local só)
+        logins_por_pedaco = []
+        if pedacos:
+            contagens = logins_brutos.aggregate(**{
+                f'pedaco_{i}': Count('id', filter=Q(timestamp__gte=a, timestamp__lt=b))
+                for i, (a, b) in enumerate(pedacos)
+            })
+            logins_por_pedaco = [
+                (timezone.localtime(a).hour, contagens[f'pedaco_{i}']) for i, (a, b) in enumerate(pedacos)
+            ]
+            logins_hoje += sum(quantidade for _, quantidade in logins_por_pedaco)
+            alertas_ativos += Alerta.objects.filter(no_pedaco).count()
+
+        # Busca indexada por timestamp com LIMIT 1
+        ultimo_evento_obj = (
+            Evento.objects.filter(timestamp__gte=inicio_dia, timestamp__lt=fim_dia)
+            .order_by('-timestamp').only('tipo_evento', 'timestamp').first()
+        )
         ultimo_evento_str = "Nenhum evento hoje"
         
         if ultimo_evento_obj:
@@ -201,28 +494,37 @@ class DashboardStatsView(APIView):
 
         # Dados do "Gráfico em Linha" (Logins por Hora) 
 
-        logins_obj = eventos_hoje.filter(tipo_evento=Evento.TipoEvento.LOGIN)
         logins_por_hora_dados = [0] * 24
-        
-        for evento in logins_obj:
-            hora = timezone.localtime(evento.timestamp).hour
-            logins_por_hora_dados[hora] += 1
+        logins_por_hora = logins_rollup.values('hora').annotate(total_hora=Sum('total')).order_by()
+        for linha in logins_por_hora:
+            # Com deslocamento fracionário, a hora UTC conta na hora local
+            # em que começa.
+            hora = timezone.localtime(linha['hora']).hour
+            logins_por_hora_dados[hora] += linha['total_hora']
+        for hora, quantidade in logins_por_pedaco:
+            logins_por_hora_dados[hora] += quantidade
 
         # Tabela de "Status de Conexão" 
         
-        usuarios_ativos_ids = eventos_hoje.filter(
-            tipo_evento=Evento.TipoEvento.LOGIN
-        ).values_list('usuario__id', flat=True).distinct()
-        
-        status_conexao = []
-        todos_usuarios = Usuario.objects.all()
-        
-        for usuario in todos_usuarios:
-            user_status = "Ativo" if usuario.id in usuarios_ativos_ids else "Inativo"
-            status_conexao.append({
-                "nome_usuario": usuario.nome_completo,
-                "status": user_status
-            })
+        # Um único SELECT: cada usuário anotado com EXISTS(login hoje) nos
+        # rollups, trazendo só o nome. Ativos primeiro, depois por nome.
+        logou_hoje = Exists(logins_rollup.filter(usuario_id=OuterRef('pk')))
+        if pedacos:
+            logou_hoje = ExpressionWrapper(
+                logou_hoje | Exists(logins_brutos.filter(usuario_id=OuterRef('pk'))),
+                output_field=BooleanField(),
+            )
+            dispositivos_hoje = Usuario.objects.filter(logou_hoje).count()
+        usuarios = Usuario.objects.annotate(ativo=logou_hoje)
+        if apenas_ativos:
+            usuarios = usuarios.filter(ativo=True)
+        usuarios = usuarios.order_by('-ativo', 'nome_completo', 'id').values_list('nome_completo', 'ativo')
+
+        inicio_pagina = (status_pagina - 1) * status_limite
+        status_conexao = [
+            {"nome_usuario": nome, "status": "Ativo" if ativo else "Inativo"}
+            for nome, ativo in usuarios[inicio_pagina:inicio_pagina + status_limite]
+        ]
 
         # Monta a Resposta Final 
         
@@ -240,4 +542,4 @@ class DashboardStatsView(APIView):
             "tabela_status_conexao": status_conexao
         }
         
-        return Response(data, status=status.HTTP_200_OK)
\ No newline at end of file
+        return data
@@ -0,0 +1,255 @@
+import json
+import math
+
+from asgiref.sync import sync_to_async
+from django.core import signing
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import Throttled, ValidationError
+from rest_framework.request import Request
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+
+from .autenticacao import ausuario_do_token, verificar_senha
+from .models import Usuario, Evento
+from .paginacao import PaginacaoPorCursor
+from .serializers import CustomTokenObtainPairSerializer, EventoSerializer
+from .utils import alog_event
+from .views import DashboardStatsView, filtrar_por_parametros, _etags_do_cliente
+from . import broker, cache_dashboard, limitacao
+
+# Views Assíncronas (ASGI)
+# Versões "async def" dos endpoints mais quentes, para rodar sob asgi.py
+# (ex.: uvicorn uebax_project.asgi:application). Nenhuma delas prende uma
+# thread durante o request: o hash da senha vai para um pool limitado
+# (core/autenticacao.py) e o banco é acessado pelo ORM assíncrono.
+# As views DRF originais continuam nos mesmos caminhos sem o prefixo async/.
+
+MENSAGEM_NAO_AUTENTICADO = 'As credenciais de autenticação não foram fornecidas.'
+
+STREAM_INTERVALO_KEEPALIVE = 15  # segundos
+STREAM_VALIDADE_TICKET = 60      # segundos para abrir o stream com um ticket
+STREAM_SALT = 'core.stream'
+
+
+async def _autenticar(request):
+    # Valida o access token (CPU, sem I/O) e busca o usuário no cache ou
+    # com o ORM assíncrono. Retorna None se não autenticado.
+    autenticacao = JWTAuthentication()
+    cabecalho = autenticacao.get_header(request)
+    token_bruto = autenticacao.get_raw_token(cabecalho) if cabecalho else None
+    if not token_bruto:
+        return None
+
+    try:
+        token = autenticacao.get_validated_token(token_bruto)
+    except InvalidToken:
+        return None
+
+    return await ausuario_do_token(token)
+
+
+async def _usuario_do_ticket(ticket):
+    # Ticket de stream: id do usuário assinado (salt próprio, não vale
+    # como token em outro lugar) e com validade curta.
+    try:
+        usuario_id = signing.TimestampSigner(salt=STREAM_SALT).unsign(ticket, max_age=STREAM_VALIDADE_TICKET)
+    except signing.BadSignature:
+        return None
+    return await Usuario.objects.filter(pk=usuario_id, is_active=True).afirst()
+
+
+def _sem_asgi():
+    # Sob WSGI a resposta infinita prenderia uma thread do servidor sem
+    # nunca entregar nada: recusa logo, e o frontend volta ao polling.
+    return JsonResponse(
+        {'detail': 'Push em tempo real indisponível: o servidor não está rodando via ASGI.'}, status=503,
+    )
+
+
+def _nao_autenticado():
+    return JsonResponse({'detail': MENSAGEM_NAO_AUTENTICADO}, status=401)
+
+
+@csrf_exempt
+async def login_view(request):
+
+    # Login assíncrono: mesmo contrato do /login/ (email + password ->
+    # refresh + access) e mesmos eventos LOGIN / FALHA_LOGIN.
+
+    if request.method != 'POST':
+        return JsonResponse({'detail': 'Método não permitido.'}, status=405)
+
+    try:
+        dados = json.loads(request.body or b'{}')
+    except ValueError:
+        return JsonResponse({'detail': 'JSON inválido.'}, status=400)
+    if not isinstance(dados, dict):
+        return JsonResponse({'detail': 'Esperado um objeto JSON.'}, status=400)
+
+    email = dados.get('email')
+    senha = dados.get('password')
+    erros = {campo: ['Este campo é obrigatório.'] for campo, valor in (('email', email), ('password', senha)) if not valor}
+    if erros:
+        return JsonResponse(erros, status=400)
+
+    ip = limitacao.ip_do_cliente(request)
+    espera = await sync_to_async(limitacao.tentar)(email, ip)
+    if espera:
+        recusa = Throttled(wait=espera)
+        resposta = JsonResponse({'detail': str(recusa.detail)}, status=recusa.status_code)
+        resposta['Retry-After'] = str(math.ceil(espera))
+        return resposta
+
+    usuario = await Usuario.objects.filter(email=email).afirst()
+    senha_confere = await verificar_senha(usuario, senha)
+
+    if not senha_confere or not usuario.is_active:
+        if usuario is not None:
+            await alog_event(
+                usuario=usuario,
+                tipo_evento=Evento.TipoEvento.FALHA_LOGIN,
+                descricao="Tentativa de login com senha incorreta."
+            )
+        return JsonResponse(
+            {'detail': str(CustomTokenObtainPairSerializer.default_error_messages['no_active_account'])},
+            status=401
+        )
+
+    # get_token grava o OutstandingToken (blacklist), por isso sync_to_async
+    refresh = await sync_to_async(CustomTokenObtainPairSerializer.get_token)(usuario)
+    await alog_event(usuario=usuario, tipo_evento=Evento.TipoEvento.LOGIN)
+    await sync_to_async(limitacao.sucesso)(email, ip)
+
+    return JsonResponse({'refresh': str(refresh), 'access': str(refresh.access_token)})
+
+
+async def eventos_view(request):
+
+    # Listagem assíncrona de eventos: mesmos filtros e paginação por
+    # cursor do /events/.
+
+    usuario = await _autenticar(request)
+    if usuario is None:
+        return _nao_autenticado()
+
+    requisicao = Request(request)
+    paginacao = PaginacaoPorCursor()
+    try:
+        queryset = filtrar_por_parametros(
+            Evento.objects.select_related('usuario').only('id', 'tipo_evento', 'timestamp', 'usuario__email'),
+            requisicao.query_params, 'tipo_evento', Evento.TipoEvento.values
+        )
+        pagina = await paginacao.apaginate_queryset(queryset, requisicao)
+    except ValidationError as erro:
+        return JsonResponse(erro.detail, status=400)
+
+    return JsonResponse({
+        'next': paginacao.get_next_link(),
+        'results': EventoSerializer(pagina, many=True).data,
+    })
+
+
+async def dashboard_view(request):
+
+    # Dashboard assíncrono: lê o cache primeiro (caso comum); só recalcula
+    # quando o cache foi invalidado.
+
+    usuario = await _autenticar(request)
+    if usuario is None:
+        return _nao_autenticado()
+
+    dashboard = DashboardStatsView()
+    try:
+        status_limite, status_pagina, apenas_ativos = dashboard._parametros_status(request.GET)
+    except ValidationError as erro:
+        return JsonResponse(erro.detail, status=400, safe=False)
+
+    hoje = timezone.localdate()
+    variante = f'{status_limite}:{status_pagina}:{int(apenas_ativos)}'
+
+    em_cache = await sync_to_async(cache_dashboard.obter)(hoje, variante)
+    if em_cache is None:
+        dados = await sync_to_async(dashboard._calcular)(hoje, status_limite, status_pagina, apenas_ativos)
+        etag = await sync_to_async(cache_dashboard.guardar)(hoje, dados, variante)
+    else:
+        etag, dados = em_cache
+
+    if etag in _etags_do_cliente(request):
+        resposta = HttpResponse(status=304)
+    else:
+        resposta = JsonResponse(dados)
+    resposta['ETag'] = etag
+    resposta['Cache-Control'] = 'private, no-cache'
+    return resposta
+
+
+@csrf_exempt
+async def stream_ticket_view(request):
+
+    # POST /api/stream/ticket/ (Authorization: Bearer <access>) ->
+    # {"ticket": ..., "validade": segundos}. O EventSource do navegador
+    # não envia cabeçalhos, então o stream é aberto com este ticket na URL
+    # em vez do access token: ele só serve para o /api/stream/ e expira em
+    # STREAM_VALIDADE_TICKET segundos, então o que ficar nos logs de acesso
+    # não vale nada depois. Responde 503 se o push não está disponível
+    # (servidor WSGI); o cliente deve então usar polling.
+
+    if request.method != 'POST':
+        return JsonResponse({'detail': 'Método não permitido.'}, status=405)
+    if not isinstance(request, ASGIRequest):
+        return _sem_asgi()
+
+    usuario = await _autenticar(request)
+    if usuario is None:
+        return _nao_autenticado()
+
+    ticket = signing.TimestampSigner(salt=STREAM_SALT).sign(str(usuario.pk))
+    return JsonResponse({'ticket': ticket, 'validade': STREAM_VALIDADE_TICKET})
+
+
+async def stream_view(request):
+
+    # Endpoint de push em tempo real (Server-Sent Events): /api/stream/
+    # Envia os eventos e alertas assim que são gravados (ver core/broker.py).
+    # Parâmetros: ?canais=alertas,eventos (padrão: ambos) e ?ticket= (ver
+    # stream_ticket_view); clientes que enviam cabeçalhos podem usar o
+    # Authorization: Bearer no lugar do ticket.
+    # Só funciona via ASGI (asgi.py); sob WSGI responde 503.
+
+    if request.method != 'GET':
+        return JsonResponse({'detail': 'Método não permitido.'}, status=405)
+    if not isinstance(request, ASGIRequest):
+        return _sem_asgi()
+
+    ticket = request.GET.get('ticket')
+    usuario = await (_usuario_do_ticket(ticket) if ticket else _autenticar(request))
+    if usuario is None:
+        return _nao_autenticado()
+
+    canais = [c for c in request.GET.get('canais', ','.join(broker.CANAIS)).split(',') if c]
+    if not canais or set(canais) - set(broker.CANAIS):
+        return JsonResponse({'canais': f'Use um ou mais de: {", ".join(broker.CANAIS)}.'}, status=400)
+
+    assinatura = broker.obter_broker().assinar(canais)
+
+    async def gerar():
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                mensagens = await assinatura.aguardar(timeout=STREAM_INTERVALO_KEEPALIVE)
+                if not mensagens:
+                    # Comentário SSE: mantém proxies e o navegador conectados
+                    yield ': keep-alive\n\n'
+                    continue
+                for canal, mensagem in mensagens:
+                    yield f'event: {canal}\ndata: {json.dumps(mensagem, ensure_ascii=False)}\n\n'
+        finally:
+            assinatura.cancelar()
+
+    resposta = StreamingHttpResponse(gerar(), content_type='text/event-stream')
+    resposta['Cache-Control'] = 'no-cache'
+    resposta['X-Accel-Buffering'] = 'no'
+    return resposta
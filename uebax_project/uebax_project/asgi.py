@@ -5,6 +5,9 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+
+Sirva com um servidor ASGI (ex.: uvicorn uebax_project.asgi:application)
+para usar as views assíncronas (/api/async/...) e o push em /api/stream/.
 """
 
 import os
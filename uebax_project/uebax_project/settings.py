@@ -1,5 +1,8 @@
+import os
 from pathlib import Path
 
+from . import bancos
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -33,6 +36,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.metricas.MetricasMiddleware',
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     'corsheaders.middleware.CorsMiddleware',
@@ -66,11 +70,17 @@ WSGI_APPLICATION = "uebax_project.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
-    }
+# Banco principal e réplicas de leitura vêm do ambiente (UEBAX_DB_URL,
+# UEBAX_DB_REPLICAS, ...; ver uebax_project/bancos.py). Sem variáveis,
+# usa SQLite em BASE_DIR/db.sqlite3.
+DATABASES = bancos.a_partir_do_ambiente(os.environ, BASE_DIR)
+DATABASE_ROUTERS = ['core.banco.RoteadorDeReplicas']
+
+# PRAGMAs aplicados a cada conexão SQLite (ver core/banco.py).
+UEBAX_SQLITE = {
+    'JOURNAL_MODE': 'WAL',
+    'SYNCHRONOUS': 'NORMAL',
+    'BUSY_TIMEOUT_MS': 5000,
 }
 
 
@@ -117,7 +127,11 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'core.autenticacao.JWTEmCache',
+    ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'core.metricas.JSONRendererMedido',
+        'rest_framework.renderers.BrowsableAPIRenderer',
     ),
 }
 
@@ -128,3 +142,134 @@ CORS_ALLOWED_ORIGINS = [
     "http://localhost:5173",
     "http://127.0.0.1:5173",
 ]
+
+# Ingestão de eventos (ver core/ingestao.py)
+# MODO 'sincrono' grava e analisa cada evento no request; 'buffer' enfileira
+# em memória e grava em lote (bulk_create) por tamanho ou por tempo.
+UEBAX_INGESTAO = {
+    'MODO': 'sincrono',
+    'TAMANHO_LOTE': 500,
+    'INTERVALO_FLUSH': 1.0,
+    'LIMITE_FILA': 10000,
+    'ESPERA_INICIAL': 1.0,
+    'ESPERA_MAXIMA': 60.0,
+}
+
+# Janela deslizante da Regra 2 (falhas de login), ver core/janelas.py.
+# Para vários workers, use 'core.janelas.JanelaEmCache' com um cache
+# compartilhado (Redis/Memcached).
+UEBAX_JANELA_FALHAS = {
+    'BACKEND': 'core.janelas.JanelaEmMemoria',
+    'JANELA_MINUTOS': 10,
+    'LIMITE': 5,
+}
+
+# Motor de regras declarativo (ver core/regras.py). Sem UEBAX_REGRAS, usa
+# core.regras.REGRAS_PADRAO. Com UEBAX_REGRAS_ARQUIVO (JSON), as regras são
+# recarregadas sem reiniciar o servidor quando o arquivo muda.
+# UEBAX_REGRAS_ARQUIVO = BASE_DIR / 'regras.json'
+
+# Cache (locmem por padrão; em produção com vários workers, aponte para
+# Redis/Memcached para que o cache e os contadores sejam compartilhados).
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "uebax",
+    }
+}
+
+# Cache do payload de /dashboard/stats/ (ver core/cache_dashboard.py).
+UEBAX_CACHE_DASHBOARD = {
+    'CACHE': 'default',
+    'TTL': 30,
+    'INTERVALO_INVALIDACAO': 5,
+}
+
+# Push em tempo real (SSE em /api/stream/, ver core/broker.py). Sirva via
+# ASGI (ex.: uvicorn uebax_project.asgi:application). Para vários
+# processos, use 'core.broker.BrokerRedis' com REDIS_URL.
+UEBAX_BROKER = {
+    'BACKEND': 'core.broker.BrokerEmMemoria',
+    'TAMANHO_FILA': 100,
+}
+
+# Pool de threads para o hash de senha nas views assíncronas e cache do
+# usuário dos requests com JWT (ver core/autenticacao.py).
+UEBAX_AUTENTICACAO = {
+    'THREADS_SENHA': 4,
+    'TTL_USUARIO': 60,
+}
+
+# Agregação de alertas (ver core/alertas.py): repetições do mesmo
+# (usuário, tipo de alerta) dentro da janela só incrementam o contador.
+UEBAX_ALERTAS = {
+    'JANELA_SUPRESSAO_MINUTOS': 60,
+}
+
+# Retenção de eventos (ver core/retencao.py e o comando arquivar_eventos).
+UEBAX_RETENCAO = {
+    'DIAS': 90,
+    'DIRETORIO': BASE_DIR / 'arquivo',
+}
+
+# Métricas Prometheus em /metrics/ (ver core/metricas.py). Requisições mais
+# lentas que LIMITE_LENTO_MS vão para o log "core.metricas" com o SQL.
+# Sem UEBAX_METRICAS_TOKEN, /metrics/ só responde a usuários staff.
+UEBAX_METRICAS = {
+    'LIMITE_LENTO_MS': 500,
+    'TOKEN': os.environ.get('UEBAX_METRICAS_TOKEN') or None,
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'core.metricas': {'handlers': ['console'], 'level': 'WARNING', 'propagate': False},
+    },
+}
+
+# Limite de tentativas de login por e-mail e IP (token bucket, ver
+# core/limitacao.py). Com vários workers, use 'core.limitacao.BaldeEmCache'.
+UEBAX_LIMITE_LOGIN = {
+    'BACKEND': 'core.limitacao.BaldeEmMemoria',
+    'CAPACIDADE_EMAIL': 5,
+    'TAXA_EMAIL': 1,
+    'CAPACIDADE_IP': 20,
+    'TAXA_IP': 10,
+}
+
+# E-mails saem por uma fila com envio em lote numa thread de fundo
+# (ver core/caixa_saida.py); o EMAIL_BACKEND continua valendo.
+UEBAX_CAIXA_SAIDA = {
+    'MODO': 'fila',
+    'TAMANHO_LOTE': 50,
+    'INTERVALO_ENVIO': 2.0,
+}
+
+# Filtro de Bloom na frente da lista negra de tokens (ver
+# core/lista_negra.py). Agende "manage.py limpar_tokens" para apagar os
+# tokens expirados.
+UEBAX_LISTA_NEGRA = {
+    'CAPACIDADE': 100000,
+    'TAXA_FALSO_POSITIVO': 0.01,
+    'SINCRONIZAR_SEGUNDOS': 5,
+}
+
+# Ingestão em massa de agentes externos: POST /api/events/ingest/ (JSON ou
+# NDJSON) e o comando coletar_eventos (ver core/coleta.py).
+UEBAX_COLETA = {
+    'MAXIMO_POR_REQUISICAO': 50000,
+    'TAMANHO_LOTE': 5000,
+}
+
+# Coletor de logs de autenticação (manage.py coletar_eventos; ver
+# core/coletor.py). DOMINIO_PADRAO completa usuários do sshd sem "@".
+UEBAX_COLETOR = {
+    'TAMANHO_FILA': 10000,
+    'TAMANHO_LOTE': 2000,
+    'ARQUIVO_ESTADO': os.path.join(BASE_DIR, 'coletor-estado.json'),
+    'DOMINIO_PADRAO': '',
+}
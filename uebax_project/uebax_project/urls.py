@@ -1,7 +1,10 @@
 from django.contrib import admin
 from django.urls import path, include 
 
+from core.metricas import metricas_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('core.urls')), 
+    path('metrics/', metricas_view, name='metrics'),
 ]
@@ -57,4 +57,47 @@ export const apiFetch = async (endpoint, options = {}) => {
         // Erro de rede (CORS, backend desligado) ou o erro que lançámos
         throw err;
     }
-};
\ No newline at end of file
+};
+
+/**
+ * Abre o canal de push em tempo real (Server-Sent Events).
+ * O EventSource não envia cabeçalhos, então a URL leva um ticket de curta
+ * duração (POST /stream/ticket/), nunca o access token. Se a conexão cair
+ * (ex.: ticket expirado), um novo ticket é pedido.
+ * Resolve para null se o backend não oferece push (servidor WSGI): quem
+ * chama deve então consultar a API periodicamente. Senão, resolve para um
+ * objeto com .close(), que quem chama deve usar ao terminar.
+ */
+export const abrirStream = async (canais, aoReceber) => {
+    let fonte = null;
+    let fechado = false;
+    let reconexao = null;
+
+    const conectar = async () => {
+        const { ticket } = await apiFetch('/stream/ticket/', { method: 'POST' });
+        if (fechado) return;
+        const params = new URLSearchParams({ canais: canais.join(','), ticket });
+        fonte = new EventSource(`${API_URL}/stream/?${params.toString()}`);
+        canais.forEach((canal) => {
+            fonte.addEventListener(canal, (mensagem) => aoReceber(canal, JSON.parse(mensagem.data)));
+        });
+        fonte.onerror = () => {
+            if (fonte.readyState === EventSource.CLOSED && !fechado) {
+                reconexao = setTimeout(() => conectar().catch(() => {}), 5000);
+            }
+        };
+    };
+
+    try {
+        await conectar();
+    } catch (err) {
+        return null;
+    }
+    return {
+        close: () => {
+            fechado = true;
+            clearTimeout(reconexao);
+            if (fonte) fonte.close();
+        },
+    };
+};